@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    bench
+    ~~~~~
+
+    Performance benchmarks for the compiler pipeline. Each benchmark is
+    a setup function registered with the `benchmark` decorator. It is
+    called once per input size and returns a zero-argument function to
+    time, plus the number of units (characters, instructions, ...) that
+    one call processes.
+
+    Results are plain dicts that can be written to JSON and compared
+    against a stored baseline. Run the suite with `python -m bench`.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import fnmatch
+import importlib
+import os
+import pkgutil
+import platform
+import sys
+import time
+
+Benchmarks = []
+""" Registered benchmarks, as (name, setup, sizes, unit) tuples.  """
+
+Default_sizes = (10, 100, 1000, 10000)
+""" Input sizes used when a benchmark does not give its own.  """
+
+def benchmark(name, sizes=Default_sizes, unit='op'):
+    """
+    Decorator: register a setup function as the benchmark `name`. The
+    function is called as `setup(size)` for each of `sizes`, and must
+    return a pair `(run, count)`.
+    """
+    def register(setup):
+        Benchmarks.append((name, setup, tuple(sizes), unit))
+        return setup
+    return register
+
+def load_all():
+    """
+    Import every benchmark module in this package, so that its
+    benchmarks are registered.
+    """
+    path = os.path.dirname(os.path.abspath(__file__))
+    for finder, module, ispkg in pkgutil.iter_modules([path]):
+        if not ispkg and not module.startswith('_'):
+            importlib.import_module(__name__ + '.' + module)
+
+def time_it(run, min_time=0.2, repeat=3):
+    """
+    Return the best time, in seconds, for one call of `run`. The number
+    of calls per measurement grows until a measurement takes at least
+    `min_time` seconds, and the best of `repeat` measurements is kept.
+    """
+    clock = time.perf_counter
+    number = 1
+    while True:
+        start = clock()
+        for i in range(number):
+            run()
+        elapsed = clock() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed * 10 > min_time else 10
+    best = elapsed
+    for i in range(repeat - 1):
+        start = clock()
+        for i in range(number):
+            run()
+        best = min(best, clock() - start)
+    return best / number
+
+def run_benchmarks(pattern='*', min_time=0.2, max_size=None, report=None):
+    """
+    Run the registered benchmarks whose "name/size" key matches the glob
+    `pattern`. Return a results dict. If `report` is given, it is called
+    with (key, result) as each measurement finishes.
+    """
+    results = {}
+    for name, setup, sizes, unit in Benchmarks:
+        for size in sizes:
+            if max_size is not None and size > max_size:
+                continue
+            key = '%s/%d' % (name, size)
+            if not fnmatch.fnmatch(key, pattern):
+                continue
+            run, count = setup(size)
+            seconds = time_it(run, min_time=min_time)
+            result = {
+                'seconds': seconds,
+                'count': count,
+                'unit': unit,
+                'per_unit': seconds / count if count else None,
+            }
+            results[key] = result
+            if report is not None:
+                report(key, result)
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+def compare(results, baseline, threshold=0.10):
+    """
+    Compare two results dicts. Return a list of (key, baseline seconds,
+    new seconds, ratio, regressed) tuples for the keys present in both,
+    where `regressed` is true if the new time is more than `threshold`
+    (a fraction) slower.
+    """
+    rows = []
+    old_results = baseline.get('results', {})
+    for key in sorted(results.get('results', {})):
+        if key not in old_results:
+            continue
+        old = old_results[key]['seconds']
+        new = results['results'][key]['seconds']
+        ratio = new / old if old else float('inf')
+        rows.append((key, old, new, ratio, ratio > 1.0 + threshold))
+    return rows
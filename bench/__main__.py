@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    bench.__main__
+    ~~~~~~~~~~~~~~
+
+    Command-line driver for the benchmark suite:
+
+        python -m bench [-k PATTERN] [-o results.json]
+                        [--baseline FILE] [--save-baseline]
+                        [--threshold 0.10] [--quick]
+
+    Exits with status 1 if any benchmark is slower than the baseline by
+    more than the threshold.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import argparse
+import json
+import os
+import sys
+
+import bench
+
+Baseline_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    'baseline.json')
+""" Default location of the stored baseline results.  """
+
+def format_seconds(seconds):
+    for scale, suffix in ((1.0, 's'), (1e-3, 'ms'), (1e-6, 'us')):
+        if seconds >= scale:
+            return '%.3f%s' % (seconds / scale, suffix)
+    return '%.1fns' % (seconds / 1e-9)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench',
+        description="Run the compiler pipeline benchmarks.")
+    parser.add_argument('-k', '--pattern', default='*',
+        help="only run benchmarks whose name/size matches this glob")
+    parser.add_argument('-o', '--output',
+        help="write the results to this JSON file")
+    parser.add_argument('--baseline', default=Baseline_file,
+        help="JSON results to compare against (default: %(default)s)")
+    parser.add_argument('--save-baseline', action='store_true',
+        help="store these results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=0.10,
+        help="fraction slower than the baseline that counts as a "
+            "regression (default: %(default)s)")
+    parser.add_argument('--quick', action='store_true',
+        help="shorter timings and only the smaller sizes")
+    args = parser.parse_args(argv)
+
+    bench.load_all()
+
+    def report(key, result):
+        per_unit = ''
+        if result['per_unit'] is not None:
+            per_unit = '%s/%s' % (format_seconds(result['per_unit']),
+                result['unit'])
+        print('%-40s %12s %16s' % (key, format_seconds(result['seconds']),
+            per_unit))
+        sys.stdout.flush()
+
+    results = bench.run_benchmarks(args.pattern,
+        min_time=0.05 if args.quick else 0.2,
+        max_size=1000 if args.quick else None, report=report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows = bench.compare(results, baseline, args.threshold)
+    regressions = [row for row in rows if row[4]]
+    print()
+    for key, old, new, ratio, regressed in rows:
+        print('%-40s %12s -> %-12s %6.2fx%s' % (key, format_seconds(old),
+            format_seconds(new), ratio, '  REGRESSION' if regressed else ''))
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    bench.backends
+    ~~~~~~~~~~~~~~
+
+    Compares the ch04.expr2 backends: how long each takes to turn a
+    compiled CodeObject into a function, and how fast the function it
+    produces runs. For the source backend, startup is also measured cold
+    (nothing cached) and warm (the module and its `.pyc` are on disk,
+    as for a new process). Sizes are numbers of assignment statements.
+
+    The `codeobject` benchmarks measure the CodeObject's own
+    instructions, the baseline the ast backend replaces: built by the
+    bytecode backend where CPython can run them, before Python 3.6, and
+    by the vm backend from 3.6, where only `ch04.vm` can.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import shutil
+import tempfile
+
+from bench import benchmark, corpus
+from ch04 import bytecode, expr2, pysource
+
+def _register(backend_name, build):
+    @benchmark('backends.%s.compile' % backend_name, unit='stmt')
+    def bench_compile(size):
+        co = corpus.compile_program(corpus.assignments(size))
+        def run():
+            co.co_code = co.co_code
+            build(co, {})
+        return run, size
+
+    @benchmark('backends.%s.execute' % backend_name, unit='stmt')
+    def bench_execute(size):
+        co = corpus.compile_program(corpus.assignments(size))
+        return build(co, {}), size
+
+for backend_name in sorted(expr2.Backends):
+    if backend_name != 'bytecode':
+        _register(backend_name, expr2.Backends[backend_name])
+
+# CPython runs the bytecode only before 3.6 (see bytecode.Wordcode).
+_register('codeobject',
+    expr2.Backends['vm' if bytecode.Wordcode else 'bytecode'])
+
+def _source_startup(size, cold):
+    co = corpus.compile_program(corpus.assignments(size))
+    cache_dir = tempfile.mkdtemp(prefix='lbac-bench-')
+    def run():
+        if cold:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        pysource._Loaded.clear()
+        pysource.to_function(co, {}, cache_dir=cache_dir)
+    run()
+    return run, size
+
+@benchmark('backends.source.cold', unit='stmt')
+def bench_source_cold(size):
+    return _source_startup(size, cold=True)
+
+@benchmark('backends.source.warm', unit='stmt')
+def bench_source_warm(size):
+    return _source_startup(size, cold=False)
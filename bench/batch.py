@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    bench.batch
+    ~~~~~~~~~~~
+
+    Rows per second for evaluating one program over columns of inputs:
+    in batch with NumPy (when installed), in batch with Python lists,
+    and by calling the compiled function once per row. Sizes are
+    numbers of rows.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import random
+
+from bench import benchmark, corpus
+from ch04 import astgen, batch
+
+Program = 'a=X*3+Y;b=a/(Y*Y+1);zb-X*2'
+""" The program evaluated; X and Y are the input columns.  """
+
+def _columns(size):
+    rng = random.Random(0)
+    return {
+        'X': [rng.randint(-1000, 1000) for i in range(size)],
+        'Y': [rng.randint(-1000, 1000) for i in range(size)],
+    }
+
+def _batch(size, use_numpy):
+    co = corpus.compile_program(Program)
+    columns = _columns(size)
+    def run():
+        batch.evaluate(co, columns, use_numpy=use_numpy)
+    return run, size
+
+@benchmark('batch.lists', unit='row')
+def bench_lists(size):
+    return _batch(size, use_numpy=False)
+
+if batch.numpy is not None:
+    @benchmark('batch.numpy', unit='row')
+    def bench_numpy(size):
+        return _batch(size, use_numpy=True)
+
+@benchmark('batch.per_call', unit='row')
+def bench_per_call(size):
+    co = corpus.compile_program(Program)
+    globs = {}
+    fn = astgen.to_function(co, globs)
+    columns = _columns(size)
+    rows = list(zip(columns['X'], columns['Y']))
+    def run():
+        for globs['X'], globs['Y'] in rows:
+            fn()
+    return run, size
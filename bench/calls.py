@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    bench.calls
+    ~~~~~~~~~~~
+
+    Overhead of a function call in a compiled program, by number of
+    arguments. Each program makes 100 calls to a global function that
+    does nothing, passing it the given number of arguments (the first
+    half positional, the rest by keyword). It is run by the stack VM and
+    natively (built by the ast backend). Sizes are argument counts.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+from bench import benchmark, corpus
+from ch04 import astgen, vm
+
+Calls = 100
+""" Calls made by each program.  """
+
+Sizes = (0, 1, 2, 5, 10)
+
+def _keywords(*args, **kwargs):
+    return 0
+
+def call_program(nargs, calls=Calls):
+    """
+    Return the text of a program that calls `F` `calls` times with
+    `nargs` arguments each time.
+    """
+    npos = (nargs + 1) // 2
+    args = [str(i % 10) for i in range(npos)]
+    # Keyword names are single letters, and 'z' is taken.
+    args.extend('%s=%d' % (chr(ord('a') + i), i % 10)
+        for i in range(nargs - npos))
+    call = 'F(%s)' % ','.join(args)
+    return ''.join('x=%s;' % call for i in range(calls)) + 'zx'
+
+def _setup(nargs, build):
+    co = corpus.compile_program(call_program(nargs))
+    return build(co, {'F': _keywords}), Calls
+
+@benchmark('calls.vm', sizes=Sizes, unit='call')
+def bench_vm(size):
+    return _setup(size, vm.to_function)
+
+@benchmark('calls.native', sizes=Sizes, unit='call')
+def bench_native(size):
+    return _setup(size, astgen.to_function)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    bench.constants
+    ~~~~~~~~~~~~~~~
+
+    Reading globals that never change: with LOAD_GLOBAL, or bound to
+    hidden parameters when the function is made (`expr2.compile` with
+    `constants`). The language has no loops yet, so a long run of
+    statements that each read three globals stands in for a hot loop.
+    Programs are built by the ast backend. Sizes are numbers of
+    statements; counts are global reads.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+from bench import benchmark, corpus
+from ch04 import astgen
+
+Globals = {'K': 3, 'L': 4, 'C': 1}
+
+def global_reads(statements):
+    """
+    Return the source of a program of `statements` assignments, each of
+    which reads the globals K, L and C once.
+    """
+    parts = ['a=1']
+    for i in range(1, statements):
+        parts.append('%s=%s*K/L+C' % ('ab'[i % 2], 'ab'[(i - 1) % 2]))
+    return ';'.join(parts) + ';za'
+
+def _setup(size, constants):
+    co = corpus.compile_program(global_reads(size), constants=constants)
+    return astgen.to_function(co, dict(Globals)), 3 * (size - 1)
+
+@benchmark('constants.globals', unit='read')
+def bench_globals(size):
+    return _setup(size, ())
+
+@benchmark('constants.bound', unit='read')
+def bench_bound(size):
+    return _setup(size, sorted(Globals))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    bench.corpus
+    ~~~~~~~~~~~~
+
+    Synthetic source programs for the benchmarks. Programs are generated
+    from a fixed seed, so every run measures the same input.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import io
+import random
+
+from ch04 import expr2
+
+Locals = 'abcdefghijklmnopqrstuvwxy'
+""" Variable names available to generated programs ('z' is a keyword).  """
+
+def assignments(statements, seed=0):
+    """
+    Return the source of a ch04.expr2 program made of `statements`
+    assignments followed by a return. Each assignment scales an earlier
+    variable by a fraction no greater than one and adds a digit, so the
+    values stay small however long the program is.
+    """
+    rng = random.Random(seed)
+    parts = ['a=1']
+    defined = ['a']
+    for i in range(1, statements):
+        target = rng.choice(Locals)
+        source = rng.choice(defined)
+        divisor = rng.randint(1, 9)
+        parts.append('%s=%s*%d/%d+%d' % (target, source,
+            rng.randint(1, divisor), divisor, rng.randint(0, 9)))
+        if target not in defined:
+            defined.append(target)
+    parts.append('z' + rng.choice(defined))
+    return ';'.join(parts)
+
+def compile_program(text, **options):
+    """
+    Compile `text` with ch04.expr2, passing `options` to its `compile`,
+    and return the CodeObject.
+    """
+    expr2.init(inp=io.StringIO(text))
+    return expr2.compile(**options)
+
+def repetitive(statements, seed=0):
+    """
+    Return the source of a ch04.expr2 program of `statements`
+    assignments that keep reusing a small pool of sub-expressions, as
+    generated rule programs do. Every tenth statement reassigns one of
+    the pool's inputs, so the pool's values change over the program.
+    """
+    rng = random.Random(seed)
+    inputs = 'abcde'
+    pool = ['(%s*%d/%d+%s)' % (rng.choice(inputs), rng.randint(1, 3),
+        rng.randint(3, 9), rng.choice(inputs)) for i in range(6)]
+    parts = ['%s=%d' % (name, i + 1) for i, name in enumerate(inputs)]
+    targets = 'fghijklmnopqrstuvwxy'
+    for i in range(1, statements):
+        if i % 10 == 0:
+            target = rng.choice(inputs)
+        else:
+            target = rng.choice(targets)
+        terms = rng.sample(pool, 3)
+        parts.append('%s=(%s+%s-%s)/9' % (target, terms[0], terms[1],
+            terms[2]))
+    parts.append('z' + rng.choice(pool))
+    return ';'.join(parts)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    bench.cse
+    ~~~~~~~~~
+
+    Effect of common subexpression elimination on a program that keeps
+    reusing the same sub-expressions. `cse.pass` times the pass itself;
+    `cse.plain` and `cse.optimized` time the program without and with
+    it. Sizes are numbers of statements. Run this module directly
+    (`python -m bench.cse`) to print the instruction counts.
+
+    The programs are run through the ast backend, which works on any
+    interpreter.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+from bench import benchmark, corpus
+from ch04 import astgen, cse
+
+@benchmark('cse.pass', unit='instr')
+def bench_pass(size):
+    co = corpus.compile_program(corpus.repetitive(size))
+    def run():
+        cse.optimize(co)
+    return run, len(co._appended_ops)
+
+@benchmark('cse.plain', unit='stmt')
+def bench_plain(size):
+    co = corpus.compile_program(corpus.repetitive(size))
+    return astgen.to_function(co), size
+
+@benchmark('cse.optimized', unit='stmt')
+def bench_optimized(size):
+    co = cse.optimize(corpus.compile_program(corpus.repetitive(size)))
+    return astgen.to_function(co), size
+
+if __name__ == '__main__':
+    for size in (10, 100, 1000):
+        co = corpus.compile_program(corpus.repetitive(size))
+        optimized = cse.optimize(co)
+        print("%6d statements: %7d instructions, %7d after CSE" % (size,
+            len(co._appended_ops), len(optimized._appended_ops)))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    bench.lexer
+    ~~~~~~~~~~~
+
+    Cost of recognizing keywords in the chapter 7 scanner, with each of
+    its keyword strategies, on input that is mostly names: `names(n)`
+    makes n names, one in eight of them a keyword, and the rest
+    identifiers that are often one character away from a keyword. The
+    'lexer.lookup' benchmarks time the keyword lookup alone, over the
+    names; the 'lexer.scan' benchmarks time scanning them as text.
+    Sizes are name counts; counts are lookups or tokens.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import io
+import random
+
+from bench import benchmark
+from ch07 import lexer
+
+Sizes = (100, 1000, 10000)
+
+Identifiers = ('i', 'x', 'n', 'count', 'total', 'index', 'iff', 'done',
+    'format', 'breaks', 'dot', 'elsewhere', 'result', 'whilst', 'fore',
+    'switched', 'value', 'left', 'right', 'node')
+""" Identifiers the names are drawn from.  """
+
+def names(count, seed=7):
+    """
+    Return a list of `count` names, one in eight a keyword and the rest
+    from `Identifiers`, in a shuffled order that is the same each time.
+    """
+    rng = random.Random(seed)
+    keywords = sorted(lexer.Keywords)
+    result = []
+    for i in range(count):
+        pool = keywords if i % 8 == 0 else Identifiers
+        # Copy each name, as the scanner builds a new string for each.
+        result.append(''.join(list(rng.choice(pool))))
+    rng.shuffle(result)
+    return result
+
+def _register(strategy):
+    @benchmark('lexer.lookup.%s' % strategy, sizes=Sizes, unit='lookup')
+    def bench_lookup(size):
+        lookup = lexer.Keyword_lookups[strategy]
+        words = names(size)
+        def run():
+            for word in words:
+                lookup(word)
+        return run, size
+
+    @benchmark('lexer.scan.%s' % strategy, sizes=Sizes, unit='token')
+    def bench_scan(size):
+        text = ' '.join(names(size))
+        def run():
+            lexer.init(inp=io.StringIO(text), err=io.StringIO(),
+                keywords=strategy)
+            lexer.tokens()
+        return run, size
+
+for strategy in lexer.Keyword_strategies:
+    _register(strategy)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    bench.logical
+    ~~~~~~~~~~~~~
+
+    Logical expressions in chapter 6 programs, compiled with short
+    circuits (conditions as jumps) and naively (as values, with
+    BINARY_AND and BINARY_OR). Each program in `Programs` is run by the
+    stack VM for every combination of the arguments in `Arguments`.
+    The benchmarks time one run; sizes are unused.
+
+    Run as a script to print, for each program, its instructions and
+    the instructions run over all the arguments, both ways:
+
+        python -m bench.logical
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import io
+import itertools
+
+from bench import benchmark
+from ch04 import vm
+from ch06 import logical
+
+Programs = {
+    'and': 'ia<e&e<g{z1};z0',
+    'or': 'ia<e|e<g{z1};z0',
+    'mixed': 'i(a<e|!g)&a#2{z1};z0',
+    'chain': 'ia<e<g{z1};z0',
+    'value': 'za<e&e<g|a=g',
+    'while': 't=0;wa<e&(g|t<2){a=a+1;t=t+1};zt',
+}
+""" Source of each program, whose parameters are a, e and g.  """
+
+Arguments = list(itertools.product(range(3), repeat=3))
+""" Argument values each program is run with.  """
+
+def compile_program(name, short_circuit=True):
+    """
+    Compile the program in `Programs` called `name`. Return its
+    CodeObject.
+    """
+    logical.init(inp=io.StringIO(Programs[name]), err=io.StringIO())
+    return logical.compile(params=['a', 'e', 'g'],
+        short_circuit=short_circuit)
+
+def executed(co, args):
+    """
+    Run CodeObject `co` in the VM with `args`. Return the number of
+    instructions it runs.
+    """
+    program = vm.Program(co)
+    count = [0]
+    def counted(handler):
+        def run(frame, arg):
+            count[0] += 1
+            return handler(frame, arg)
+        return run
+    program.code = [(counted(handler), arg)
+        for handler, arg in program.code]
+    program.run(args=args)
+    return count[0]
+
+def instruction_counts():
+    """
+    Return a list of (name, short-circuit size, naive size,
+    short-circuit instructions run, naive instructions run) tuples, one
+    for each program in `Programs`.
+    """
+    rows = []
+    for name in sorted(Programs):
+        short = compile_program(name)
+        naive = compile_program(name, short_circuit=False)
+        rows.append((name, len(short._appended_ops),
+            len(naive._appended_ops),
+            sum(executed(short, args) for args in Arguments),
+            sum(executed(naive, args) for args in Arguments)))
+    return rows
+
+def _setup(name, short_circuit):
+    fn = vm.to_function(compile_program(name, short_circuit))
+    def run():
+        for args in Arguments:
+            fn(*args)
+    return run, len(Arguments)
+
+def _register(name):
+    @benchmark('logical.%s.short' % name, sizes=(1, ), unit='run')
+    def bench_short(size):
+        return _setup(name, True)
+    @benchmark('logical.%s.naive' % name, sizes=(1, ), unit='run')
+    def bench_naive(size):
+        return _setup(name, False)
+
+for name in sorted(Programs):
+    _register(name)
+
+def main():
+    print('%-8s %8s %8s %10s %10s' % ('program', 'size', 'naive', 'run',
+        'naive'))
+    for row in instruction_counts():
+        print('%-8s %8d %8d %10d %10d' % row)
+
+if __name__ == '__main__':
+    main()
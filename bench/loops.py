@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    bench.loops
+    ~~~~~~~~~~~
+
+    Cost of one loop iteration in a chapter 5 program: a 'for' loop and
+    a 'while' loop that each sum the numbers 1 to n, run by the stack
+    VM, against the same loops written in Python. Sizes are values of
+    n; counts are iterations.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import io
+
+from bench import benchmark
+from ch05 import statements
+
+Sizes = (10, 100, 1000)
+
+Programs = {
+    'for': 't=0;fk=1,n{t=t+k};zt',
+    'while': 't=0;wn{t=t+n;n=n-1};zt',
+}
+""" Source of each loop, with its limit in parameter `n`.  """
+
+def native_for(n):
+    s = 0
+    for k in range(1, n + 1):
+        s = s + k
+    return s
+
+def native_while(n):
+    s = 0
+    while n:
+        s = s + n
+        n = n - 1
+    return s
+
+def compile_loop(kind):
+    """
+    Compile the program in `Programs` for loop `kind`. Return a function
+    run by the VM, taking `n` as its argument.
+    """
+    statements.init(inp=io.StringIO(Programs[kind]), err=io.StringIO())
+    return statements.compile_function(params=['n'])
+
+def _setup(size, fn):
+    return (lambda: fn(size)), size
+
+@benchmark('loops.vm_for', sizes=Sizes, unit='iteration')
+def bench_vm_for(size):
+    return _setup(size, compile_loop('for'))
+
+@benchmark('loops.native_for', sizes=Sizes, unit='iteration')
+def bench_native_for(size):
+    return _setup(size, native_for)
+
+@benchmark('loops.vm_while', sizes=Sizes, unit='iteration')
+def bench_vm_while(size):
+    return _setup(size, compile_loop('while'))
+
+@benchmark('loops.native_while', sizes=Sizes, unit='iteration')
+def bench_native_while(size):
+    return _setup(size, native_while)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    bench.params
+    ~~~~~~~~~~~~
+
+    Evaluating one program over many inputs: by storing each input in
+    the globals the program reads, or by passing it as arguments to a
+    program compiled with parameters. Programs are built by the ast
+    backend. Sizes are numbers of evaluations.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import random
+
+from bench import benchmark, corpus
+from ch04 import astgen
+
+Sizes = (1000, 10000)
+
+def _rows(size):
+    rng = random.Random(0)
+    return [(rng.randint(1, 9), rng.randint(1, 9), rng.randint(1, 9))
+        for i in range(size)]
+
+@benchmark('params.globals', sizes=Sizes, unit='call')
+def bench_globals(size):
+    co = corpus.compile_program('x=A*B;zx+C*(x-A)')
+    globs = {}
+    fn = astgen.to_function(co, globs)
+    rows = _rows(size)
+    def run():
+        for a, b, c in rows:
+            globs['A'] = a
+            globs['B'] = b
+            globs['C'] = c
+            fn()
+    return run, size
+
+@benchmark('params.args', sizes=Sizes, unit='call')
+def bench_args(size):
+    co = corpus.compile_program('x=a*b;zx+c*(x-a)', infer_params=True)
+    fn = astgen.to_function(co)
+    rows = _rows(size)
+    def run():
+        for a, b, c in rows:
+            fn(a, b, c)
+    return run, size
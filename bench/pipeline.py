@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    bench.pipeline
+    ~~~~~~~~~~~~~~
+
+    Benchmarks for each phase of the ch04.expr2 compiler: reading input,
+    parsing, emitting instructions, building the code object, decoding
+    it again, and running the generated function. Sizes are numbers of
+    assignment statements in the program. Building and running the code
+    object are only measured where CPython can run its instructions,
+    before Python 3.6.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import io
+
+from bench import benchmark, corpus
+from ch04 import bytecode, expr2
+
+@benchmark('pipeline.lex', unit='char')
+def bench_lex(size):
+    text = corpus.assignments(size)
+    def run():
+        expr2.init(inp=io.StringIO(text))
+        get_char = expr2.get_char
+        while expr2.Peek is not None:
+            get_char()
+    return run, len(text)
+
+@benchmark('pipeline.parse', unit='stmt')
+def bench_parse(size):
+    text = corpus.assignments(size)
+    def run():
+        expr2.init(inp=io.StringIO(text))
+        expr2.compile()
+    return run, size
+
+@benchmark('pipeline.emit', unit='instr')
+def bench_emit(size):
+    ops = [(opname, arg) for opname, opnum, arg
+        in corpus.compile_program(corpus.assignments(size))._appended_ops]
+    def run():
+        co = bytecode.CodeObject()
+        append = co.append
+        for opname, arg in ops:
+            append(opname, arg)
+    return run, len(ops)
+
+def bench_finalise(size):
+    co = corpus.compile_program(corpus.assignments(size))
+    def run():
+        # Reassigning co_code drops the cached bytes, so each run pays
+        # for the copy as a fresh compile would.
+        co.co_code = co.co_code
+        co.compile()
+    return run, len(co._appended_ops)
+
+@benchmark('pipeline.decode', unit='instr')
+def bench_decode(size):
+    co = corpus.compile_program(corpus.assignments(size))
+    def run():
+        for instruction in co.instructions():
+            pass
+    return run, len(co._appended_ops)
+
+def bench_execute(size):
+    co = corpus.compile_program(corpus.assignments(size))
+    fn = co.to_function(globs={})
+    return fn, len(co._appended_ops)
+
+# CPython runs the bytecode only before 3.6 (see bytecode.Wordcode).
+if not bytecode.Wordcode:
+    benchmark('pipeline.finalise', unit='instr')(bench_finalise)
+    benchmark('pipeline.execute', unit='instr')(bench_execute)
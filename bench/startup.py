@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    bench.startup
+    ~~~~~~~~~~~~~
+
+    Start-up time of the compiler: how long a fresh interpreter takes to
+    import it. Compiler runs are short, so this is often most of their
+    time. Import times are read from `python -X importtime` (Python 3.7
+    and later), or measured with a clock around the import on older
+    interpreters.
+
+    Run as a script to check the import times against `Budgets`:
+
+        python -m bench.startup
+
+    It exits with status 1 if any module takes longer than its budget.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import os
+import subprocess
+import sys
+
+from bench import benchmark
+
+Budgets = {
+    'ch04.expr2': 25000,
+}
+""" Most microseconds a fresh import of each module may take.  """
+
+Lazy_modules = ('pdb', 'inspect', 'difflib', 're', 'tempfile', 'hashlib',
+    'ast')
+""" Modules the compiler must not import until they are needed.  """
+
+_Root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _run_python(args):
+    """
+    Run a fresh interpreter with `args`, from the top of the source
+    tree. Return its (stdout, stderr) as strings.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = _Root
+    proc = subprocess.Popen([sys.executable] + args, cwd=_Root, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    out, err = proc.communicate()
+    if proc.returncode:
+        raise RuntimeError("Python failed with status %d:\n%s"
+            % (proc.returncode, err))
+    return out, err
+
+def parse_importtime(text):
+    """
+    Parse the report written by `python -X importtime`. Return a dict
+    mapping module names to (self, cumulative) times in microseconds.
+    """
+    times = {}
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            self_us, cumulative = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue        # The column headings.
+        times[fields[2].strip()] = (self_us, cumulative)
+    return times
+
+def import_time(module):
+    """
+    Return the microseconds a fresh interpreter takes to import
+    `module`, including the modules it imports.
+    """
+    if sys.version_info >= (3, 7):
+        out, err = _run_python(['-X', 'importtime', '-c',
+            'import ' + module])
+        return parse_importtime(err)[module][1]
+    out, err = _run_python(['-c',
+        'import time; start = time.perf_counter(); import %s; '
+        'print(int((time.perf_counter() - start) * 1e6))' % module])
+    return int(out)
+
+def imported_modules(module):
+    """
+    Return the set of modules that importing `module` in a fresh
+    interpreter adds to `sys.modules`.
+    """
+    out, err = _run_python(['-c',
+        'import sys; before = set(sys.modules); import %s; '
+        'print("\\n".join(set(sys.modules) - before))' % module])
+    return set(out.split())
+
+def check(budgets=None, repeat=5):
+    """
+    Measure the import time of each module in `budgets` (by default,
+    `Budgets`), taking the best of `repeat` runs. Return a list of
+    (module, microseconds, budget, over) tuples.
+    """
+    if budgets is None:
+        budgets = Budgets
+    rows = []
+    for module in sorted(budgets):
+        best = min(import_time(module) for i in range(repeat))
+        rows.append((module, best, budgets[module], best > budgets[module]))
+    return rows
+
+@benchmark('startup.python', sizes=(1, ), unit='process')
+def bench_python(size):
+    def run():
+        _run_python(['-c', 'pass'])
+    return run, size
+
+@benchmark('startup.expr2', sizes=(1, ), unit='process')
+def bench_expr2(size):
+    def run():
+        _run_python(['-c', 'import ch04.expr2'])
+    return run, size
+
+def main():
+    status = 0
+    for module, us, budget, over in check():
+        print('%-20s %8dus  budget %8dus  %s' % (module, us, budget,
+            'OVER' if over else 'ok'))
+        if over:
+            status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    bench.switch
+    ~~~~~~~~~~~~
+
+    Cost of finding the case of a chapter 5 switch, by number of cases.
+    Each program switches on its parameter over the dense cases 0 to
+    n-1, and is run by the stack VM once for each of `Probes` values
+    spread over the cases. The switch is compiled as the compiler
+    chooses (a jump table, for these cases), as a binary search, and as
+    a chain of compares. Sizes are case counts; counts are switches
+    run.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import io
+
+from bench import benchmark
+from ch05 import statements
+
+Sizes = (2, 16, 256, 4096)
+
+Probes = 16
+""" Values each program is run with.  """
+
+def switch_program(cases):
+    """
+    Return the text of a program that switches on `n` over the cases 0
+    to `cases` - 1.
+    """
+    return 'sn{%sl{r=0}};zr' % ''.join('%d{r=%d}' % (value, value % 10)
+        for value in range(cases))
+
+def _setup(size, switch):
+    statements.init(inp=io.StringIO(switch_program(size)),
+        err=io.StringIO())
+    fn = statements.compile_function(params=['n'], switch=switch)
+    values = [size * i // Probes for i in range(Probes)]
+    def run():
+        for value in values:
+            fn(value)
+    return run, Probes
+
+@benchmark('switch.auto', sizes=Sizes, unit='switch')
+def bench_auto(size):
+    return _setup(size, None)
+
+@benchmark('switch.search', sizes=Sizes, unit='switch')
+def bench_search(size):
+    return _setup(size, 'search')
+
+@benchmark('switch.linear', sizes=Sizes, unit='switch')
+def bench_linear(size):
+    return _setup(size, 'linear')
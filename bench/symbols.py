@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    bench.symbols
+    ~~~~~~~~~~~~~
+
+    Cost of finding names in deeply nested scopes: the chapter 8
+    SymbolTable, with its dict of binding stacks, against `ScopeChain`,
+    a list of one dict per scope that a lookup searches from the
+    innermost scope outward.
+
+    Sizes are scope depths. The 'symbols.nest' benchmarks open that many
+    scopes, one inside the other, each declaring `Per_scope` names (some
+    hiding names of outer scopes) and then looking up names of its own,
+    of the outermost scope and globals; then they leave all the scopes.
+    The 'symbols.lookup' benchmarks look up every name, and as many
+    globals, from inside all the scopes. Counts are lookups.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+from bench import benchmark
+from ch08.symbols import SymbolTable
+
+Sizes = (10, 100, 1000)
+
+Per_scope = 8
+""" Names each scope declares.  """
+
+class ScopeChain:
+    """
+    Nested scopes as a list of dicts from name to slot, innermost last,
+    with the interface of SymbolTable that the benchmarks use. A lookup
+    searches the dicts from the innermost outward.
+    """
+
+    def __init__(self):
+        self.scopes = [{}]
+        self.varnames = []
+
+    def enter(self):
+        self.scopes.append({})
+
+    def leave(self):
+        self.scopes.pop()
+
+    def declare(self, name):
+        slot = len(self.varnames)
+        self.varnames.append(name)
+        self.scopes[-1][name] = slot
+        return slot
+
+    def lookup(self, name):
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        return None
+
+def scope_names(depth):
+    """
+    Return the names the scope at `depth` declares. Half of them are
+    also declared by the scope above it.
+    """
+    base = depth * Per_scope // 2
+    return ['v%d' % (base + i) for i in range(Per_scope)]
+
+def nest(table, depth):
+    """
+    Open `depth` scopes in `table`, declaring and looking up names in
+    each, then leave them. Return the number of lookups.
+    """
+    lookup = table.lookup
+    outer = scope_names(0)
+    lookups = 0
+    for level in range(1, depth + 1):
+        table.enter()
+        names = scope_names(level)
+        for name in names:
+            table.declare(name)
+        for name in names:
+            lookup(name)
+        for name in outer:
+            lookup(name)
+            lookup(name.upper())
+        lookups += len(names) + 2 * len(outer)
+    for level in range(depth):
+        table.leave()
+    return lookups
+
+def _nested(table, depth):
+    for name in scope_names(0):
+        table.declare(name)
+    for level in range(1, depth + 1):
+        table.enter()
+        for name in scope_names(level):
+            table.declare(name)
+    return table
+
+def _register(kind, make):
+    @benchmark('symbols.nest.%s' % kind, sizes=Sizes, unit='lookup')
+    def bench_nest(size):
+        count = nest(_nested(make(), 0), size)
+        def run():
+            nest(_nested(make(), 0), size)
+        return run, count
+
+    @benchmark('symbols.lookup.%s' % kind, sizes=Sizes, unit='lookup')
+    def bench_lookup(size):
+        lookup = _nested(make(), size).lookup
+        names = sorted(set(name for level in range(size + 1)
+            for name in scope_names(level)))
+        names += [name.upper() for name in names]
+        def run():
+            for name in names:
+                lookup(name)
+        return run, len(names)
+
+_register('table', SymbolTable)
+_register('chain', ScopeChain)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4
+"""
+    bench.tests.bench_tests
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Specifies the behavior of the benchmark framework.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import io
+import unittest
+
+import bench
+from bench import corpus
+from ch04 import bytecode, expr2
+
+class TestBench(unittest.TestCase):
+
+    def setUp(self):
+        self.benchmarks = list(bench.Benchmarks)
+
+    def tearDown(self):
+        bench.Benchmarks[:] = self.benchmarks
+
+    def test_load_all(self):
+        bench.load_all()
+        names = set(name for name, setup, sizes, unit in bench.Benchmarks)
+        for phase in ('lex', 'parse', 'emit', 'decode'):
+            self.assertIn('pipeline.' + phase, names)
+        for phase in ('finalise', 'execute'):
+            self.assertEqual(not bytecode.Wordcode,
+                'pipeline.' + phase in names)
+        for backend_name in ('ast', 'codeobject', 'vm'):
+            self.assertIn('backends.%s.execute' % backend_name, names)
+
+    def test_run_benchmarks(self):
+        calls = []
+        @bench.benchmark('test.noop', sizes=(1, 5), unit='thing')
+        def setup(size):
+            calls.append(size)
+            return (lambda: None), size
+        results = bench.run_benchmarks('test.*', min_time=0.001)
+        self.assertEqual([1, 5], calls)
+        self.assertEqual(['test.noop/1', 'test.noop/5'],
+            sorted(results['results']))
+        result = results['results']['test.noop/5']
+        self.assertEqual(5, result['count'])
+        self.assertEqual('thing', result['unit'])
+        self.assertTrue(result['seconds'] > 0)
+
+    def test_compare(self):
+        baseline = {'results': {
+            'a/1': {'seconds': 1.0},
+            'b/1': {'seconds': 1.0},
+            'c/1': {'seconds': 1.0},
+        }}
+        results = {'results': {
+            'a/1': {'seconds': 1.05},
+            'b/1': {'seconds': 1.5},
+            'd/1': {'seconds': 1.0},
+        }}
+        rows = bench.compare(results, baseline, threshold=0.10)
+        self.assertEqual(['a/1', 'b/1'], [row[0] for row in rows])
+        self.assertEqual([False, True], [row[4] for row in rows])
+
+    def test_corpus_parses(self):
+        text = corpus.assignments(50)
+        self.assertEqual(50, text.count(';'))
+        expr2.init(inp=io.StringIO(text))
+        co = expr2.compile()
+        self.assertEqual('RETURN_VALUE', co._appended_ops[-1][0])
+
+if __name__ == '__main__':
+    unittest.main()
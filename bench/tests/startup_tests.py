@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4
+"""
+    bench.tests.startup_tests
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Specifies the behavior of the start-up benchmark, and that importing
+    the compiler stays lean.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import sys
+import unittest
+
+from bench import startup
+
+class TestStartup(unittest.TestCase):
+
+    def test_parse_importtime(self):
+        text = '\n'.join([
+            'import time: self [us] | cumulative | imported package',
+            'import time:       120 |        120 |   opcode',
+            'import time:      3641 |      12640 | ch04.expr2',
+            'unrelated line',
+        ])
+        self.assertEqual({'opcode': (120, 120),
+            'ch04.expr2': (3641, 12640)}, startup.parse_importtime(text))
+
+    def test_lazy_modules(self):
+        loaded = startup.imported_modules('ch04.expr2')
+        self.assertIn('ch04.bytecode', loaded)
+        for module in startup.Lazy_modules:
+            self.assertNotIn(module, loaded)
+
+    def test_import_time(self):
+        self.assertTrue(startup.import_time('ch04.expr2') > 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    bench.vm
+    ~~~~~~~~
+
+    Instructions per second of the ch04 stack VM, against CPython
+    running the same program natively (built by the ast backend, which
+    works on any interpreter). Sizes are numbers of assignment
+    statements; counts are instructions in the CodeObject.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+from bench import benchmark, corpus
+from ch04 import astgen, vm
+
+@benchmark('vm.decode', unit='instr')
+def bench_decode(size):
+    co = corpus.compile_program(corpus.assignments(size))
+    def run():
+        vm.Program(co)
+    return run, len(co._appended_ops)
+
+@benchmark('vm.execute', unit='instr')
+def bench_execute(size):
+    co = corpus.compile_program(corpus.assignments(size))
+    return vm.to_function(co), len(co._appended_ops)
+
+@benchmark('vm.native', unit='instr')
+def bench_native(size):
+    co = corpus.compile_program(corpus.assignments(size))
+    return astgen.to_function(co), len(co._appended_ops)
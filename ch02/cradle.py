@@ -14,7 +14,6 @@
 """
 import sys
 import io
-import pdb
 
 ##### Error handling
 
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    ch04.astgen
+    ~~~~~~~~~~~
+
+    A backend that turns a compiled program into a Python `ast` tree and
+    hands it to the built-in `compile()`. Unlike the bytecode that
+    `CodeObject` assembles by hand, this does not depend on the
+    interpreter's bytecode format, and it gets CPython's own optimiser.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import ast
+import types
+
+from . import tree
+
+_Binary_ops = {
+    '+': ast.Add,
+    '-': ast.Sub,
+    '*': ast.Mult,
+    '//': ast.FloorDiv,
+}
+
+_Unary_ops = {
+    '-': ast.USub,
+    '+': ast.UAdd,
+}
+
+def _typed_constant(value):
+    """
+    Return the `ast` node for constant `value` on Pythons without
+    `ast.Constant`, where each type of constant has a node of its own.
+    """
+    if value is None or isinstance(value, bool):
+        if hasattr(ast, 'NameConstant'):
+            return ast.NameConstant(value=value)
+        return ast.Name(id=repr(value), ctx=ast.Load())
+    elif isinstance(value, str):
+        return ast.Str(s=value)
+    elif isinstance(value, bytes):
+        return ast.Bytes(s=value)
+    return ast.Num(n=value)
+
+if hasattr(ast, 'Constant'):
+    def _constant(value):
+        return ast.Constant(value=value)
+else:
+    _constant = _typed_constant
+
+def to_expr(node):
+    """
+    Return the `ast` expression for tree `node`.
+    """
+    kind = node[0]
+    if kind == 'const':
+        return _constant(node[1])
+    elif kind == 'load':
+        return ast.Name(id=node[1], ctx=ast.Load())
+    elif kind == 'binary':
+        return ast.BinOp(left=to_expr(node[2]), op=_Binary_ops[node[1]](),
+            right=to_expr(node[3]))
+    elif kind == 'unary':
+        return ast.UnaryOp(op=_Unary_ops[node[1]](),
+            operand=to_expr(node[2]))
+    elif kind == 'tee' and hasattr(ast, 'NamedExpr'):
+        return ast.NamedExpr(target=ast.Name(id=node[1], ctx=ast.Store()),
+            value=to_expr(node[2]))
+    elif kind == 'call':
+        return ast.Call(func=to_expr(node[1]),
+            args=[to_expr(arg) for arg in node[2]],
+            keywords=[ast.keyword(arg=name, value=to_expr(value))
+                for name, value in node[3]])
+    raise ValueError("No expression form for tree %r" % (kind, ))
+
+def to_stmt(node):
+    """
+    Return the `ast` statement for tree `node`.
+    """
+    kind = node[0]
+    if kind == 'store':
+        return ast.Assign(targets=[ast.Name(id=node[1], ctx=ast.Store())],
+            value=to_expr(node[3]))
+    elif kind == 'return':
+        return ast.Return(value=to_expr(node[1]))
+    raise ValueError("No statement form for tree %r" % (kind, ))
+
+def to_module(co, name=None):
+    """
+    Return an `ast.Module` defining one function, `name` (by default,
+    the name of CodeObject `co`), whose body is the program in `co`.
+    """
+    statements = tree.hoist_tees(tree.lower(co))
+    # Start from a parsed template, so the FunctionDef and its arguments
+    # have whatever fields this version of Python expects.
+    params, kwonly = co.param_names()
+    module = ast.parse("def f(%s):\n    pass\n"
+        % ', '.join(params + (['*'] + kwonly if kwonly else [])))
+    func = module.body[0]
+    func.name = co.co_name if name is None else name
+    func.lineno = co.co_firstlineno
+    body = []
+    globals_ = tree.global_stores(statements)
+    if globals_:
+        body.append(ast.Global(names=globals_))
+    for lineno, node in enumerate(statements, co.co_firstlineno):
+        stmt = to_stmt(node)
+        stmt.lineno = stmt.end_lineno = lineno
+        stmt.col_offset = 0
+        body.append(stmt)
+    # Python 3.8 added end positions, which must not come before the
+    # start; the template's would, with the statements moved.
+    func.end_lineno = max(func.lineno,
+        co.co_firstlineno + len(statements) - 1)
+    # A local that is read but never assigned must still be a local, so
+    # that reading it raises UnboundLocalError as the bytecode does. An
+    # assignment after the return makes it one without ever running.
+    for varname in tree.unbound_locals(statements, params + kwonly):
+        body.append(ast.Assign(targets=[ast.Name(id=varname,
+            ctx=ast.Store())], value=_constant(None)))
+    func.body = body
+    return ast.fix_missing_locations(module)
+
+def to_code(co, name=None):
+    """
+    Compile the program in CodeObject `co`. Return the function's
+    CodeType.
+    """
+    module = to_module(co, name)
+    module_code = compile(module, co.co_filename, 'exec')
+    func_name = module.body[0].name
+    for const in module_code.co_consts:
+        if isinstance(const, types.CodeType) and const.co_name == func_name:
+            return const
+    raise ValueError("No code for function %r" % func_name)
+
+def to_function(co, globs=None, name=None):
+    """
+    Compile the program in CodeObject `co`, and return it as a function
+    with globals `globs` (by default, a new empty dict).
+    """
+    globs = co.bind_globals({} if globs is None else globs)
+    code = to_code(co, name)
+    return co.bind_constants(types.FunctionType(code, globs, code.co_name),
+        globs)
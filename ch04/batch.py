@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    ch04.batch
+    ~~~~~~~~~~
+
+    Runs one program over many rows of input at once. Each input is a
+    column: a sequence of values for one variable, one per row. Instead
+    of calling the compiled function once per row, the program's
+    statement trees are evaluated a whole column at a time. NumPy
+    element-wise operations are used when NumPy is installed, and plain
+    Python lists otherwise.
+
+    Floor division keeps Python's semantics. A row that divides by zero,
+    in the program or in a function it calls, does not stop the batch:
+    it is reported in the list of failed rows that `evaluate` returns.
+    Its later values are placeholders, and functions are not called for
+    it.
+
+    A global the program stores is a column too. Before a function is
+    called for a row, each stored global is set in `globs` to its value
+    for that row, so functions that read it see what they would if the
+    program ran once per row.
+
+    With NumPy, values are held in NumPy arrays, so integer columns are
+    limited to 64 bits. Functions are still called with Python values.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import builtins
+import operator
+
+from . import bytecode
+from . import tree
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def evaluate(co, columns, globs=None, use_numpy=None):
+    """
+    Run the program in CodeObject `co` once for each row of `columns`, a
+    dict mapping variable names to equal-length sequences. Before each
+    row runs, its values are bound to those variables. Names not in
+    `columns` are looked up in `globs`, as for the compiled function.
+
+    `use_numpy` picks the implementation; by default NumPy is used if
+    it is installed.
+
+    Return a pair (values, failed). `values` holds the program's return
+    value for each row, as a NumPy array or a list. `failed` is a list
+    of the rows that raised ZeroDivisionError, in the program or in a
+    function it calls; their entries in `values` are 0 (NumPy) or None
+    (lists). Each global the program stores is left in `globs` with its
+    value for the last row.
+    """
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    elif use_numpy and numpy is None:
+        raise ImportError("NumPy is not installed")
+    lengths = set(len(values) for values in columns.values())
+    if len(lengths) > 1:
+        raise ValueError("Columns have different lengths: %s"
+            % sorted(lengths))
+    nrows = lengths.pop() if lengths else 1
+    evaluator = (_NumpyEvaluator if use_numpy else _ListEvaluator)(nrows,
+        co.bind_globals({} if globs is None else globs))
+    env = dict((name, evaluator.column(values))
+        for name, values in columns.items())
+    for stmt in tree.lower(co):
+        if stmt[0] == 'store':
+            value = env[stmt[1]] = evaluator.eval(stmt[3], env)
+            if stmt[2] == 'global':
+                evaluator.stored[stmt[1]] = value
+        else:
+            values = evaluator.eval(stmt[1], env)
+            if nrows:
+                for name, column in evaluator.stored.items():
+                    evaluator.globs[name] = evaluator.tolist(column)[-1]
+            return evaluator.finish(values)
+    raise ValueError("Program %s does not return" % co.co_name)
+
+class _Evaluator:
+    """
+    Evaluates trees a column at a time. Subclasses decide how a column
+    is held, and apply the operators element-wise.
+    """
+
+    _Binary_ops = {
+        '+': operator.add,
+        '-': operator.sub,
+        '*': operator.mul,
+        '//': operator.floordiv,
+    }
+
+    _Unary_ops = {
+        '-': operator.neg,
+        '+': operator.pos,
+    }
+
+    def __init__(self, nrows, globs):
+        self.nrows = nrows
+        self.globs = globs
+        # Column of each global the program has stored so far.
+        self.stored = {}
+
+    def eval(self, node, env):
+        kind = node[0]
+        if kind == 'const':
+            return self.scalar(node[1])
+        elif kind == 'load':
+            if node[1] in env:
+                return env[node[1]]
+            return self.scalar(self.lookup(node, env))
+        elif kind == 'binary':
+            return self.binary(node[1], self.eval(node[2], env),
+                self.eval(node[3], env))
+        elif kind == 'unary':
+            return self.unary(node[1], self.eval(node[2], env))
+        elif kind == 'tee':
+            value = env[node[1]] = self.eval(node[2], env)
+            return value
+        elif kind == 'call':
+            func = node[1]
+            if func[0] != 'load' or func[1] in env:
+                raise ValueError("Only named functions can be called in a "
+                    "batch")
+            args = [self.eval(arg, env) for arg in node[2]]
+            kwargs = [(name, self.eval(value, env))
+                for name, value in node[3]]
+            return self.call(self.lookup(func, env), args, kwargs)
+        raise ValueError("No expression form for tree %r" % (kind, ))
+
+    def lookup(self, node, env):
+        """
+        Return the value of a name that is not a column or assigned in
+        the program.
+        """
+        name = node[1]
+        if node[2] == 'fast' and name.startswith(bytecode.Constant_prefix):
+            # A constant global, which a function takes as a parameter.
+            name = name[len(bytecode.Constant_prefix):]
+        elif node[2] == 'fast':
+            raise UnboundLocalError("local variable '%s' referenced before "
+                "assignment" % name)
+        try:
+            return self.globs[name]
+        except KeyError:
+            try:
+                return getattr(builtins, name)
+            except AttributeError:
+                raise NameError("name '%s' is not defined" % name)
+
+    def _rows(self, args, kwargs):
+        """
+        Generate (args, kwargs) for each row, from evaluated columns.
+        """
+        names = [name for name, value in kwargs]
+        columns = list(args) + [value for name, value in kwargs]
+        npos = len(args)
+        for row in zip(*columns) if columns else [()] * self.nrows:
+            yield row[:npos], dict(zip(names, row[npos:]))
+
+    def _call_rows(self, func, args, kwargs):
+        """
+        Call `func` once for each row, from evaluated columns, after
+        setting the globals the program stored to their values for the
+        row. Return a list of the results. Rows that have failed already
+        are not called, and rows whose call raises ZeroDivisionError
+        fail; both get 0.
+        """
+        globs = self.globs
+        stored = [(name, self.tolist(column))
+            for name, column in self.stored.items()]
+        args = [self.tolist(column) for column in args]
+        kwargs = [(name, self.tolist(column)) for name, column in kwargs]
+        result = []
+        append = result.append
+        for row, (a, k) in enumerate(self._rows(args, kwargs)):
+            if self.has_failed(row):
+                append(0)
+                continue
+            for name, column in stored:
+                globs[name] = column[row]
+            try:
+                append(func(*a, **k))
+            except ZeroDivisionError:
+                self.fail(row)
+                append(0)
+        return result
+
+class _ListEvaluator(_Evaluator):
+
+    def __init__(self, nrows, globs):
+        super().__init__(nrows, globs)
+        self.failed = set()
+
+    def column(self, values):
+        return list(values)
+
+    def scalar(self, value):
+        return [value] * self.nrows
+
+    def has_failed(self, row):
+        return row in self.failed
+
+    def fail(self, row):
+        self.failed.add(row)
+
+    def binary(self, op, left, right):
+        if op != '//':
+            return list(map(self._Binary_ops[op], left, right))
+        result = []
+        append = result.append
+        for row, (a, b) in enumerate(zip(left, right)):
+            if b:
+                append(a // b)
+            else:
+                self.failed.add(row)
+                append(0)
+        return result
+
+    def unary(self, op, operand):
+        return list(map(self._Unary_ops[op], operand))
+
+    def tolist(self, column):
+        return column
+
+    def call(self, func, args, kwargs):
+        return self._call_rows(func, args, kwargs)
+
+    def finish(self, values):
+        failed = sorted(self.failed)
+        for row in failed:
+            values[row] = None
+        return values, failed
+
+class _NumpyEvaluator(_Evaluator):
+
+    def __init__(self, nrows, globs):
+        super().__init__(nrows, globs)
+        self.failed = numpy.zeros(nrows, dtype=bool)
+
+    def column(self, values):
+        return numpy.asarray(values)
+
+    def scalar(self, value):
+        return numpy.full(self.nrows, value)
+
+    def has_failed(self, row):
+        return self.failed[row]
+
+    def fail(self, row):
+        self.failed[row] = True
+
+    def binary(self, op, left, right):
+        if op == '//':
+            zero = right == 0
+            if zero.any():
+                self.failed |= zero
+                # Divide the failed rows by 1 instead, so that NumPy does
+                # not warn; their values are discarded at the end.
+                right = numpy.where(zero, 1, right)
+        return self._Binary_ops[op](left, right)
+
+    def unary(self, op, operand):
+        return self._Unary_ops[op](operand)
+
+    def tolist(self, column):
+        # Python values, not NumPy scalars, for the functions called.
+        return column.tolist()
+
+    def call(self, func, args, kwargs):
+        return numpy.array(self._call_rows(func, args, kwargs))
+
+    def finish(self, values):
+        values = numpy.array(values)
+        values[self.failed] = 0
+        return values, numpy.flatnonzero(self.failed).tolist()
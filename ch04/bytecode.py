@@ -9,15 +9,202 @@
     :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
     :license: GPL v3+, see LICENSE for more details.
 """
-import inspect
-import opcode
-import re
+from array import array
+import bisect
+import builtins
+import functools
+import itertools
+import sys
+import time
 import types
 
+from . import opcodes
+
+_Signed_lnotab = sys.version_info >= (3, 6)
+""" Whether `co_lnotab` line increments are signed bytes. """
+
+Wordcode = sys.version_info >= (3, 6)
+"""
+Whether the running Python uses two-byte "wordcode" instructions. This
+module writes the instructions of Python 3.3 to 3.5: one byte, or three
+with an argument. A Python that uses wordcode cannot run them, so from
+3.6 `compile` refuses, and code is run by the `ch04.vm` interpreter.
+Nor can this module read wordcode, so `from_code` refuses too.
+"""
+
+Packed_calls = sys.version_info < (3, 6)
+"""
+Whether CALL_FUNCTION packs its positional and keyword argument counts
+into one argument, with each keyword value pushed after its name, as
+before Python 3.6. From 3.6, the argument is the number of values, and
+CALL_FUNCTION_KW finds the keyword names in a tuple on top of them. The
+3.6 calls are still written as three-byte instructions (see `Wordcode`),
+for `ch04.vm` to run.
+"""
+
+Constant_prefix = '_g_'
+"""
+Prefix of the hidden parameters that hold the values of constant
+globals. Source identifiers cannot start with '_'.
+"""
+
+Max_call_args = 255
+"""
+Most positional, or keyword, arguments a packed CALL_FUNCTION can pass.
+From Python 3.6, calls with more positional arguments pass them in a
+tuple, with CALL_FUNCTION_EX.
+"""
+
+def _oplist(name):
+    """
+    Return the opcode list `name` (like 'hasconst') of `opcodes`, or an
+    empty list if this version of Python does not have it.
+    """
+    return list(getattr(opcodes, name, ()))
+
+_Jump_opcodes = frozenset(_oplist('hasjabs') + _oplist('hasjrel'))
+_Jrel_opcodes = frozenset(_oplist('hasjrel'))
+
+class _DispatchTable:
+    """
+    A class attribute holding a table, indexed by opcode number, of the
+    method that handles each opcode. The table is built by `build(cls)`
+    the first time it is used, and then replaces this descriptor.
+    """
+
+    def __init__(self, name, build):
+        self.name = name
+        self.build = build
+
+    def __get__(self, obj, cls):
+        table = self.build(cls)
+        setattr(cls, self.name, table)
+        return table
+
+def _dispatch_table(default, strategies, noarg):
+    """
+    Return a dispatch table covering every opcode of this Python.
+    Opcodes below HAVE_ARGUMENT get `noarg`. The others get the strategy
+    whose opcode list, in the dict `strategies`, names them, or
+    `default`. Numbers that are not opcodes are None.
+    """
+    table = [None] * max(256, max(opcodes.opmap.values()) + 1)
+    for opnum in opcodes.opmap.values():
+        if opnum < opcodes.HAVE_ARGUMENT:
+            table[opnum] = noarg
+        else:
+            table[opnum] = default
+    for strategy, names in strategies.items():
+        for name in names:
+            for opnum in _oplist(name):
+                if opnum >= opcodes.HAVE_ARGUMENT:
+                    table[opnum] = strategy
+    return table
+
+def _encode_lnotab(firstlineno, line_starts):
+    """
+    Encode a list of (offset, lineno) pairs, in offset order, as a
+    `co_lnotab` byte string. Before Python 3.6 the table cannot express
+    a line number going down, so such a line is merged with the one
+    before it.
+    """
+    min_incr, max_incr = (-128, 127) if _Signed_lnotab else (0, 255)
+    lnotab = bytearray()
+    last_offset = 0
+    last_lineno = firstlineno
+    for offset, lineno in line_starts:
+        offset_incr = offset - last_offset
+        line_incr = lineno - last_lineno
+        if line_incr == 0 or line_incr < min_incr and not _Signed_lnotab:
+            continue
+        while offset_incr > 255:
+            lnotab += bytes((255, 0))
+            offset_incr -= 255
+        while not min_incr <= line_incr <= max_incr:
+            step = max_incr if line_incr > 0 else min_incr
+            lnotab += bytes((offset_incr, step & 0xFF))
+            offset_incr = 0
+            line_incr -= step
+        lnotab += bytes((offset_incr, line_incr & 0xFF))
+        last_offset = offset
+        last_lineno = lineno
+    return lnotab
+
+class Label:
+    """
+    A jump target in a CodeObject. Create one with `new_label`, jump to
+    it before or after it is placed, and place it with `set_label`.
+    """
+    __slots__ = ('name', 'offset')
+
+    def __init__(self, name):
+        self.name = name
+        self.offset = None
+
+    def __repr__(self):
+        return '<Label %s at %r>' % (self.name, self.offset)
+
+_Unconditional_opcodes = frozenset(opcodes.opmap[name] for name in (
+    'JUMP_ABSOLUTE', 'JUMP_FORWARD', 'RETURN_VALUE')
+    if name in opcodes.opmap)
+
+class InstructionLog:
+    """
+    A compact record of the instructions appended to a CodeObject. Each
+    instruction is stored as an opcode number and an argument reference
+    in two parallel arrays. For opcodes that take their argument from one
+    of the code object's tables, the reference is the table index, and
+    the argument value is looked up again on demand.
+
+    The log behaves like a read-only sequence of `(opname, opnum, arg)`
+    tuples, the same shape the CodeObject used to store directly.
+    """
+
+    def __init__(self, code):
+        self._code = code
+        self._opnums = array('H')
+        self._argrefs = array('I')
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        opnum = self._opnums[index]
+        arg = self._code._lookup_arg(opnum, self._argrefs[index])
+        return (opcodes.opname[opnum], opnum, arg)
+
+    def __iter__(self):
+        lookup = self._code._lookup_arg
+        opname = opcodes.opname
+        for opnum, argref in zip(self._opnums, self._argrefs):
+            yield (opname[opnum], opnum, lookup(opnum, argref))
+
+    def __len__(self):
+        return len(self._opnums)
+
+    def append(self, opnum, argref):
+        """
+        Record an instruction. `argref` is the index used to encode the
+        argument, or None for opcodes without one.
+        """
+        self._opnums.append(opnum)
+        self._argrefs.append(0 if argref is None else argref)
+
+    def set_argref(self, index, argref):
+        """
+        Change the argument reference of the instruction at `index`, for
+        arguments that are patched after the instruction is appended.
+        """
+        self._argrefs[index] = argref
+
 class CodeObject:
 
     def __call__(self, *args):
-        frame = inspect.stack()[1][0]
+        try:
+            frame = sys._getframe(1)
+        except AttributeError:
+            # Not CPython: take the slow path.
+            import inspect
+            frame = inspect.stack()[1][0]
         globs = frame.f_globals
         fn = self.to_function(globs=globs)
         return fn(*args)
@@ -28,15 +215,37 @@ class CodeObject:
         the function or code object given. Otherwise, the object should
         be empty but ready to modify.
         """
+        self._appended_ops = InstructionLog(self)
+        self._shared = False
+        self._last_line_start = None
+        self._labels = []
+        # Jumps to labels not yet placed: label -> [(offset, log index)].
+        self._fixups = {}
+        self.metrics = None
+        # Source text, and a dict mapping line numbers to (start, stop)
+        # offsets in it, for compilers that record where code came from.
+        self.source = None
+        self.source_spans = {}
+        # Globals the compiler expects the code to find, by name.
+        self.bindings = {}
+        # Globals declared constant, whose values are bound to the
+        # keyword-only parameters (named with `Constant_prefix`) when a
+        # function is made from the code.
+        self.constant_globals = []
+        # Jump tables, keyed by the log index of the NOP that marks each:
+        # (local name, lowest value, target Labels, default Label).
+        self.jump_tables = {}
         if ref is None:
-            self._appended_ops = []
             self._modifiable = True
             self.co_argcount = 0
+            self.co_cellvars = ()
             self.co_code = bytearray()
             self.co_consts = [None, ]
             self.co_filename = '<no file>'
             self.co_firstlineno = 1
             self.co_flags = 0
+            self.co_freevars = ()
+            self.co_kwonlyargcount = 0
             self.co_lnotab = bytearray()
             self.co_name = '<no name>'
             self.co_names = []
@@ -50,15 +259,20 @@ class CodeObject:
                 from_co = ref.__code__
             else:
                 raise ValueError("Don't know how to handle type: %s" % type(ref))
+            if Wordcode:
+                raise NotImplementedError("Python %d.%d code is wordcode, "
+                    "which CodeObject cannot read" % sys.version_info[:2])
 
-            self._appended_ops = []
             self._modifiable = False
             self.co_argcount = from_co.co_argcount
+            self.co_cellvars = from_co.co_cellvars
             self.co_code = from_co.co_code
             self.co_consts = from_co.co_consts
             self.co_filename = from_co.co_filename
             self.co_firstlineno = from_co.co_firstlineno
             self.co_flags = from_co.co_flags
+            self.co_freevars = from_co.co_freevars
+            self.co_kwonlyargcount = from_co.co_kwonlyargcount
             self.co_lnotab = from_co.co_lnotab
             self.co_name = from_co.co_name
             self.co_names = from_co.co_names
@@ -66,6 +280,36 @@ class CodeObject:
             self.co_stacksize = from_co.co_stacksize
             self.co_varnames = from_co.co_varnames
 
+    @classmethod
+    def from_code(cls, ref, mutable=False):
+        """
+        Create a CodeObject from the function or code object `ref`. If
+        `mutable` is true, the new object can be changed. Until it is, it
+        shares the tables and bytecode of `ref`; the first change takes
+        private copies of them. Raise NotImplementedError on Pythons that
+        use wordcode (see `Wordcode`).
+        """
+        co = cls(ref)
+        if mutable:
+            co._modifiable = True
+            co._shared = True
+        return co
+
+    def _will_modify(self, what='modify'):
+        """
+        Raise TypeError if the object cannot be changed. Otherwise make
+        sure it owns its tables and bytecode.
+        """
+        if not self._modifiable:
+            raise TypeError("Cannot %s unmodifiable object." % what)
+        if self._shared:
+            self._shared = False
+            self.co_code = bytearray(self._code)
+            self.co_consts = list(self.co_consts)
+            self.co_lnotab = bytearray(self.co_lnotab)
+            self.co_names = list(self.co_names)
+            self.co_varnames = list(self.co_varnames)
+
     def _append_invalid_opcode(self, opnum, arg):
         raise ValueError("Invalid opcode specified: %d" % opnum)
 
@@ -73,36 +317,86 @@ class CodeObject:
         if arg is not None:
             raise ValueError("Argument provided to no-arg opcode: (%d, %s)" % (opnum, repr(arg)))
         self.append_bytecode(opnum, None)
+        return None
 
     def _append_opcode_const(self, opnum, arg):
-        self._append_table_helper(opnum, arg, self.co_consts)
+        # Constants that are equal but of different types, such as 1 and
+        # True, are kept apart, as CPython keeps them.
+        consts = self.co_consts
+        for arg_index, value in enumerate(consts):
+            if type(value) is type(arg) and value == arg:
+                break
+        else:
+            arg_index = len(consts)
+            consts.append(arg)
+        self.append_bytecode(opnum, arg_index)
+        return arg_index
 
     def _append_opcode_compare(self, opnum, arg):
-        value_list = opcode.cmp_op
+        value_list = opcodes.cmp_op
         try:
             arg_index = value_list.index(arg)
         except ValueError:
             arg_index = len(value_list)
             value_list.append(arg)
         self.append_bytecode(opnum, arg_index)
+        return arg_index
 
     def _append_opcode_freevar(self, opnum, arg):
-        raise NotImplementedError("not yet")
+        cell_names = tuple(self.co_cellvars) + tuple(self.co_freevars)
+        try:
+            arg_index = cell_names.index(arg)
+        except ValueError:
+            raise ValueError("Unknown cell or free variable: %r" % (arg, ))
+        self.append_bytecode(opnum, arg_index)
+        return arg_index
 
     def _append_opcode_jumpabs(self, opnum, arg):
-        raise NotImplementedError("not yet")
+        return self._append_jump(opnum, arg, False)
 
     def _append_opcode_jumprel(self, opnum, arg):
-        raise NotImplementedError("not yet")
+        return self._append_jump(opnum, arg, True)
+
+    def _append_jump(self, opnum, arg, relative):
+        """
+        Append a jump to `arg`, a Label or an absolute offset. A jump to
+        a label not yet placed is patched when it is.
+        """
+        here = len(self._code)
+        if isinstance(arg, Label):
+            if arg.offset is None:
+                self._fixups.setdefault(arg, []).append(
+                    (here, len(self._appended_ops)))
+                self.append_bytecode(opnum, 0)
+                return 0
+            arg = arg.offset
+        if relative:
+            arg -= here + 3
+            if arg < 0:
+                raise ValueError("Relative jump backward from offset %d"
+                    % here)
+        self.append_bytecode(opnum, arg)
+        return arg
 
     def _append_opcode_localvar(self, opnum, arg):
-        self._append_table_helper(opnum, arg, self.co_varnames)
+        # A local may be given by its slot, an index into co_varnames
+        # assigned beforehand (see ch08.symbols), which saves a search.
+        if isinstance(arg, int):
+            if not 0 <= arg < len(self.co_varnames):
+                raise ValueError("No local variable in slot %r" % (arg, ))
+            self.append_bytecode(opnum, arg)
+            return arg
+        return self._append_table_helper(opnum, arg, self.co_varnames)
 
     def _append_opcode_name(self, opnum, arg):
-        self._append_table_helper(opnum, arg, self.co_names)
+        return self._append_table_helper(opnum, arg, self.co_names)
 
-    def _append_opcode_hasnargs(self, opnum, arg):
+    def _append_opcode_raw(self, opnum, arg):
+        if not isinstance(arg, int) or arg < 0:
+            raise ValueError("Opcode %s needs a non-negative integer "
+                "argument, not %r" % (opcodes.opname[opnum], arg))
         self.append_bytecode(opnum, arg)
+        return arg
 
     def _append_table_helper(self, opnum, arg, table):
         try:
@@ -111,42 +405,95 @@ class CodeObject:
             arg_index = len(table)
             table.append(arg)
         self.append_bytecode(opnum, arg_index)
+        return arg_index
 
-    _append_dispatch = [ _append_invalid_opcode ] * 256
+    # Opcodes with an argument that is not looked up in a table (counts,
+    # like CALL_FUNCTION and BUILD_TUPLE, or flags) take it as it is.
     _append_strategy = {
-            _append_opcode_noarg  : [ x for x in range(opcode.HAVE_ARGUMENT - 1) ],
-            _append_opcode_compare: opcode.hascompare,
-            _append_opcode_const  : opcode.hasconst,
-            _append_opcode_freevar: opcode.hasfree,
-            _append_opcode_jumpabs: opcode.hasjabs,
-            _append_opcode_jumprel: opcode.hasjrel,
-            _append_opcode_localvar: opcode.haslocal,
-            _append_opcode_name   : opcode.hasname,
-            _append_opcode_hasnargs: opcode.hasnargs,
+            _append_opcode_compare: ('hascompare', ),
+            _append_opcode_const  : ('hasconst', ),
+            _append_opcode_freevar: ('hasfree', ),
+            _append_opcode_jumpabs: ('hasjabs', ),
+            _append_opcode_jumprel: ('hasjrel', ),
+            _append_opcode_localvar: ('haslocal', ),
+            _append_opcode_name   : ('hasname', ),
     }
 
-    for strategy, oplist in _append_strategy.items():
-        for op in oplist:
-            _append_dispatch[op] = strategy
+    @classmethod
+    def _build_append_dispatch(cls):
+        table = _dispatch_table(cls._append_opcode_raw,
+            cls._append_strategy, cls._append_opcode_noarg)
+        return [cls._append_invalid_opcode if strategy is None else strategy
+            for strategy in table]
+
+    _append_dispatch = _DispatchTable('_append_dispatch',
+        _build_append_dispatch.__func__)
+
+    def _lookup_arg_none(self, argindex):
+        return None
+
+    def _lookup_arg_compare(self, argindex):
+        return opcodes.cmp_op[argindex]
+
+    def _lookup_arg_const(self, argindex):
+        return self.co_consts[argindex]
+
+    def _lookup_arg_freevar(self, argindex):
+        return (tuple(self.co_cellvars) + tuple(self.co_freevars))[argindex]
+
+    def _lookup_arg_localvar(self, argindex):
+        return self.co_varnames[argindex]
+
+    def _lookup_arg_name(self, argindex):
+        return self.co_names[argindex]
+
+    def _lookup_arg_raw(self, argindex):
+        return argindex
+
+    _lookup_strategy = {
+            _lookup_arg_compare : ('hascompare', ),
+            _lookup_arg_const   : ('hasconst', ),
+            _lookup_arg_freevar : ('hasfree', ),
+            _lookup_arg_localvar: ('haslocal', ),
+            _lookup_arg_name    : ('hasname', ),
+    }
+
+    @classmethod
+    def _build_lookup_dispatch(cls):
+        table = _dispatch_table(cls._lookup_arg_raw, cls._lookup_strategy,
+            cls._lookup_arg_none)
+        # Decoding reads whatever bytes it is given, so unknown opcodes
+        # have their argument shown as it is.
+        return [cls._lookup_arg_raw if strategy is None else strategy
+            for strategy in table]
+
+    _lookup_dispatch = _DispatchTable('_lookup_dispatch',
+        _build_lookup_dispatch.__func__)
+
+    def _lookup_arg(self, opnum, argindex):
+        """
+        Return the argument value encoded as `argindex` for opcode `opnum`.
+        """
+        return self._lookup_dispatch[opnum](self, argindex)
 
     def append(self, opname, arg=None):
-        opnum = opcode.opmap[opname]
-        self._appended_ops.append((opname, opnum, arg))
+        opnum = opcodes.opmap[opname]
+        if not self._modifiable or self._shared:
+            self._will_modify('append to')
         meth = self._append_dispatch[opnum].__get__(self)
-        meth(opnum, arg)
+        argref = meth(opnum, arg)
+        self._appended_ops.append(opnum, argref)
 
     def append_bytecode(self, opnum, arg):
-        if not self._modifiable:
-            raise TypeError("Cannot append to unmodifiable object.")
-        bytes = self.co_code
-        if opnum >= opcode.HAVE_ARGUMENT:
+        if not self._modifiable or self._shared:
+            self._will_modify('append to')
+        if opnum >= opcodes.HAVE_ARGUMENT:
             if arg > 0xFFFF:
-                self.append_bytecode(opcode.EXTENDED_ARG, arg >> 16)
-            bytes.append(opnum)
-            bytes.append(arg & 0xFF)
-            bytes.append((arg>>8) & 0xFF)
+                self.append_bytecode(opcodes.EXTENDED_ARG, arg >> 16)
+            self._code += bytes((opnum, arg & 0xFF, (arg >> 8) & 0xFF))
         else:
-            bytes.append(opnum)
+            self._code.append(opnum)
+        self._code_bytes = None
 
     def check_bytecode(self, wanted):
         print("Got bytecode: {!r}".format(self.co_code))
@@ -158,185 +505,832 @@ class CodeObject:
         object. Because of data format conversions, this method can be
         called more than once as the object changes.
 
-        Return a new CodeType object.
+        Return a new CodeType object. Raise NotImplementedError if the
+        running Python cannot run the code (see `Wordcode`).
         """
-        kwonlyargs =  0
-        freevars = ()
-        cellvars = ()
+        if self._fixups:
+            raise ValueError("Jump to label %s, which was never placed"
+                % min(label.name for label in self._fixups))
+        if Wordcode:
+            raise NotImplementedError("Python %d.%d runs wordcode, not the "
+                "three-byte instructions of a CodeObject; run the code with "
+                "ch04.vm instead" % sys.version_info[:2])
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
         ct = types.CodeType(
-            self.co_argcount, kwonlyargs, self.co_nlocals, self.co_stacksize,
-            self.co_flags, bytes(self.co_code), tuple(self.co_consts),
-            tuple(self.co_names), tuple(self.co_varnames), self.co_filename,
-            self.co_name, self.co_firstlineno, bytes(self.co_lnotab),
-            freevars, cellvars)
+            self.co_argcount, self.co_kwonlyargcount, len(self.co_varnames),
+            max(self.co_stacksize, self.stack_depth()), self.co_flags,
+            self.code_bytes(),
+            tuple(self.co_consts), tuple(self.co_names),
+            tuple(self.co_varnames), self.co_filename, self.co_name,
+            self.co_firstlineno, bytes(self.co_lnotab),
+            tuple(self.co_freevars), tuple(self.co_cellvars))
+        if metrics is not None:
+            metrics.add_time('codetype', time.perf_counter() - start)
+            metrics.count('code_objects')
         return ct
 
-    def _decode_argindex(self, it, extended_arg):
-        """Decodes an argument index, including support for extended_arg."""
-        argindex = next(it)
-        argindex |= next(it) << 8
-        if extended_arg is not None:
-            argindex |= extended_arg << 16
-        return argindex
+    def report_metrics(self, metrics):
+        """
+        Report the instructions appended and the sizes of the constant and
+        name tables into `metrics` (a `ch04.instrument.Metrics`). A table
+        lookup counts as a hit when it reused an entry already present.
 
-    def _decode_common(self, opnum, offset):
-        lineno = self.get_lineno_of_offset(offset)
-        labels = self.get_labels_at_offset(offset)
-        opname = opcode.opname[opnum]
-        return (lineno, labels, opname)
-
-    def _decode_invalid_opcode(self, opnum, it, offset, extended_arg):
-        opname = opcode.opname[opnum]
-        raise ValueError("Unknown opcode '%s' at offset %d" % (opname, offset))
-
-    def _decode_opcode_noarg(self, opnum, it, offset, extended_arg):
-        """Return a tuple of (lineno, offset, (labels), opnum, opname,
-        argindex, argvalue)."""
-        lineno, labels, opname = self._decode_common(opnum, offset)
-        argvalue = argindex = None
-        return (lineno, offset, labels, opnum, opname, argindex, argvalue)
-
-    def _decode_opcode_hasconst(self, opnum, it, offset, extended_arg):
-        """Return a tuple of (lineno, offset, (labels), opnum, opname,
-        argindex, argvalue)."""
-        lineno, labels, opname = self._decode_common(opnum, offset)
-        argindex = self._decode_argindex(it, extended_arg)
-        argvalue = self.co_consts[argindex]
-        return (lineno, offset, labels, opnum, opname, argindex, argvalue)
-
-    def _decode_opcode_compare(self, opnum, it, offset, extended_arg):
-        """Return a tuple of (lineno, offset, (labels), opnum, opname,
-        argindex, argvalue)."""
-        lineno, labels, opname = self._decode_common(opnum, offset)
-        argindex = self._decode_argindex(it, extended_arg)
-        argvalue = opcode.cmp_op[argindex]
-        return (lineno, offset, labels, opnum, opname, argindex, argvalue)
-
-    def _decode_opcode_freevar(self, opnum, it, offset, extended_arg):
-        """Return a tuple of (lineno, offset, (labels), opnum, opname,
-        argindex, argvalue)."""
-        raise NotImplementedError("not yet")
-
-    def _decode_opcode_jumpabs(self, opnum, it, offset, extended_arg):
-        """Return a tuple of (lineno, offset, (labels), opnum, opname,
-        argindex, argvalue)."""
-        raise NotImplementedError("not yet")
-
-    def _decode_opcode_jumprel(self, opnum, it, offset, extended_arg):
-        """Return a tuple of (lineno, offset, (labels), opnum, opname,
-        argindex, argvalue)."""
-        raise NotImplementedError("not yet")
-
-    def _decode_opcode_localvar(self, opnum, it, offset, extended_arg):
-        """Return a tuple of (lineno, offset, (labels), opnum, opname,
-        argindex, argvalue)."""
-        lineno, labels, opname = self._decode_common(opnum, offset)
-        argindex = self._decode_argindex(it, extended_arg)
-        argvalue = self.co_varnames[argindex]
-        return (lineno, offset, labels, opnum, opname, argindex, argvalue)
-
-    def _decode_opcode_name(self, opnum, it, offset, extended_arg):
-        """Return a tuple of (lineno, offset, (labels), opnum, opname,
-        argindex, argvalue)."""
-        lineno, labels, opname = self._decode_common(opnum, offset)
-        argindex = self._decode_argindex(it, extended_arg)
-        argvalue = self.co_names[argindex]
-        return (lineno, offset, labels, opnum, opname, argindex, argvalue)
-
-    def _decode_opcode_hasnargs(self, opnum, it, offset, extended_arg):
-        """Return a tuple of (lineno, offset, (labels), opnum, opname,
-        argindex, argvalue)."""
-        raise NotImplementedError("not yet")
-
-    _decode_dispatch = [ _decode_invalid_opcode ] * 256
-    _decode_strategy = {
-        _decode_opcode_noarg   : [ x for x in range(opcode.HAVE_ARGUMENT - 1) ],
-        _decode_opcode_compare : opcode.hascompare,
-        _decode_opcode_hasconst: opcode.hasconst,
-        _decode_opcode_freevar : opcode.hasfree,
-        _decode_opcode_jumpabs : opcode.hasjabs,
-        _decode_opcode_jumprel : opcode.hasjrel,
-        _decode_opcode_localvar: opcode.haslocal,
-        _decode_opcode_name    : opcode.hasname,
-        _decode_opcode_hasnargs: opcode.hasnargs,
-    }
+        This works from the instruction log after the fact, so that
+        `append()` carries no counting cost.
+        """
+        log = self._appended_ops
+        metrics.count('instructions_emitted', len(log))
+        for table, ops in (('consts', opcodes.hasconst),
+                ('names', opcodes.hasname), ('varnames', opcodes.haslocal)):
+            ops = frozenset(ops)
+            refs = [argref for opnum, argref in zip(log._opnums, log._argrefs)
+                if opnum in ops]
+            metrics.count('table_lookups', len(refs), table=table)
+            metrics.count('table_hits', len(refs) - len(set(refs)),
+                table=table)
+            metrics.gauge('table_size', len(getattr(self, 'co_' + table)),
+                table=table)
+
+    @property
+    def co_code(self):
+        """
+        The bytecode. For a new CodeObject this is a single `bytearray`
+        that grows as instructions are appended. Change it through
+        `append_bytecode` or `patch_arg`, or assign a whole new value, so
+        the cached `bytes` copy is kept up to date.
+        """
+        return self._code
+
+    @co_code.setter
+    def co_code(self, code):
+        self._code = code
+        self._code_bytes = None
+
+    def code_bytes(self):
+        """
+        Return the bytecode as an immutable `bytes` object. The copy is
+        made once and reused until the code changes.
+        """
+        if self._code_bytes is None:
+            self._code_bytes = bytes(self._code)
+        return self._code_bytes
 
-    for strategy, oplist in _decode_strategy.items():
-        for op in oplist:
-            _decode_dispatch[op] = strategy
+    def code_view(self, start=0, stop=None):
+        """
+        Return a `memoryview` of the bytecode from `start` to `stop`,
+        without copying. The view is writable if the code is. Release
+        the view (or use it in a `with` statement) before appending more
+        code, since a `bytearray` cannot grow while it is being viewed.
+        """
+        view = memoryview(self._code)
+        if start == 0 and stop is None:
+            return view
+        with view:
+            return view[start:stop]
+
+    def patch_arg(self, offset, argindex):
+        """
+        Overwrite, in place, the argument of the instruction at `offset`.
+        The new argument must fit in the existing two bytes.
+        """
+        if not self._modifiable or self._shared:
+            self._will_modify('patch')
+        if self._code[offset] < opcodes.HAVE_ARGUMENT:
+            raise ValueError("No argument to patch at offset %d" % offset)
+        if not 0 <= argindex <= 0xFFFF:
+            raise ValueError("Argument %d does not fit at offset %d"
+                % (argindex, offset))
+        with self.code_view(offset + 1, offset + 3) as view:
+            view[0] = argindex & 0xFF
+            view[1] = (argindex >> 8) & 0xFF
+        self._code_bytes = None
+
+    def decode(self, stop=None):
+        """
+        Decode `co_code`, or its first `stop` bytes, in a single pass.
+        Return a tuple of three parallel arrays: (offsets, opnums,
+        argindexes). Instructions without an argument have an argindex of
+        0. An EXTENDED_ARG prefix is kept as an instruction of its own,
+        and its value is also folded into the argindex of the instruction
+        that follows it.
+        """
+        have_argument = opcodes.HAVE_ARGUMENT
+        offsets = array('I')
+        opnums = array('H')
+        argindexes = array('I')
+        add_offset = offsets.append
+        add_opnum = opnums.append
+        add_argindex = argindexes.append
+        code = self._code
+        end = len(code) if stop is None else stop
+        offset = 0
+        try:
+            while offset < end:
+                opnum = code[offset]
+                add_offset(offset)
+                add_opnum(opnum)
+                if opnum >= have_argument:
+                    add_argindex(code[offset + 1] | code[offset + 2] << 8)
+                    offset += 3
+                else:
+                    add_argindex(0)
+                    offset += 1
+        except IndexError:
+            raise ValueError("Truncated instruction at offset %d" % offset)
+        if offset > end:
+            raise ValueError("Truncated instruction at offset %d"
+                % offsets[-1])
+        if opcodes.EXTENDED_ARG in opnums:
+            for i in range(1, len(opnums)):
+                if opnums[i - 1] == opcodes.EXTENDED_ARG:
+                    argindexes[i] |= argindexes[i - 1] << 16
+        return (offsets, opnums, argindexes)
+
+    def _line_starts(self):
+        """
+        Decode `co_lnotab`. Return a pair of parallel lists (offsets,
+        linenos) giving the offset at which each line begins.
+        """
+        starts = [0]
+        linenos = [self.co_firstlineno]
+        lnotab = self.co_lnotab
+        offset = 0
+        lineno = self.co_firstlineno
+        for i in range(0, len(lnotab) - 1, 2):
+            offset += lnotab[i]
+            line_incr = lnotab[i + 1]
+            if line_incr >= 0x80 and _Signed_lnotab:
+                line_incr -= 0x100
+            lineno += line_incr
+            if offset == starts[-1]:
+                linenos[-1] = lineno
+            else:
+                starts.append(offset)
+                linenos.append(lineno)
+        return (starts, linenos)
+
+    def _labels_by_offset(self):
+        """
+        Return a dict mapping offsets to the tuple of labels defined there.
+        """
+        labels = {}
+        for label in self._labels:
+            if label.offset is not None:
+                labels[label.offset] = labels.get(label.offset, ()) \
+                    + (label.name, )
+        return labels
+
+    def new_label(self, name=None):
+        """
+        Return a new Label, not yet placed. It is named `name`, or given
+        a name of its own.
+        """
+        if name is None:
+            name = 'L%d' % len(self._labels)
+        label = Label(name)
+        self._labels.append(label)
+        return label
+
+    def set_label(self, label):
+        """
+        Place `label` at the next instruction to be appended, and patch
+        the jumps already made to it.
+        """
+        if label.offset is not None:
+            raise ValueError("Label %s is already placed" % label.name)
+        label.offset = len(self._code)
+        self._patch_fixups(self._fixups.pop(label, ()), label.offset)
+
+    def join_label(self, label, target):
+        """
+        Make the jumps to `label`, which is not placed, go to Label
+        `target` instead, whether or not that is placed. No more jumps
+        may be made to `label`.
+        """
+        if label.offset is not None:
+            raise ValueError("Label %s is already placed" % label.name)
+        fixups = self._fixups.pop(label, [])
+        if target.offset is None:
+            self._fixups.setdefault(target, []).extend(fixups)
+        else:
+            self._patch_fixups(fixups, target.offset)
+
+    def _patch_fixups(self, fixups, target):
+        """
+        Patch the jumps `fixups`, a list of (offset, log index) pairs, to
+        go to offset `target`.
+        """
+        if fixups and target > 0xFFFF:
+            self._relayout(fixups, target)
+            return
+        log = self._appended_ops
+        for here, index in fixups:
+            argindex = target
+            if self._code[here] in _Jrel_opcodes:
+                argindex -= here + 3
+                if argindex < 0:
+                    raise ValueError("Relative jump backward from offset %d"
+                        % here)
+            self.patch_arg(here, argindex)
+            log.set_argref(index, argindex)
+
+    def _relayout(self, fixups, target):
+        """
+        Patch the jumps `fixups` to go to `target`, which may need more
+        than the two bytes their arguments were given. The code is laid
+        out again from the log, with EXTENDED_ARG before each jump whose
+        argument does not fit, until every argument does.
+        """
+        shift = self._sync_log()
+        fixups = [(here, index + shift) for here, index in fixups]
+        log = self._appended_ops
+        opnums, argrefs = log._opnums, log._argrefs
+        have_argument = opcodes.HAVE_ARGUMENT
+        offsets = self.logged_offsets()
+        old = offsets + [len(self._code)]
+        if len(self._code) != sum(1 if opnum < have_argument
+                else 3 if argref <= 0xFFFF else 6
+                for opnum, argref in zip(opnums, argrefs)):
+            raise ValueError("Jump to offset %d does not fit, in code not "
+                "made by append" % target)
+        jumps = self.logged_jumps(offsets)
+        for here, index in fixups:
+            jumps[index] = target
+        for pending in self._fixups.values():
+            for here, index in pending:
+                del jumps[index]
+        changed = True
+        while changed:
+            new = [0]
+            for opnum, argref in zip(opnums, argrefs):
+                new.append(new[-1] + (1 if opnum < have_argument
+                    else 3 if argref <= 0xFFFF else 6))
+            moved = dict(zip(old, new))
+            changed = False
+            for index, offset in jumps.items():
+                argref = moved[offset]
+                if opnums[index] in _Jrel_opcodes:
+                    argref -= new[index + 1]
+                if argref != argrefs[index]:
+                    log.set_argref(index, argref)
+                    changed = True
+        self.co_code = bytearray()
+        for opnum, argref in zip(opnums, argrefs):
+            self.append_bytecode(opnum, argref)
+        for label in self._labels:
+            if label.offset is not None:
+                label.offset = moved[label.offset]
+        for label, pending in self._fixups.items():
+            self._fixups[label] = [(moved[here], index)
+                for here, index in pending]
+        if self.co_lnotab:
+            starts, linenos = self._line_starts()
+            self.co_lnotab = _encode_lnotab(self.co_firstlineno,
+                [(moved[start], lineno) for start, lineno
+                    in zip(starts, linenos)])
+            self._last_line_start = None
+
+    def append_jump_table(self, local, low, targets, default):
+        """
+        Append a NOP that marks a jump table on local variable `local`:
+        when it holds the int `low + i`, control goes to Label
+        `targets[i]`, and when it holds another int, to Label `default`.
+        CPython bytecode has no indirect jump, so the NOP must be
+        followed by compares that reach the same targets; an interpreter
+        that knows the table (such as `ch04.vm`) may jump directly, and
+        one that does not runs the compares.
+        """
+        self.jump_tables[len(self._appended_ops)] = (local, low,
+            tuple(targets), default)
+        self.append('NOP')
+
+    def repeat_instructions(self, start, stop):
+        """
+        Append again the logged instructions from index `start` up to
+        `stop`. Jumps within them are moved with them; jumps elsewhere,
+        and jumps to labels not yet placed, keep their targets.
+        """
+        shift = self._sync_log()
+        start += shift
+        stop += shift
+        log = self._appended_ops
+        pending = dict((index, label)
+            for label, fixups in self._fixups.items()
+            for here, index in fixups)
+        offsets = self.logged_offsets()
+        jumps = self.logged_jumps(offsets)
+        first = offsets[start]
+        last = offsets[stop] if stop < len(offsets) else len(self._code)
+        shift = len(self._code) - first
+        for i in range(start, stop):
+            opname, opnum, arg = log[i]
+            if i in pending:
+                arg = pending[i]
+            elif opnum in _Jump_opcodes:
+                arg = jumps[i]
+                if first <= arg <= last:
+                    arg += shift
+            self.append(opname, arg)
+
+    def _sync_log(self):
+        """
+        Make the instruction log cover all of `co_code`. Code that was not
+        appended (loaded by `from_code`, or assigned to `co_code`) comes
+        before the appended code: decode it into the front of the log,
+        and move the log indices of pending jumps and jump tables to
+        match. Return the number of instructions added, by which any
+        other log index must be moved.
+        """
+        log = self._appended_ops
+        have_argument = opcodes.HAVE_ARGUMENT
+        start = len(self._code) - sum(1 if opnum < have_argument
+            else 3 if argref <= 0xFFFF else 6
+            for opnum, argref in zip(log._opnums, log._argrefs))
+        if start == 0:
+            return 0
+        if start < 0:
+            raise ValueError("The instruction log is longer than co_code")
+        offsets, opnums, argindexes = self.decode(start)
+        seeded = InstructionLog(self)
+        for opnum, argindex in zip(opnums, argindexes):
+            if opnum != opcodes.EXTENDED_ARG:
+                seeded.append(opnum,
+                    argindex if opnum >= have_argument else None)
+        shift = len(seeded)
+        log._opnums[0:0] = seeded._opnums
+        log._argrefs[0:0] = seeded._argrefs
+        for label, pending in self._fixups.items():
+            self._fixups[label] = [(here, index + shift)
+                for here, index in pending]
+        self.jump_tables = dict((index + shift, table)
+            for index, table in self.jump_tables.items())
+        return shift
+
+    def logged_offsets(self):
+        """
+        Return the offset of each instruction in the log. Code not made
+        by `append` is decoded into the log first.
+        """
+        self._sync_log()
+        offsets = []
+        offset = 0
+        have_argument = opcodes.HAVE_ARGUMENT
+        for opnum, argref in zip(self._appended_ops._opnums,
+                self._appended_ops._argrefs):
+            offsets.append(offset)
+            if opnum < have_argument:
+                offset += 1
+            else:
+                offset += 3 if argref <= 0xFFFF else 6
+        return offsets
+
+    def logged_jumps(self, offsets=None):
+        """
+        Return a dict mapping the log index of each jump to the offset it
+        goes to. `offsets` may give the result of `logged_offsets`, if it
+        is already known.
+        """
+        if offsets is None:
+            offsets = self.logged_offsets()
+        ends = offsets[1:] + [len(self._code)]
+        log = self._appended_ops
+        jumps = {}
+        for i, (opnum, argref) in enumerate(zip(log._opnums, log._argrefs)):
+            if opnum in _Jump_opcodes:
+                jumps[i] = argref + ends[i] if opnum in _Jrel_opcodes \
+                    else argref
+        return jumps
+
+    def stack_depth(self):
+        """
+        Return the most values the appended instructions can have on the
+        stack at once, following every path through the jumps. Return 0
+        where `opcodes` cannot give stack effects (before Python 3.4).
+        """
+        if not hasattr(opcodes, 'stack_effect'):
+            return 0
+        log = self._appended_ops
+        opnums, argrefs = log._opnums, log._argrefs
+        offsets = self.logged_offsets()
+        jumps = self.logged_jumps(offsets)
+        index_at = dict((offset, i) for i, offset in enumerate(offsets))
+        have_argument = opcodes.HAVE_ARGUMENT
+        depths = {0: 0} if len(log) else {}
+        todo = list(depths)
+        while todo:
+            i = todo.pop()
+            opnum = opnums[i]
+            arg = argrefs[i] if opnum >= have_argument else None
+            depth = depths[i]
+            targets = []
+            if opnum in _Jump_opcodes:
+                targets.append((index_at[jumps[i]],
+                    depth + _stack_effect(opnum, arg, True)))
+            if opnum not in _Unconditional_opcodes and i + 1 < len(log):
+                targets.append((i + 1,
+                    depth + _stack_effect(opnum, arg, False)))
+            for j, new in targets:
+                if depths.get(j, -1) < new:
+                    depths[j] = new
+                    todo.append(j)
+        return max(depths.values()) if depths else 0
 
     def get_lineno_of_offset(self, offset):
-        return 1
+        starts, linenos = self._line_starts()
+        return linenos[bisect.bisect_right(starts, offset) - 1]
 
     def get_labels_at_offset(self, offset):
-        return ()
+        return self._labels_by_offset().get(offset, ())
 
     def instructions(self):
-        it = iter(self.co_code)
-        offset = 0
-        extended_arg = None
-        while True:
-            opnum = next(it)
-            meth = self._decode_dispatch[opnum].__get__(self)
-            tpl = meth(opnum, it, offset, extended_arg)
-            offset += 1
-            if tpl[3] == opcode.EXTENDED_ARG:
-                extended_arg = tpl[5]
+        """
+        Generate a tuple of (lineno, offset, (labels), opnum, opname,
+        argindex, argvalue) for each instruction in `co_code`.
+        """
+        offsets, opnums, argindexes = self.decode()
+        invalid = set(opnums).difference(opcodes.opmap.values())
+        if invalid:
+            index = min(opnums.index(opnum) for opnum in invalid)
+            raise ValueError("Unknown opcode '%s' at offset %d"
+                % (opcodes.opname[opnums[index]], offsets[index]))
+        starts, linenos = self._line_starts()
+        if len(starts) == 1:
+            lines = itertools.repeat(linenos[0])
+        else:
+            lines = (linenos[bisect.bisect_right(starts, offset) - 1]
+                for offset in offsets)
+        labels_at = self._labels_by_offset()
+        dispatch = self._lookup_dispatch
+        opnames = opcodes.opname
+        have_argument = opcodes.HAVE_ARGUMENT
+        for lineno, offset, opnum, argindex in zip(lines, offsets, opnums,
+                argindexes):
+            if opnum < have_argument:
+                argindex = None
+                argvalue = None
+            elif opnum in _Jrel_opcodes:
+                argvalue = offset + 3 + argindex
+            else:
+                argvalue = dispatch[opnum](self, argindex)
+            yield (lineno, offset, labels_at.get(offset, ()), opnum,
+                opnames[opnum], argindex, argvalue)
+
+    def _argvalue(self, offset, opnum, argindex):
+        """
+        Return the argument value of a decoded instruction, as reported by
+        `instructions()`.
+        """
+        if opnum < opcodes.HAVE_ARGUMENT:
+            return None
+        if opnum in _Jrel_opcodes:
+            return offset + 3 + argindex
+        return self._lookup_dispatch[opnum](self, argindex)
+
+    def reassemble(self, instructions):
+        """
+        Replace the bytecode with `instructions`, given in the (lineno,
+        offset, labels, opnum, opname, argindex, argvalue) form that
+        `instructions()` generates. Arguments are encoded again from their
+        values, so instructions may be edited, added (with an offset of
+        None) or removed. The argvalue of a jump is the offset of its
+        target as decoded, and follows that instruction to its new
+        place. EXTENDED_ARG prefixes are regenerated as needed, and the
+        line number table is rebuilt from the lineno fields.
+        """
+        instructions = [ins for ins in instructions
+            if ins[3] != opcodes.EXTENDED_ARG]
+        self._will_modify('reassemble')
+        self.co_code = bytearray()
+        self._appended_ops = log = InstructionLog(self)
+        new_offsets = {}
+        jumps = []
+        line_starts = []
+        for ins in instructions:
+            lineno, offset, labels, opnum, opname, argindex, argvalue = ins
+            here = len(self._code)
+            if offset is not None:
+                new_offsets[offset] = here
+            if lineno is not None and (not line_starts
+                    or line_starts[-1][1] != lineno):
+                line_starts.append((here, lineno))
+            if opnum in _Jump_opcodes:
+                jumps.append((here, len(log), opnum, argvalue))
+                self.append_bytecode(opnum, 0)
+                log.append(opnum, 0)
             else:
-                extended_arg = None
-            yield tpl
+                self.append(opname, argvalue)
+        for here, index, opnum, target in jumps:
+            try:
+                argindex = new_offsets[target]
+            except KeyError:
+                raise ValueError("Jump at offset %d to missing target %r"
+                    % (here, target))
+            if opnum in _Jrel_opcodes:
+                argindex -= here + 3
+            self.patch_arg(here, argindex)
+            log.set_argref(index, argindex)
+        self.co_lnotab = _encode_lnotab(self.co_firstlineno, line_starts)
+        self._last_line_start = None
+
+    def set_lineno(self, lineno):
+        """
+        Mark the next instruction appended as the start of source line
+        `lineno`.
+        """
+        if not self._modifiable or self._shared:
+            self._will_modify('set line numbers of')
+        last = self._last_line_start
+        if last is None:
+            starts, linenos = self._line_starts()
+            last = (starts[-1], linenos[-1])
+        offset = len(self._code)
+        lnotab = _encode_lnotab(last[1], [(offset - last[0], lineno)])
+        if lnotab:
+            self.co_lnotab += lnotab
+            self._last_line_start = (offset, lineno)
+
+    def set_params(self, names, kwonly=()):
+        """
+        Make the local variables `names` the parameters of the code, in
+        that order: the first entries of `co_varnames`. The local
+        variables `kwonly`, if any, follow them as keyword-only
+        parameters. Instructions already appended that use local
+        variables are renumbered.
+        """
+        if not self._modifiable or self._shared:
+            self._will_modify('set parameters of')
+        names = list(names)
+        params = names + list(kwonly)
+        if len(set(params)) != len(params):
+            raise ValueError("Parameter repeated: %r" % (params, ))
+        old = list(self.co_varnames)
+        varnames = params + [name for name in old if name not in params]
+        if varnames[:len(old)] != old:
+            renumber = [varnames.index(name) for name in old]
+            local = frozenset(_oplist('haslocal'))
+            log = self._appended_ops
+            for index, opnum in enumerate(log._opnums):
+                if opnum in local:
+                    log.set_argref(index, renumber[log._argrefs[index]])
+            offsets, opnums, argindexes = self.decode()
+            for offset, opnum, argindex in zip(offsets, opnums, argindexes):
+                if opnum in local:
+                    self.patch_arg(offset, renumber[argindex])
+        self.co_varnames = varnames
+        self.co_argcount = len(names)
+        self.co_kwonlyargcount = len(params) - len(names)
+        self.co_nlocals = len(varnames)
+
+    def param_names(self):
+        """
+        Return a pair of lists: the names of the positional parameters of
+        the code, and those of its keyword-only parameters.
+        """
+        end = self.co_argcount + self.co_kwonlyargcount
+        return (list(self.co_varnames[:self.co_argcount]),
+            list(self.co_varnames[self.co_argcount:end]))
+
+    def bind_globals(self, globs):
+        """
+        Add the globals in `bindings` to the dict `globs`. Return `globs`.
+        """
+        globs.update(self.bindings)
+        return globs
+
+    def bind_constants(self, fn, globs):
+        """
+        Set the defaults of the hidden keyword-only parameters of
+        function `fn`, made from this code with globals `globs`, to the
+        current values of the constant globals they stand for. Return
+        `fn`.
+
+        A function keeps the values it was made with. After changing one
+        of those globals, call `fn.rebind_constants()` to bind it again.
+        """
+        if not self.constant_globals:
+            return fn
+        names = tuple(self.constant_globals)
+        def rebind_constants():
+            fn.__kwdefaults__ = dict((Constant_prefix + name,
+                _lookup_global(globs, name)) for name in names)
+        rebind_constants()
+        fn.rebind_constants = rebind_constants
+        return fn
 
     def to_function(self, globs=None, name=None, argvals=None, closure=None):
         if globs is None:
-            globs = globals()
+            globs = dict(globals()) if self.bindings else globals()
+        self.bind_globals(globs)
         code = self.compile()
-        return types.FunctionType(code, globs, name, argvals, closure)
+        fn = types.FunctionType(code, globs, name, argvals, closure)
+        if argvals is None:
+            self.bind_constants(fn, globs)
+        return fn
 
-_Match_line_re = re.compile(
-    r'\s* (?P<lineno> \d+ )? \s* (?P<offset> \d+ )?' \
-    r'\s* (?P<opname> [A-Z]\w* )' \
-    r'\s* ( (?P<argindex> \d+ )' \
-        r'\s* (?: \( (?P<argvalue> [^)]* ) \) )? )?',
-    re.X)
+def _stack_effect(opnum, arg, jump):
+    try:
+        return opcodes.stack_effect(opnum, arg, jump=jump)
+    except TypeError:
+        # Before Python 3.6 `opcodes` is the running Python's `opcode`,
+        # with no `jump`; the effect given is the larger of the two.
+        return opcodes.stack_effect(opnum, arg)
 
-def instructions_match(co, text):
+def _lookup_global(globs, name):
     """
-    Determine if a CodeObject's instruction stream matches a list of
-    Python opcodes. Return True if the instructions match. Raise an
-    exception if an error or mismatch occurs.
+    Return the value of global `name`, looked up as LOAD_GLOBAL would.
     """
-    def assert_match(wanted, got, field, line):
-        if wanted is None:
-            return
-        if wanted.isdigit():
-            wanted = int(wanted)
-        if wanted != got:
-            raise ValueError("Mismatch in '%s' at line '%s': %s != %s" \
-                % (field, line, wanted, got))
-    instr = co.instructions()
+    try:
+        return globs[name]
+    except KeyError:
+        try:
+            return getattr(builtins, name)
+        except AttributeError:
+            raise NameError("name '%s' is not defined" % name)
+
+class CallSequence:
+    """
+    Appends a function call to a CodeObject, in the calling convention
+    of the running Python. Append the instructions that push the
+    function, then for each argument call `positional()` or
+    `keyword(name)` and append the instructions that push its value,
+    and then call `finish()`. Keyword arguments follow the positional
+    ones.
+
+    Calls that break the rules, or pass more arguments than the running
+    Python allows, raise ValueError.
+    """
+
+    def __init__(self, co):
+        self.co = co
+        self.npos = 0
+        self.names = []
+        self.star = False
+
+    def positional(self):
+        if self.names:
+            raise ValueError("Positional argument after keyword argument")
+        self.npos += 1
+
+    def keyword(self, name):
+        if not self.names:
+            self._end_positional()
+        if name in self.names:
+            raise ValueError("Keyword argument repeated: %s" % name)
+        if Packed_calls:
+            self.co.append('LOAD_CONST', name)
+        self.names.append(name)
+
+    def _end_positional(self):
+        if self.npos > Max_call_args:
+            if Packed_calls:
+                raise ValueError("Too many positional arguments (%d)"
+                    % self.npos)
+            # Collect them in a tuple, for CALL_FUNCTION_EX.
+            self.co.append('BUILD_TUPLE', self.npos)
+            self.star = True
+
+    def finish(self):
+        if not self.names:
+            self._end_positional()
+        co = self.co
+        nkw = len(self.names)
+        if Packed_calls:
+            if nkw > Max_call_args:
+                raise ValueError("Too many keyword arguments (%d)" % nkw)
+            co.append('CALL_FUNCTION', self.npos | (nkw << 8))
+        elif self.star:
+            flags = 0
+            if nkw:
+                co.append('LOAD_CONST', tuple(self.names))
+                co.append('BUILD_CONST_KEY_MAP', nkw)
+                flags = 1
+            co.append('CALL_FUNCTION_EX', flags)
+        elif nkw:
+            co.append('LOAD_CONST', tuple(self.names))
+            co.append('CALL_FUNCTION_KW', self.npos + nkw)
+        else:
+            co.append('CALL_FUNCTION', self.npos)
+
+_Match_line_re = None
+"""
+Regex for one line of an `instructions_match` listing. It is compiled on
+first use, so that importing this module does not import `re`.
+"""
+
+def _match_line(line):
+    global _Match_line_re
+    if _Match_line_re is None:
+        import re
+        _Match_line_re = re.compile(
+            r'\s* (?P<lineno> \d+ )? \s* (?P<offset> \d+ )?' \
+            r'\s* (?P<opname> [A-Z]\w* )' \
+            r'\s* (?P<argindex> \d+ )?' \
+            r'\s* (?: \( (?P<argvalue> [^)]* ) \) )?',
+            re.X)
+    return _Match_line_re.match(line)
+
+Expectations_size = 128
+""" Number of parsed `instructions_match` listings that are kept.  """
+
+@functools.lru_cache(maxsize=Expectations_size)
+def _compile_expectations(text):
+    """
+    Parse an expected instruction listing into a tuple with one entry per
+    non-blank line: (line, offset, opnum, opname, argindex, argvalue).
+    Fields the line leaves out are None, and unquoted numbers are
+    converted to `int`. The most recent results are cached, so a listing
+    that is checked again is not parsed again.
+    """
+    expectations = []
     for line in text.splitlines():
         line = line.strip()
         if line == '':
             continue
-        m = _Match_line_re.match(line)
+        m = _match_line(line)
         if not m:
             raise ValueError("Unparseable format in line: '%s'" % line)
-        match = m.groupdict()
-        try:
-            (lineno, offset, labels, opnum, opname, argindex, argvalue) \
-                = next(instr)
-        except StopIteration:
-            raise ValueError("Reached end of bytecode at line '%s'" \
-                % line)
-        assert_match(match['offset'], offset, 'offset', line)
-        assert_match(match['opname'], opname, 'opname', line)
-        assert_match(match['argindex'], argindex, 'argindex', line)
-        if match['argvalue'] is not None:
-            mval = match['argvalue']
-            if mval.startswith('"') or mval.startswith("'"):
-                mval = mval[1:-1]
-            assert_match(mval, argvalue, 'argvalue', line)
-    # If we run out of lines, return True.
+        offset, opname, argindex, argvalue = m.group('offset', 'opname',
+            'argindex', 'argvalue')
+        if offset is not None:
+            offset = int(offset)
+        if argindex is not None:
+            argindex = int(argindex)
+        if argvalue is not None:
+            if argvalue[:1] in ('"', "'"):
+                argvalue = argvalue[1:-1]
+            elif argvalue.isdigit():
+                argvalue = int(argvalue)
+        expectations.append((line, offset, opcodes.opmap.get(opname, -1),
+            opname, argindex, argvalue))
+    return tuple(expectations)
+
+def _format_instruction(offset, opname, argindex, argvalue):
+    """
+    Format the fields of an instruction as a listing line, leaving out
+    any that are None.
+    """
+    fields = [] if offset is None else [str(offset)]
+    fields.append(opname)
+    if argindex is not None:
+        fields.append(str(argindex))
+    if argvalue is not None:
+        fields.append('(%s)' % (argvalue, ))
+    return ' '.join(fields)
+
+def _listing_diff(co, expectations, decoded):
+    """
+    Return a unified diff between the expected listing and the decoded
+    instructions. Each instruction shows the fields its expected line
+    gives, so only real differences appear.
+    """
+    offsets, opnums, argindexes = decoded
+    wanted = []
+    got = []
+    for i, expectation in enumerate(expectations):
+        line, offset, opnum, opname, argindex, argvalue = expectation
+        wanted.append(_format_instruction(offset, opname, argindex,
+            argvalue))
+        if i >= len(offsets):
+            continue
+        got_argindex = None if opnums[i] < opcodes.HAVE_ARGUMENT \
+            else argindexes[i]
+        got_argvalue = co._argvalue(offsets[i], opnums[i], argindexes[i])
+        got.append(_format_instruction(
+            None if offset is None else offsets[i],
+            opcodes.opname[opnums[i]],
+            None if argindex is None else got_argindex,
+            None if argvalue is None else got_argvalue))
+    import difflib
+    diff = difflib.unified_diff(wanted, got, 'expected', 'got', lineterm='')
+    return '\n'.join(diff)
+
+def instructions_match(co, text):
+    """
+    Determine if a CodeObject's instruction stream matches a list of
+    Python opcodes. Return True if the instructions match. Raise a
+    ValueError showing a diff of the listings if an error or mismatch
+    occurs. Instructions after the end of the list are not checked.
+    """
+    expectations = _compile_expectations(text)
+    decoded = co.decode()
+    offsets, opnums, argindexes = decoded
+    if len(expectations) > len(offsets):
+        raise ValueError("Reached end of bytecode at line '%s':\n%s"
+            % (expectations[len(offsets)][0],
+                _listing_diff(co, expectations, decoded)))
+    have_argument = opcodes.HAVE_ARGUMENT
+    for i, expectation in enumerate(expectations):
+        line, offset, opnum, opname, argindex, argvalue = expectation
+        if (opnum != opnums[i]
+                or offset is not None and offset != offsets[i]
+                or argindex is not None and (opnum < have_argument
+                    or argindex != argindexes[i])
+                or argvalue is not None and argvalue != co._argvalue(
+                    offsets[i], opnum, argindexes[i])):
+            raise ValueError("Mismatch at line '%s':\n%s"
+                % (line, _listing_diff(co, expectations, decoded)))
     return True
 
 #EOF
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    ch04.cse
+    ~~~~~~~~
+
+    Common subexpression elimination for straight-line programs. In
+
+        a=(b+c)*(b+c);za+(b+c)
+
+    `b+c` is computed three times. The pass computes it once, keeps it
+    in a hidden local (`_t0`) with DUP_TOP and STORE_FAST, and loads
+    the local where it is needed again.
+
+    Two sub-trees are the same value when they have the same shape and
+    read the same versions of the same variables: assigning a variable
+    starts a new version of it. Calls are not shared, since they may
+    have side effects, and a call may change any global, so reads of
+    globals after a call are new values too. Calls to functions declared
+    pure (see `ch04.purity`) are the exception.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+from . import tree
+from .bytecode import CodeObject
+
+Temp_prefix = '_t'
+""" Prefix of hidden locals. Source identifiers cannot start with '_'.  """
+
+def optimize(co, pure=frozenset()):
+    """
+    Return a new CodeObject holding the program in CodeObject `co` with
+    common subexpressions eliminated. Calls to the global functions
+    named in `pure` may be shared.
+    """
+    new = CodeObject()
+    new.co_name = co.co_name
+    new.co_filename = co.co_filename
+    new.co_firstlineno = co.co_firstlineno
+    new.metrics = co.metrics
+    new.bindings.update(co.bindings)
+    new.set_params(*co.param_names())
+    new.constant_globals = list(co.constant_globals)
+    tree.emit(new, eliminate(tree.lower(co), pure))
+    return new
+
+def eliminate(statements, pure=frozenset()):
+    """
+    Return `statements` with each repeated pure sub-tree computed once,
+    where sharing it saves instructions. Calls to the global functions
+    named in `pure` count as pure.
+    """
+    numbering = _Numbering(pure)
+    for stmt in statements:
+        numbering.number_statement(stmt)
+    shared = numbering.shared()
+    if not shared:
+        return list(statements)
+    rewriter = _Rewriter(numbering, shared)
+    result = [rewriter.rewrite_statement(stmt) for stmt in statements]
+    return _drop_unused(result)
+
+class _Numbering:
+    """
+    Gives every node of a program, in evaluation order, a key that is
+    equal for nodes that compute the same value, or None for nodes
+    whose value cannot be shared.
+    """
+
+    def __init__(self, pure):
+        self.pure = pure
+        self.keys = []          # Key of each node, in pre-order.
+        self.ends = []          # Index just past each node's sub-tree.
+        self.sizes = []         # Instruction count of each sub-tree.
+        self.counts = {}
+        self.versions = {}
+        self.epoch = 0
+
+    def number_statement(self, stmt):
+        self.number(stmt[-1])
+        if stmt[0] == 'store':
+            self.versions[stmt[1]] = self.versions.get(stmt[1], 0) + 1
+
+    def number(self, node):
+        """
+        Number `node` and its children. Return (key, size).
+        """
+        index = len(self.keys)
+        self.keys.append(None)
+        self.ends.append(None)
+        self.sizes.append(None)
+        kind = node[0]
+        if kind == 'const':
+            key, size = ('const', type(node[1]), node[1]), 1
+        elif kind == 'load':
+            key = ('load', node[1], self.versions.get(node[1], 0))
+            if node[2] == 'global':
+                key += (self.epoch, )
+            size = 1
+        elif kind == 'binary':
+            left, left_size = self.number(node[2])
+            right, right_size = self.number(node[3])
+            key = None if left is None or right is None \
+                else ('binary', node[1], left, right)
+            size = left_size + right_size + 1
+        elif kind == 'unary':
+            operand, size = self.number(node[2])
+            key = None if operand is None else ('unary', node[1], operand)
+            size += 1
+        elif kind == 'call':
+            func, size = self.number(node[1])
+            values = [func]
+            for arg in node[2]:
+                arg, arg_size = self.number(arg)
+                values.append(arg)
+                size += arg_size
+            names = []
+            for name, value in node[3]:
+                value, value_size = self.number(value)
+                names.append(name)
+                values.append(value)
+                size += value_size + 1
+            size += 1
+            key = None
+            if node[1][0] == 'load' and node[1][1] in self.pure:
+                if None not in values:
+                    key = ('call', tuple(names)) + tuple(values)
+            else:
+                self.epoch += 1
+        else:
+            raise ValueError("Cannot number tree %r" % (kind, ))
+        self.keys[index] = key
+        self.ends[index] = len(self.keys)
+        self.sizes[index] = size
+        if key is not None and kind in ('binary', 'unary', 'call'):
+            self.counts[key] = self.counts.get(key, 0) + 1
+        return key, size
+
+    def shared(self):
+        """
+        Return the set of keys worth sharing: computing the value once
+        and loading it `n - 1` times must save more than the DUP_TOP and
+        STORE_FAST it costs.
+        """
+        sizes = dict(zip(self.keys, self.sizes))
+        return set(key for key, count in self.counts.items()
+            if (count - 1) * (sizes[key] - 1) > 2)
+
+class _Rewriter:
+    """
+    Rebuilds a numbered program, turning the first occurrence of each
+    shared value into a 'tee' and later ones into loads of its local.
+    """
+
+    def __init__(self, numbering, shared):
+        self.numbering = numbering
+        self.shared = shared
+        self.index = 0
+        self.temps = {}
+
+    def rewrite_statement(self, stmt):
+        return stmt[:-1] + (self.rewrite(stmt[-1]), )
+
+    def rewrite(self, node):
+        index = self.index
+        key = self.numbering.keys[index]
+        if key in self.temps:
+            self.index = self.numbering.ends[index]
+            return ('load', self.temps[key], 'fast')
+        self.index += 1
+        kind = node[0]
+        if kind == 'binary':
+            node = ('binary', node[1], self.rewrite(node[2]),
+                self.rewrite(node[3]))
+        elif kind == 'unary':
+            node = ('unary', node[1], self.rewrite(node[2]))
+        elif kind == 'call':
+            node = ('call', self.rewrite(node[1]),
+                tuple(self.rewrite(arg) for arg in node[2]),
+                tuple((name, self.rewrite(value)) for name, value in node[3]))
+        if key in self.shared:
+            name = '%s%d' % (Temp_prefix, len(self.temps))
+            self.temps[key] = name
+            node = ('tee', name, node)
+        return node
+
+def _drop_unused(statements):
+    """
+    Replace tees whose local is never loaded, which happens when every
+    later occurrence was inside a larger shared value, by their value.
+    """
+    loaded = set(node[1] for stmt in statements for node in tree.walk(stmt)
+        if node[0] == 'load' and node[2] == 'fast')
+    def strip(node):
+        kind = node[0]
+        if kind == 'tee':
+            value = strip(node[2])
+            return node[:2] + (value, ) if node[1] in loaded else value
+        elif kind == 'binary':
+            return node[:2] + (strip(node[2]), strip(node[3]))
+        elif kind == 'unary':
+            return node[:2] + (strip(node[2]), )
+        elif kind == 'call':
+            return ('call', strip(node[1]),
+                tuple(strip(arg) for arg in node[2]),
+                tuple((name, strip(value)) for name, value in node[3]))
+        return node
+    return [stmt[:-1] + (strip(stmt[-1]), ) for stmt in statements]
@@ -12,7 +12,6 @@
 """
 import sys
 import io
-import pdb
 
 from . import bytecode
 
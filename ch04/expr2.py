@@ -12,9 +12,10 @@
 """
 import sys
 import io
-import pdb
+import time
 
 from . import bytecode
+from . import instrument
 
 ##### Error handling
 
@@ -118,24 +119,188 @@ def emit(op, arg=None):
 
 ##### Processing
 
-def init(inp=None, out=None, err=None):
-    global _Code, _Input, _Error
+_Metrics = None
+""" Optional `instrument.Metrics` that the compiler reports into.  """
+
+_Source = None
+""" RecordingInput that source spans are measured against, or None.  """
+
+_Span = None
+""" (lineno, start offset) of the statement being compiled.  """
+
+_Constants = frozenset()
+""" Global names declared constant for the program being compiled.  """
+
+def init(inp=None, out=None, err=None, metrics=None, spans=False):
+    """
+    Prepare to compile from `inp`. If `metrics` is given, the compiler
+    records its phase timings and counters there. If `spans` is true,
+    each statement is given its own line number in the code object, and
+    its source span is recorded in `source_spans`.
+    """
+    global _Code, _Input, _Error, _Metrics, _Source
+    _Metrics = metrics
+    if metrics is not None:
+        start = time.perf_counter()
     _Error = err if err is not None else sys.stderr
     _Input = inp if inp is not None else _Input
+    while isinstance(_Input, instrument.InputWrapper):
+        _Input = _Input.stream
+    _Source = None
+    if spans:
+        _Input = _Source = instrument.RecordingInput(_Input)
+    if metrics is not None:
+        _Input = instrument.TimedInput(_Input, metrics)
     # 'prime the pump' to read first character, etc.
     get_char()
     _Code = bytecode.CodeObject()
-    _Is_lvalue = False
+    _Code.metrics = metrics
+    if metrics is not None:
+        metrics.add_time('init', time.perf_counter() - start)
+
+def compile(optimize=False, pure=None, params=None, infer_params=False,
+        constants=()):
+    """
+    Compile the program. Return a CodeObject. If `optimize` is true,
+    common subexpressions are eliminated (see `ch04.cse`). `pure` may
+    be a dict mapping names to functions that are declared pure (see
+    `ch04.purity`). Source spans are not kept by either optimisation.
+
+    `params` may be a list of local names that become the parameters of
+    the compiled function, in that order. If `infer_params` is true, the
+    locals the program reads before assigning them become parameters
+    too, in alphabetical order after those in `params`.
+
+    `constants` may name globals that the program never changes. They
+    are read from hidden keyword-only parameters instead, whose
+    defaults are bound to the globals' values when a function is made
+    from the code (see `CodeObject.bind_constants`).
+    """
+    global _Code, _Constants
+    _Constants = frozenset(constants)
+    if params is not None:
+        for name in params:
+            if not name.isalpha() or is_global(name):
+                raise ValueError("Parameter %r is not a local name"
+                    % (name, ))
+        _Code.set_params(params)
+    if _Metrics is not None:
+        with _Metrics.timer('parse'):
+            _compile()
+        _Code.report_metrics(_Metrics)
+        _Metrics.count('compiles')
+    else:
+        _compile()
+    if _Source is not None:
+        _Code.source = _Source.text()
+    params = list(_Code.co_varnames[:_Code.co_argcount])
+    if infer_params:
+        params.extend(name for name in free_locals(_Code)
+            if name not in params
+            and not name.startswith(bytecode.Constant_prefix))
+    _Code.constant_globals = [name for name in sorted(_Constants)
+        if bytecode.Constant_prefix + name in _Code.co_varnames]
+    hidden = [bytecode.Constant_prefix + name
+        for name in _Code.constant_globals]
+    if params or hidden:
+        _Code.set_params(params, hidden)
+    if pure or optimize:
+        from . import cse, purity
+        if pure:
+            _Code = purity.optimize(_Code, pure)
+        if optimize:
+            _Code = cse.optimize(_Code, purity.pure_names(_Code))
+    return _Code
 
-def compile():
+# The other backends are imported when first used, so that they add
+# nothing to the start-up time of programs that do not use them.
+
+def _ast_backend(co, globs):
+    from . import astgen
+    return astgen.to_function(co, globs)
+
+def _source_backend(co, globs):
+    from . import pysource
+    return pysource.to_function(co, globs)
+
+def _vm_backend(co, globs):
+    from . import vm
+    return vm.to_function(co, globs)
+
+Backends = {
+    'bytecode': lambda co, globs: co.to_function(globs=globs),
+    'ast': _ast_backend,
+    'source': _source_backend,
+    'vm': _vm_backend,
+}
+"""
+Functions that turn a compiled CodeObject into a Python function, keyed
+by name. Each is called as `backend(co, globs)`.
+"""
+
+def compile_function(globs=None, backend='vm'):
+    """
+    Compile the program and return it as a function with globals
+    `globs`, built by the backend named `backend`.
+    """
+    return Backends[backend](compile(), globs)
+
+def free_locals(co):
+    """
+    Return a sorted list of the local names that the program in
+    CodeObject `co` reads before it assigns them.
+    """
+    assigned = set()
+    free = set()
+    for opname, opnum, arg in co._appended_ops:
+        if opname == 'STORE_FAST':
+            assigned.add(arg)
+        elif opname == 'LOAD_FAST' and arg not in assigned:
+            free.add(arg)
+    return sorted(free)
+
+def _compile():
     while Peek is not None and Peek != 'z':
+        begin_statement()
         stmt_assignment()
+        end_statement()
         match(';')
 
     if Peek is None:
         expected('Return Expression')
+    begin_statement()
     stmt_return()
-    return _Code
+    end_statement()
+
+def source_offset():
+    """
+    Return the offset in the source text of the look-ahead character.
+    """
+    return _Source.position - (1 if Peek is not None else 0)
+
+def begin_statement():
+    """
+    When recording source spans, start a new line in the code object for
+    the statement about to be compiled.
+    """
+    global _Span
+    if _Source is None:
+        return
+    lineno = _Code.co_firstlineno + len(_Code.source_spans)
+    _Code.set_lineno(lineno)
+    _Span = (lineno, source_offset())
+
+def end_statement():
+    if _Source is None:
+        return
+    lineno, start = _Span
+    _Code.source_spans[lineno] = (start, source_offset())
+
+def emit_load_global(varname):
+    if varname in _Constants:
+        emit('LOAD_FAST', bytecode.Constant_prefix + varname)
+    else:
+        emit('LOAD_GLOBAL', varname)
 
 def emit_store_var(varname):
     opcode = 'STORE_GLOBAL' if is_global(varname) else 'STORE_FAST'
@@ -146,8 +311,8 @@ def expr_add():
     expr_mulop()
     emit('BINARY_ADD')
 
-def expr_addop():
-    expr_mulop()
+def expr_addop(varname=None):
+    expr_mulop(varname)
     while Peek is not None and Peek in "+-":
         if Peek == "+":
             expr_add()
@@ -156,8 +321,33 @@ def expr_addop():
         else:
             expected('AddOp')
 
-def expr_atom():
-    if Peek == '(':
+def expr_argument(call, funcname):
+    """
+    Compile one argument of a call: `name=expression` for a keyword
+    argument, or an expression. An identifier is read before it is known
+    which, so it is passed on to the expression.
+    """
+    varname = None
+    if Peek is not None and Peek.isalpha():
+        varname = get_identifier()
+        if Peek == '=':
+            match('=')
+            try:
+                call.keyword(varname)
+            except ValueError as e:
+                abort("%s in call to '%s'" % (e, funcname))
+            expression()
+            return
+    try:
+        call.positional()
+    except ValueError as e:
+        abort("%s in call to '%s'" % (e, funcname))
+    expression(varname)
+
+def expr_atom(varname=None):
+    if varname is not None:
+        expr_read_var(varname)
+    elif Peek == '(':
         match('(')
         expression()
         match(')')
@@ -172,8 +362,23 @@ def expr_divide():
     expr_unary()
     emit('BINARY_FLOOR_DIVIDE')
 
-def expr_mulop():
-    expr_unary()
+def expr_call(funcname):
+    match('(')
+    emit_load_global(funcname)
+    call = bytecode.CallSequence(_Code)
+    if Peek != ')':
+        expr_argument(call, funcname)
+        while Peek == ',':
+            match(',')
+            expr_argument(call, funcname)
+    match(')')
+    try:
+        call.finish()
+    except ValueError as e:
+        abort("%s in call to '%s'" % (e, funcname))
+
+def expr_mulop(varname=None):
+    expr_unary(varname)
     while Peek is not None and Peek in "*/":
         if Peek == "*":
             expr_multiply()
@@ -187,22 +392,13 @@ def expr_multiply():
     expr_unary()
     emit('BINARY_MULTIPLY')
 
-def expr_read_var():
-    varname = get_identifier()
+def expr_read_var(varname=None):
+    if varname is None:
+        varname = get_identifier()
     if Peek == '(':
-        match('(')
-        emit('LOAD_GLOBAL', varname)
-        pos_args = kw_args = 0
-        match(')')
-        if pos_args >= 256:
-            abort("Too many positional arguments (%d) in call to '%s'"
-                    % (pos_args, varname))
-        if kw_args >= 256:
-            abort("Too many keyword arguments (%d) in call to '%s'"
-                    % (kw_args, varname))
-        emit('CALL_FUNCTION', pos_args | (kw_args << 8))
+        expr_call(varname)
     elif is_global(varname):
-        emit('LOAD_GLOBAL', varname)
+        emit_load_global(varname)
     else:
         emit('LOAD_FAST', varname)
 
@@ -211,8 +407,10 @@ def expr_subtract():
     expr_mulop()
     emit('BINARY_SUBTRACT')
 
-def expr_unary():
-    if Peek is not None and Peek in "+-":
+def expr_unary(varname=None):
+    if varname is not None:
+        expr_atom(varname)
+    elif Peek is not None and Peek in "+-":
         if Peek == "+":
             expr_unary_plus()
         elif Peek == "-":
@@ -231,14 +429,20 @@ def expr_unary_plus():
     match('+')
     expr_atom()
 
-def expression():
-    expr_addop()
+def expression(varname=None):
+    """
+    Compile an expression. If its first identifier has already been read,
+    it is passed as `varname`.
+    """
+    expr_addop(varname)
 
 def is_global(name):
     return name[0].isupper()
 
 def stmt_assignment():
     lvalue = get_identifier()
+    if lvalue in _Constants:
+        abort("Cannot assign to constant '%s'" % lvalue)
     match('=')
     expression()
     emit_store_var(lvalue)
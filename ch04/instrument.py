@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    ch04.instrument
+    ~~~~~~~~~~~~~~~
+
+    Opt-in timing and counters for the compiler. Pass a `Metrics` object
+    to `ch04.expr2.init` and the compiler reports into it: wall time per
+    phase, characters read, instructions emitted, table sizes and table
+    lookups that reused an existing entry. When no `Metrics` object is
+    given nothing is recorded, and the only cost is a few `is None`
+    tests per compile.
+
+    The phases are `init`, `parse` and `codetype` (building the CodeType
+    in `CodeObject.compile`). Time spent reading input is recorded as
+    `read`; it overlaps the `init` and `parse` phases that do the reading.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import os
+import time
+
+class Metrics:
+    """
+    Accumulates phase timings, counters and gauges across any number of
+    compiles. Counters and gauges are keyed by name and an optional set
+    of labels.
+    """
+
+    def __init__(self, prefix='lbac_'):
+        self.prefix = prefix
+        self.seconds = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def add_time(self, phase, seconds):
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+
+    def count(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.gauges[key] = value
+
+    def timer(self, phase):
+        """
+        Return a context manager that adds the time spent inside it to
+        `phase`.
+        """
+        return _PhaseTimer(self, phase)
+
+    def to_prometheus(self):
+        """
+        Return the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        name = self.prefix + 'phase_seconds_total'
+        lines.append('# HELP %s Wall time spent in each compiler phase.'
+            % name)
+        lines.append('# TYPE %s counter' % name)
+        for phase in sorted(self.seconds):
+            lines.append('%s{phase="%s"} %r' % (name, phase,
+                self.seconds[phase]))
+        for kind, values in (('counter', self.counters),
+                ('gauge', self.gauges)):
+            typed = set()
+            for (name, labels) in sorted(values):
+                full_name = self.prefix + name
+                if kind == 'counter':
+                    full_name += '_total'
+                if full_name not in typed:
+                    typed.add(full_name)
+                    lines.append('# TYPE %s %s' % (full_name, kind))
+                lines.append('%s%s %r' % (full_name, _format_labels(labels),
+                    values[(name, labels)]))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """
+        Write the metrics to `path` in the Prometheus text format, for the
+        node exporter's textfile collector. The file is replaced
+        atomically, so a scrape never sees it half-written.
+        """
+        temp = '%s.%d.tmp' % (path, os.getpid())
+        with open(temp, 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(temp, path)
+
+class _PhaseTimer:
+
+    def __init__(self, metrics, phase):
+        self.metrics = metrics
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.add_time(self.phase, time.perf_counter() - self.start)
+        return False
+
+class InputWrapper:
+    """
+    Base class for input streams wrapped by the compiler. The original
+    stream is available as `stream`.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+    def readable(self):
+        return self.stream.readable()
+
+class TimedInput(InputWrapper):
+    """
+    Wrap an input stream, recording the time spent reading it and the
+    number of characters read.
+    """
+
+    def __init__(self, stream, metrics):
+        super().__init__(stream)
+        self._metrics = metrics
+
+    def read(self, size=-1):
+        start = time.perf_counter()
+        data = self.stream.read(size)
+        self._metrics.add_time('read', time.perf_counter() - start)
+        self._metrics.count('chars_read', len(data))
+        return data
+
+class RecordingInput(InputWrapper):
+    """
+    Wrap an input stream, keeping the text read so far and the position
+    of the next character, so that source spans can be reported.
+    """
+
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.position = 0
+        self._chunks = []
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self._chunks.append(data)
+        self.position += len(data)
+        return data
+
+    def text(self):
+        """Return the text read so far."""
+        text = ''.join(self._chunks)
+        self._chunks = [text]
+        return text
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\',
+        '\\\\').replace('"', '\\"')) for name, value in labels)
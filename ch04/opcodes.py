@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    ch04.opcodes
+    ~~~~~~~~~~~~
+
+    The opcode table that `ch04.bytecode` writes instructions with, in
+    the shape of the standard `opcode` module: `opmap`, `opname`,
+    `HAVE_ARGUMENT`, `EXTENDED_ARG`, `cmp_op`, the `has...` lists and
+    `stack_effect`.
+
+    Before Python 3.6, CPython runs the code objects written, so this is
+    the running Python's own `opcode` module. From 3.6, the code is run
+    by `ch04.vm` instead (see `bytecode.Wordcode`), and the opcode
+    numbers of the running Python no longer matter -- later versions
+    rename and remove instructions the front end emits, such as
+    BINARY_MULTIPLY in 3.11. So from 3.6 the table is a fixed copy of
+    CPython 3.6's, the last with the instructions the front end knows.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import sys
+
+if sys.version_info < (3, 6):
+    from opcode import *
+else:
+    _Opcodes = (
+        ('POP_TOP', 1, -1), ('ROT_TWO', 2, 0), ('ROT_THREE', 3, 0),
+        ('DUP_TOP', 4, 1), ('DUP_TOP_TWO', 5, 2), ('NOP', 9, 0),
+        ('UNARY_POSITIVE', 10, 0), ('UNARY_NEGATIVE', 11, 0),
+        ('UNARY_NOT', 12, 0), ('UNARY_INVERT', 15, 0),
+        ('BINARY_MATRIX_MULTIPLY', 16, -1),
+        ('INPLACE_MATRIX_MULTIPLY', 17, -1), ('BINARY_POWER', 19, -1),
+        ('BINARY_MULTIPLY', 20, -1), ('BINARY_MODULO', 22, -1),
+        ('BINARY_ADD', 23, -1), ('BINARY_SUBTRACT', 24, -1),
+        ('BINARY_SUBSCR', 25, -1), ('BINARY_FLOOR_DIVIDE', 26, -1),
+        ('BINARY_TRUE_DIVIDE', 27, -1), ('INPLACE_FLOOR_DIVIDE', 28, -1),
+        ('INPLACE_TRUE_DIVIDE', 29, -1), ('GET_AITER', 50, 0),
+        ('GET_ANEXT', 51, 1), ('BEFORE_ASYNC_WITH', 52, 1),
+        ('INPLACE_ADD', 55, -1), ('INPLACE_SUBTRACT', 56, -1),
+        ('INPLACE_MULTIPLY', 57, -1), ('INPLACE_MODULO', 59, -1),
+        ('STORE_SUBSCR', 60, -3), ('DELETE_SUBSCR', 61, -2),
+        ('BINARY_LSHIFT', 62, -1), ('BINARY_RSHIFT', 63, -1),
+        ('BINARY_AND', 64, -1), ('BINARY_XOR', 65, -1),
+        ('BINARY_OR', 66, -1), ('INPLACE_POWER', 67, -1),
+        ('GET_ITER', 68, 0), ('GET_YIELD_FROM_ITER', 69, 0),
+        ('PRINT_EXPR', 70, -1), ('LOAD_BUILD_CLASS', 71, 1),
+        ('YIELD_FROM', 72, -1), ('GET_AWAITABLE', 73, 0),
+        ('INPLACE_LSHIFT', 75, -1), ('INPLACE_RSHIFT', 76, -1),
+        ('INPLACE_AND', 77, -1), ('INPLACE_XOR', 78, -1),
+        ('INPLACE_OR', 79, -1), ('BREAK_LOOP', 80, 0),
+        ('WITH_CLEANUP_START', 81, 1), ('WITH_CLEANUP_FINISH', 82, -1),
+        ('RETURN_VALUE', 83, -1), ('IMPORT_STAR', 84, -1),
+        ('SETUP_ANNOTATIONS', 85, 0), ('YIELD_VALUE', 86, 0),
+        ('POP_BLOCK', 87, 0), ('END_FINALLY', 88, -1),
+        ('POP_EXCEPT', 89, 0), ('STORE_NAME', 90, -1),
+        ('DELETE_NAME', 91, 0), ('UNPACK_SEQUENCE', 92, None),
+        ('FOR_ITER', 93, None), ('UNPACK_EX', 94, None),
+        ('STORE_ATTR', 95, -2), ('DELETE_ATTR', 96, -1),
+        ('STORE_GLOBAL', 97, -1), ('DELETE_GLOBAL', 98, 0),
+        ('LOAD_CONST', 100, 1), ('LOAD_NAME', 101, 1),
+        ('BUILD_TUPLE', 102, None), ('BUILD_LIST', 103, None),
+        ('BUILD_SET', 104, None), ('BUILD_MAP', 105, None),
+        ('LOAD_ATTR', 106, 0), ('COMPARE_OP', 107, -1),
+        ('IMPORT_NAME', 108, -1), ('IMPORT_FROM', 109, 1),
+        ('JUMP_FORWARD', 110, 0), ('JUMP_IF_FALSE_OR_POP', 111, None),
+        ('JUMP_IF_TRUE_OR_POP', 112, None), ('JUMP_ABSOLUTE', 113, 0),
+        ('POP_JUMP_IF_FALSE', 114, -1), ('POP_JUMP_IF_TRUE', 115, -1),
+        ('LOAD_GLOBAL', 116, 1), ('CONTINUE_LOOP', 119, 0),
+        ('SETUP_LOOP', 120, 0), ('SETUP_EXCEPT', 121, None),
+        ('SETUP_FINALLY', 122, None), ('LOAD_FAST', 124, 1),
+        ('STORE_FAST', 125, -1), ('DELETE_FAST', 126, 0),
+        ('STORE_ANNOTATION', 127, -1), ('RAISE_VARARGS', 130, None),
+        ('CALL_FUNCTION', 131, None), ('MAKE_FUNCTION', 132, None),
+        ('BUILD_SLICE', 133, None), ('LOAD_CLOSURE', 135, 1),
+        ('LOAD_DEREF', 136, 1), ('STORE_DEREF', 137, -1),
+        ('DELETE_DEREF', 138, 0), ('CALL_FUNCTION_KW', 141, None),
+        ('CALL_FUNCTION_EX', 142, None), ('SETUP_WITH', 143, None),
+        ('EXTENDED_ARG', 144, None), ('LIST_APPEND', 145, -1),
+        ('SET_ADD', 146, -1), ('MAP_ADD', 147, -2),
+        ('LOAD_CLASSDEREF', 148, 1), ('BUILD_LIST_UNPACK', 149, None),
+        ('BUILD_MAP_UNPACK', 150, None),
+        ('BUILD_MAP_UNPACK_WITH_CALL', 151, None),
+        ('BUILD_TUPLE_UNPACK', 152, None), ('BUILD_SET_UNPACK', 153, None),
+        ('SETUP_ASYNC_WITH', 154, None), ('FORMAT_VALUE', 155, None),
+        ('BUILD_CONST_KEY_MAP', 156, None), ('BUILD_STRING', 157, None),
+        ('BUILD_TUPLE_UNPACK_WITH_CALL', 158, None),
+        )
+    """
+    (name, number, stack effect) of each opcode of CPython 3.6. The
+    effect is None where it depends on the argument, or on whether a
+    jump is taken.
+    """
+
+    opmap = dict((name, opnum) for name, opnum, effect in _Opcodes)
+    opname = ['<%r>' % opnum for opnum in range(256)]
+    for name, opnum in opmap.items():
+        opname[opnum] = name
+    del name, opnum
+
+    HAVE_ARGUMENT = 90
+    EXTENDED_ARG = 144
+
+    cmp_op = ('<', '<=', '==', '!=', '>', '>=', 'in', 'not in', 'is',
+        'is not', 'exception match', 'BAD')
+
+    def _ops(*names):
+        return [opmap[name] for name in names]
+
+    hasconst = _ops('LOAD_CONST')
+    hasname = _ops('STORE_NAME', 'DELETE_NAME', 'STORE_ATTR',
+        'DELETE_ATTR', 'STORE_GLOBAL', 'DELETE_GLOBAL', 'LOAD_NAME',
+        'LOAD_ATTR', 'IMPORT_NAME', 'IMPORT_FROM', 'LOAD_GLOBAL',
+        'STORE_ANNOTATION')
+    hasjrel = _ops('FOR_ITER', 'JUMP_FORWARD', 'SETUP_LOOP',
+        'SETUP_EXCEPT', 'SETUP_FINALLY', 'SETUP_WITH', 'SETUP_ASYNC_WITH')
+    hasjabs = _ops('JUMP_IF_FALSE_OR_POP', 'JUMP_IF_TRUE_OR_POP',
+        'JUMP_ABSOLUTE', 'POP_JUMP_IF_FALSE', 'POP_JUMP_IF_TRUE',
+        'CONTINUE_LOOP')
+    haslocal = _ops('LOAD_FAST', 'STORE_FAST', 'DELETE_FAST')
+    hascompare = _ops('COMPARE_OP')
+    hasfree = _ops('LOAD_CLOSURE', 'LOAD_DEREF', 'STORE_DEREF',
+        'DELETE_DEREF', 'LOAD_CLASSDEREF')
+
+    _Fixed_effects = dict((opnum, effect)
+        for name, opnum, effect in _Opcodes if effect is not None)
+
+    _Arg_effects = {
+        'UNPACK_SEQUENCE': lambda arg: arg - 1,
+        'UNPACK_EX': lambda arg: (arg & 0xFF) + (arg >> 8),
+        'BUILD_MAP': lambda arg: 1 - 2 * arg,
+        'RAISE_VARARGS': lambda arg: -arg,
+        'CALL_FUNCTION': lambda arg: -arg,
+        'CALL_FUNCTION_KW': lambda arg: -arg - 1,
+        'CALL_FUNCTION_EX': lambda arg: -1 - (arg & 0x01),
+        'MAKE_FUNCTION': lambda arg: -1 - bin(arg & 0x0F).count('1'),
+        'BUILD_SLICE': lambda arg: -2 if arg == 3 else -1,
+        'FORMAT_VALUE': lambda arg: -1 if arg & 0x04 else 0,
+        'BUILD_CONST_KEY_MAP': lambda arg: -arg,
+    }
+    for name in ('BUILD_TUPLE', 'BUILD_LIST', 'BUILD_SET', 'BUILD_STRING',
+            'BUILD_LIST_UNPACK', 'BUILD_MAP_UNPACK',
+            'BUILD_MAP_UNPACK_WITH_CALL', 'BUILD_TUPLE_UNPACK',
+            'BUILD_SET_UNPACK', 'BUILD_TUPLE_UNPACK_WITH_CALL'):
+        _Arg_effects[name] = lambda arg: 1 - arg
+    del name
+    _Arg_effects = dict((opmap[name], effect)
+        for name, effect in _Arg_effects.items())
+
+    _Jump_effects = dict((opmap[name], effects) for name, effects in (
+        ('FOR_ITER', (-1, 1)),
+        ('JUMP_IF_FALSE_OR_POP', (0, -1)),
+        ('JUMP_IF_TRUE_OR_POP', (0, -1)),
+        ('SETUP_EXCEPT', (6, 0)),
+        ('SETUP_FINALLY', (6, 0)),
+        ('SETUP_WITH', (7, 1)),
+        ('SETUP_ASYNC_WITH', (6, 0))))
+    """
+    (if the jump is taken, if not) stack effects of each conditional
+    jump.
+    """
+
+    def stack_effect(opnum, arg=None, jump=None):
+        """
+        Return the change in stack depth made by opcode `opnum` with
+        argument `arg`, as `opcode.stack_effect` does in Python 3.8:
+        `jump` says whether a jump is taken, and if it is None the
+        larger effect is returned.
+        """
+        if opnum in _Fixed_effects:
+            return _Fixed_effects[opnum]
+        if opnum in _Jump_effects:
+            if jump is None:
+                return max(_Jump_effects[opnum])
+            return _Jump_effects[opnum][0 if jump else 1]
+        if opnum in _Arg_effects and arg is not None:
+            return _Arg_effects[opnum](arg)
+        raise ValueError("invalid opcode or oparg")
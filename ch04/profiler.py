@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    ch04.profiler
+    ~~~~~~~~~~~~~
+
+    Attributes the run time of compiled functions to the source
+    statements they came from. Compile with `expr2.init(spans=True)`, so
+    that each statement gets its own line number, then watch the
+    function and run it under the profiler:
+
+        co = expr2.compile()
+        fn = expr2.Backends['vm'](co, globs)
+        profile = Profile()
+        profile.watch(fn, co)
+        with profile:
+            fn()
+        profile.report()
+
+    Time is measured between line events, and is inclusive: a statement
+    is charged for the functions it calls. The events come from
+    `sys.settrace` for functions of the 'ast' and 'source' backends,
+    and from the VM's tracer for those it runs. Functions that are not
+    watched are not traced.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import sys
+import time
+
+from . import vm
+
+def _code_name(code):
+    """ Return the name of a CodeType or vm.Program.  """
+    return code.name if isinstance(code, vm.Program) else code.co_name
+
+class Profile:
+    """
+    Aggregates the time spent on each line of the watched functions.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.seconds = {}
+        self.hits = {}
+        self._watched = {}
+        self._frames = {}
+        self._old_trace = None
+
+    def watch(self, fn, co=None):
+        """
+        Profile calls to `fn`. If `co` is the CodeObject that `fn` was
+        built from, its `source` and `source_spans` are used to label the
+        report.
+        """
+        code = getattr(fn, 'program', None)
+        if not isinstance(code, vm.Program):
+            code = fn.__code__ if hasattr(fn, '__code__') else fn
+        self._watched[code] = co
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+    def _programs(self):
+        return [code for code in self._watched
+            if isinstance(code, vm.Program)]
+
+    def start(self):
+        for program in self._programs():
+            program.tracer = self._trace_program
+        self._old_trace = sys.gettrace()
+        sys.settrace(self._trace_call)
+
+    def stop(self):
+        sys.settrace(self._old_trace)
+        self._old_trace = None
+        for program in self._programs():
+            program.tracer = None
+        self._frames.clear()
+
+    def runcall(self, fn, *args, **kwargs):
+        """
+        Run `fn(*args, **kwargs)` under the profiler. Return its result.
+        """
+        with self:
+            return fn(*args, **kwargs)
+
+    def _charge(self, frame, now):
+        code, lineno, since = self._frames[frame]
+        key = (code, lineno)
+        self.seconds[key] = self.seconds.get(key, 0.0) + (now - since)
+
+    def _line(self, frame, code, lineno):
+        key = (code, lineno)
+        self.hits[key] = self.hits.get(key, 0) + 1
+        self._frames[frame] = (code, lineno, self.clock())
+
+    def _trace_call(self, frame, event, arg):
+        if frame.f_code not in self._watched:
+            return None
+        return self._trace_line
+
+    def _trace_line(self, frame, event, arg):
+        now = self.clock()
+        if frame in self._frames:
+            self._charge(frame, now)
+        if event == 'line':
+            self._line(frame, frame.f_code, frame.f_lineno)
+        elif event == 'return':
+            self._frames.pop(frame, None)
+        else:
+            self._frames[frame] = (frame.f_code, frame.f_lineno,
+                self.clock())
+        return self._trace_line
+
+    def _trace_program(self, frame, event, lineno):
+        # The tracer of watched VM programs; `frame` is a vm.Frame.
+        now = self.clock()
+        if frame in self._frames:
+            self._charge(frame, now)
+        if event == 'line':
+            self._line(frame, frame.program, lineno)
+        else:
+            self._frames.pop(frame, None)
+
+    def label(self, code, lineno):
+        """
+        Return the source text of line `lineno` of `code`, or a
+        description of the line if the source is not known.
+        """
+        co = self._watched.get(code)
+        if co is not None and co.source is not None \
+                and lineno in co.source_spans:
+            start, stop = co.source_spans[lineno]
+            return co.source[start:stop]
+        return '%s line %d' % (_code_name(code), lineno)
+
+    def stats(self):
+        """
+        Return a list of (seconds, hits, code, lineno), most time first.
+        `code` is the CodeType, or the vm.Program, that was running.
+        """
+        keys = set(self.seconds) | set(self.hits)
+        rows = [(self.seconds.get(key, 0.0), self.hits.get(key, 0)) + key
+            for key in keys]
+        rows.sort(key=lambda row: (-row[0], _code_name(row[2]), row[3]))
+        return rows
+
+    def report(self, out=None, limit=10):
+        """
+        Print the `limit` statements that took the most time.
+        """
+        if out is None:
+            out = sys.stdout
+        rows = self.stats()
+        total = sum(row[0] for row in rows) or 1.0
+        out.write("%10s %6s %8s  %s\n" % ('seconds', '%', 'hits',
+            'statement'))
+        for seconds, hits, code, lineno in rows[:limit]:
+            out.write("%10.6f %6.1f %8d  %s\n" % (seconds,
+                100.0 * seconds / total, hits, self.label(code, lineno)))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    ch04.purity
+    ~~~~~~~~~~~
+
+    Optimisations for calls to functions declared pure: functions whose
+    result depends only on their arguments, and that have no side
+    effects. Pure functions are declared by passing a dict mapping
+    their names to the functions to `expr2.compile(pure=...)`. Then:
+
+    * a pure call whose arguments are all constants is made at compile
+      time, and replaced by its result;
+
+    * other pure calls go through a memoising wrapper, an LRU cache
+      keyed by the arguments, which the compiled code finds under a
+      hidden global name. Each program gets wrappers of its own, so a
+      cache lives only as long as the code and globals that use it;
+
+    * common subexpression elimination (`ch04.cse`) may share repeated
+      pure calls, since running one twice cannot differ from running it
+      once.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import functools
+
+from . import tree
+from .bytecode import CodeObject
+
+Memo_prefix = '_pure_'
+""" Prefix of the hidden globals that hold memoising wrappers.  """
+
+Memo_size = 256
+""" Number of results each memoising wrapper keeps.  """
+
+Foldable_types = (int, float, str, bool, type(None))
+""" Results of these types are folded into constants.  """
+
+def memoized(fn):
+    """
+    Return a new memoising wrapper for pure function `fn`.
+    """
+    return functools.lru_cache(maxsize=Memo_size)(fn)
+
+def pure_names(co):
+    """
+    Return the set of global names that hold pure functions in
+    CodeObject `co`.
+    """
+    return frozenset(name for name in co.bindings
+        if name.startswith(Memo_prefix))
+
+def optimize(co, pure):
+    """
+    Return a new CodeObject holding the program in CodeObject `co`, with
+    calls to the functions in `pure` (a dict mapping names to functions)
+    folded or memoised.
+    """
+    new = CodeObject()
+    new.co_name = co.co_name
+    new.co_filename = co.co_filename
+    new.co_firstlineno = co.co_firstlineno
+    new.metrics = co.metrics
+    new.bindings.update(co.bindings)
+    new.set_params(*co.param_names())
+    new.constant_globals = list(co.constant_globals)
+    tree.emit(new, rewrite(tree.lower(co), pure, new.bindings))
+    return new
+
+def rewrite(statements, pure, bindings):
+    """
+    Return `statements` with calls to the functions in `pure` folded or
+    memoised. The memoising wrappers used are added to the dict
+    `bindings`, under their hidden global names. A wrapper already in
+    `bindings` for the same function is used again.
+    """
+    rewriter = _Rewriter(pure, bindings)
+    return [stmt[:-1] + (rewriter.rewrite(stmt[-1]), ) for stmt in statements]
+
+class _Rewriter:
+
+    def __init__(self, pure, bindings):
+        self.pure = pure
+        self.bindings = bindings
+
+    def rewrite(self, node):
+        kind = node[0]
+        if kind == 'binary':
+            return node[:2] + (self.rewrite(node[2]), self.rewrite(node[3]))
+        elif kind in ('unary', 'tee'):
+            return node[:2] + (self.rewrite(node[2]), )
+        elif kind != 'call':
+            return node
+        func = self.rewrite(node[1])
+        args = tuple(self.rewrite(arg) for arg in node[2])
+        keywords = tuple((name, self.rewrite(value))
+            for name, value in node[3])
+        if func[0] != 'load' or func[2] != 'global' \
+                or func[1] not in self.pure:
+            return ('call', func, args, keywords)
+        fn = self.pure[func[1]]
+        values = list(args) + [value for name, value in keywords]
+        if all(value[0] == 'const' for value in values):
+            try:
+                result = fn(*[arg[1] for arg in args],
+                    **dict((name, value[1]) for name, value in keywords))
+            except Exception:
+                # Leave the call to raise when the program runs.
+                pass
+            else:
+                if type(result) in Foldable_types:
+                    return ('const', result)
+        hidden = Memo_prefix + func[1]
+        wrapper = self.bindings.get(hidden)
+        if getattr(wrapper, '__wrapped__', None) is not fn:
+            self.bindings[hidden] = memoized(fn)
+        return ('call', ('load', hidden, 'global'), args, keywords)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    ch04.pysource
+    ~~~~~~~~~~~~~
+
+    A backend that writes a compiled program out as Python source, for
+    example
+
+        def program():
+            x = 7
+            return x * 2
+
+    and imports it from a cache directory. Each program is saved as a
+    module named after a hash of its source, so CPython's own `.pyc`
+    caching applies: the first load of a program compiles and caches
+    it, and later loads, in this process or another, import the cached
+    bytecode.
+
+    The default cache directory belongs to the user: it is made private
+    (mode 0700), and is refused if it is not, since any module in it is
+    run. A cached module whose text is not the source wanted is written
+    again before it is imported.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import hashlib
+import importlib.machinery
+import math
+import os
+import stat
+import sys
+import tempfile
+import types
+
+from . import tree
+
+Cache_dir = os.environ.get('LBAC_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'lbac-cache-%d' % os.getuid()
+        if hasattr(os, 'getuid') else 'lbac-cache'))
+"""
+Default directory for generated modules, one for each user. (Where
+there are no user ids, as on Windows, the temporary directory is the
+user's own.)
+"""
+
+_Loaded = {}
+""" Modules already imported by this process, keyed by file path.  """
+
+# Precedence of each binary operator. Unary operators bind tighter, and
+# names, constants and calls tighter still.
+_Precedence = {
+    '+': 1,
+    '-': 1,
+    '*': 2,
+    '//': 2,
+}
+_Unary_precedence = 3
+_Atom_precedence = 4
+
+def _precedence(node):
+    kind = node[0]
+    if kind == 'binary':
+        return _Precedence[node[1]]
+    elif kind == 'unary':
+        return _Unary_precedence
+    return _Atom_precedence
+
+def to_expr(node):
+    """
+    Return Python source for expression tree `node`, with only the
+    parentheses it needs.
+    """
+    kind = node[0]
+    if kind == 'const':
+        value = node[1]
+        if isinstance(value, float) and not math.isfinite(value):
+            # repr() gives inf or nan, which are not Python literals.
+            return "float('%r')" % value
+        return repr(value)
+    elif kind == 'load':
+        return node[1]
+    elif kind == 'binary':
+        prec = _Precedence[node[1]]
+        left = to_expr(node[2])
+        if _precedence(node[2]) < prec:
+            left = '(' + left + ')'
+        # Operators are left-associative, so a right operand at the same
+        # level needs parentheses too.
+        right = to_expr(node[3])
+        if _precedence(node[3]) <= prec:
+            right = '(' + right + ')'
+        return '%s %s %s' % (left, node[1], right)
+    elif kind == 'unary':
+        operand = to_expr(node[2])
+        if _precedence(node[2]) < _Unary_precedence:
+            operand = '(' + operand + ')'
+        return node[1] + operand
+    elif kind == 'tee' and sys.version_info >= (3, 8):
+        return '(%s := %s)' % (node[1], to_expr(node[2]))
+    elif kind == 'call':
+        args = [to_expr(arg) for arg in node[2]]
+        args.extend('%s=%s' % (name, to_expr(value))
+            for name, value in node[3])
+        return '%s(%s)' % (to_expr(node[1]), ', '.join(args))
+    raise ValueError("No expression form for tree %r" % (kind, ))
+
+def to_stmt(node):
+    """
+    Return Python source for statement tree `node`.
+    """
+    kind = node[0]
+    if kind == 'store':
+        return '%s = %s' % (node[1], to_expr(node[3]))
+    elif kind == 'return':
+        return 'return ' + to_expr(node[1])
+    raise ValueError("No statement form for tree %r" % (kind, ))
+
+def _function_name(co, name):
+    if name is None:
+        name = co.co_name
+    return name if name.isidentifier() else 'program'
+
+def to_source(co, name=None):
+    """
+    Return the source of a Python module defining one function, `name`
+    (by default, the name of CodeObject `co` if it is an identifier),
+    whose body is the program in `co`.
+
+    Statement `i` of the program is put on line `co.co_firstlineno + i`,
+    where the other backends and `source_spans` number it, with the
+    `def` on the line before. If `co_firstlineno` is 1 the `def` takes
+    line 1, and `to_function` moves the lines of the function's code
+    back by one.
+    """
+    statements = tree.hoist_tees(tree.lower(co))
+    params, kwonly = co.param_names()
+    lines = [''] * max(co.co_firstlineno - 2, 0)
+    lines.append('def %s(%s):' % (_function_name(co, name),
+        ', '.join(params + (['*'] + kwonly if kwonly else []))))
+    body = [to_stmt(node) for node in statements]
+    globals_ = tree.global_stores(statements)
+    if globals_:
+        # On the line of the first statement, so as not to move it.
+        body[0] = 'global %s; %s' % (', '.join(globals_), body[0])
+    lines.extend('    ' + stmt for stmt in body)
+    unbound = tree.unbound_locals(statements, params + kwonly)
+    if unbound:
+        lines.append('    # Never runs: makes locals that are read before '
+            'assignment local.')
+        lines.extend('    %s = None' % varname for varname in unbound)
+    return '\n'.join(lines) + '\n'
+
+def _with_firstlineno(code, firstlineno):
+    """
+    Return CodeType `code` with its lines numbered from `firstlineno`.
+    """
+    if hasattr(code, 'replace'):
+        return code.replace(co_firstlineno=firstlineno)
+    # Before Python 3.8 there is no replace().
+    return types.CodeType(code.co_argcount, code.co_kwonlyargcount,
+        code.co_nlocals, code.co_stacksize, code.co_flags, code.co_code,
+        code.co_consts, code.co_names, code.co_varnames, code.co_filename,
+        code.co_name, firstlineno, code.co_lnotab, code.co_freevars,
+        code.co_cellvars)
+
+def _import(name, path):
+    loader = importlib.machinery.SourceFileLoader(name, path)
+    try:
+        from importlib.util import module_from_spec, spec_from_loader
+    except ImportError:
+        # Python 3.3 has neither; load_module() does the same job.
+        return loader.load_module()
+    module = module_from_spec(spec_from_loader(name, loader))
+    loader.exec_module(module)
+    return module
+
+def _private_dir(path):
+    """
+    Make directory `path`, readable and writable only by this user,
+    unless it exists. Raise PermissionError if it is not a directory
+    that belongs to this user and is closed to others.
+    """
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or hasattr(os, 'getuid') and (
+            info.st_uid != os.getuid() or info.st_mode & 0o077):
+        raise PermissionError("Cache directory %s is not private to this "
+            "user" % path)
+
+def _cached(path, source):
+    """
+    Return True if file `path` holds `source`.
+    """
+    try:
+        with open(path) as f:
+            return f.read() == source
+    except FileNotFoundError:
+        return False
+
+def load(source, cache_dir=None):
+    """
+    Save module `source` in `cache_dir` (by default, `Cache_dir`, which
+    must be private to the user) unless it is already there, and import
+    it. Return the module. A directory given as `cache_dir` is trusted:
+    others must not be able to write to it.
+    """
+    if cache_dir is None:
+        cache_dir = Cache_dir
+        _private_dir(cache_dir)
+    name = 'lbac_' + hashlib.sha1(source.encode('utf8')).hexdigest()
+    path = os.path.join(cache_dir, name + '.py')
+    try:
+        return _Loaded[path]
+    except KeyError:
+        pass
+    if not _cached(path, source):
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, 0o700, exist_ok=True)
+        # Write under a temporary name, so that another process never
+        # imports a half-written file.
+        temp = '%s.%d.tmp' % (path, os.getpid())
+        with open(temp, 'w') as f:
+            f.write(source)
+        os.replace(temp, path)
+    module = _import(name, path)
+    _Loaded[path] = module
+    return module
+
+def to_function(co, globs=None, name=None, cache_dir=None):
+    """
+    Compile the program in CodeObject `co` through Python source, and
+    return it as a function with globals `globs` (by default, a new
+    empty dict).
+    """
+    globs = co.bind_globals({} if globs is None else globs)
+    fn_name = _function_name(co, name)
+    module = load(to_source(co, fn_name), cache_dir)
+    code = getattr(module, fn_name).__code__
+    if code.co_firstlineno != co.co_firstlineno - 1:
+        code = _with_firstlineno(code, co.co_firstlineno - 1)
+    return co.bind_constants(types.FunctionType(code, globs, fn_name), globs)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4
+"""
+    ch04.tests.astgen_tests
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Specifies the behavior of the statement trees and the ast backend.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import ast
+import io
+import unittest
+
+from ch04 import astgen, expr2, tree
+from ch04.bytecode import CodeObject
+
+class TestTree(unittest.TestCase):
+
+    def test_lower(self):
+        expr2.init(inp=io.StringIO('a=1;B=-a*2;za-B'))
+        statements = tree.lower(expr2.compile())
+        self.assertEqual([
+            ('store', 'a', 'fast', ('const', 1)),
+            ('store', 'B', 'global', ('binary', '*',
+                ('unary', '-', ('load', 'a', 'fast')), ('const', 2))),
+            ('return', ('binary', '-', ('load', 'a', 'fast'),
+                ('load', 'B', 'global'))),
+            ], statements)
+
+    def test_lower_unbalanced(self):
+        co = CodeObject()
+        co.append('LOAD_CONST', 1)
+        with self.assertRaises(ValueError):
+            tree.lower(co)
+
+class TestAstBackend(unittest.TestCase):
+
+    def compile(self, text, globs=None):
+        expr2.init(inp=io.StringIO(text), err=io.StringIO())
+        return expr2.compile_function(globs, backend='ast')
+
+    def test_expression(self):
+        self.assertEqual(-7, self.compile('a=2;b=a*3;z-(b+1)/1')())
+        self.assertEqual(-2, self.compile('z-3/2')())
+
+    def test_installed_python(self):
+        # The opcodes the front end logs are those of `ch04.opcodes`,
+        # whatever the running Python's own are.
+        for backend in ('ast', 'vm'):
+            expr2.init(inp=io.StringIO('x=7;zx*2+f(3)'), err=io.StringIO())
+            fn = expr2.compile_function({'f': abs}, backend=backend)
+            self.assertEqual(17, fn(), backend)
+
+    def test_globals(self):
+        globs = {'C': 4}
+        fn = self.compile('B=C*2;zB+C', globs)
+        self.assertEqual(12, fn())
+        self.assertEqual(8, globs['B'])
+
+    def test_unbound_local(self):
+        with self.assertRaises(UnboundLocalError):
+            self.compile('zx')()
+
+    def test_fold_non_numeric(self):
+        expr2.init(inp=io.StringIO('zS(2)+N()'), err=io.StringIO())
+        co = expr2.compile(pure={'S': lambda n: 'ab' * n,
+            'N': lambda: 'c'})
+        self.assertEqual([('return', ('binary', '+', ('const', 'abab'),
+            ('const', 'c')))], tree.lower(co))
+        self.assertEqual('ababc', astgen.to_function(co)())
+
+    @unittest.skipUnless(hasattr(ast, 'Str'), "no per-type constant nodes")
+    def test_typed_constant(self):
+        for value in ('ab', True, False, None, 3, 2.5):
+            node = ast.Expression(body=astgen._typed_constant(value))
+            code = compile(ast.fix_missing_locations(node), '<test>', 'eval')
+            self.assertIs(type(value), type(eval(code)))
+            self.assertEqual(value, eval(code))
+
+    def test_name(self):
+        expr2.init(inp=io.StringIO('z1'))
+        co = expr2.compile()
+        self.assertEqual('calc', astgen.to_function(co, name='calc').__name__)
+
+if __name__ == '__main__':
+    unittest.main()
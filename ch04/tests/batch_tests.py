@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4
+"""
+    ch04.tests.batch_tests
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Specifies the behavior of batch evaluation over columns of inputs.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import io
+import random
+import unittest
+
+from ch04 import astgen, batch, expr2
+from fuzz import expr as fuzzer
+
+def compile(text):
+    expr2.init(inp=io.StringIO(text), err=io.StringIO())
+    return expr2.compile()
+
+def per_row(co, xs, ys):
+    """Run `co` once per row with globals X and Y, as evaluate() should."""
+    values = []
+    failed = []
+    for row, (x, y) in enumerate(zip(xs, ys)):
+        try:
+            values.append(astgen.to_function(co, {'X': x, 'Y': y})())
+        except ZeroDivisionError:
+            values.append(None)
+            failed.append(row)
+    return values, failed
+
+class TestBatch(unittest.TestCase):
+
+    use_numpy = False
+
+    def evaluate(self, co, columns, globs=None):
+        values, failed = batch.evaluate(co, columns, globs,
+            use_numpy=self.use_numpy)
+        values = list(values)
+        for row in failed:
+            self.assertEqual(0 if self.use_numpy else None, values[row])
+            values[row] = None
+        return [None if v is None else int(v) for v in values], failed
+
+    def test_columns(self):
+        co = compile('a=X*3;zY/a-x')
+        values, failed = self.evaluate(co, {'X': [1, 0, -2, 4],
+            'Y': [7, 5, 7, -9], 'x': [1, 2, 3, 4]})
+        self.assertEqual([1, None, -5, -5], values)
+        self.assertEqual([1], failed)
+
+    def test_globals(self):
+        co = compile('zX+N')
+        self.assertEqual(([11, 12], []),
+            self.evaluate(co, {'X': [1, 2]}, {'N': 10}))
+        with self.assertRaises(NameError):
+            self.evaluate(co, {'X': [1, 2]})
+        with self.assertRaises(UnboundLocalError):
+            self.evaluate(compile('zx'), {'X': [1, 2]})
+
+    def test_failed_call(self):
+        calls = []
+        def K(v):
+            calls.append(v)
+            return 10 // v
+        co = compile('zK(1/X)+1')
+        self.assertEqual(([None, 11, None], [0, 2]),
+            self.evaluate(co, {'X': [0, 1, 2]}, {'K': K}))
+        self.assertEqual([1, 0], calls)
+
+    def test_stored_globals(self):
+        globs = {}
+        exec('def K(v):\n    return v + N\n', globs)
+        co = compile('N=X*2;zK(1)+N')
+        self.assertEqual(([5, 9, 13], []),
+            self.evaluate(co, {'X': [1, 2, 3]}, globs))
+        self.assertEqual(6, globs['N'])
+
+    def test_call_python_values(self):
+        co = compile('zT(X)')
+        values, failed = self.evaluate(co, {'X': [1, 2]},
+            {'T': lambda v: 1 if type(v) is int else 0})
+        self.assertEqual(([1, 1], []), (values, failed))
+
+    def test_lengths(self):
+        with self.assertRaises(ValueError):
+            self.evaluate(compile('zX+Y'), {'X': [1, 2], 'Y': [1]})
+
+    def test_matches_per_row(self):
+        rng = random.Random(38)
+        xs = [rng.randint(-5, 5) for i in range(20)]
+        ys = [rng.randint(-5, 5) for i in range(20)]
+        for i in range(100):
+            expr = fuzzer.to_text(fuzzer.gen_expression(rng, 2))
+            text = 'a=X-Y;z' + expr.replace('3', 'X').replace('7', '(a/Y)')
+            co = compile(text)
+            self.assertEqual(per_row(co, xs, ys),
+                self.evaluate(co, {'X': xs, 'Y': ys}), text)
+
+@unittest.skipUnless(batch.numpy, "NumPy is not installed")
+class TestBatchNumpy(TestBatch):
+
+    use_numpy = True
+
+if __name__ == '__main__':
+    unittest.main()
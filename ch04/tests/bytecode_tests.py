@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4
+"""
+    ch04.tests.bytecode_tests
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Specifies the behavior of the ch04 bytecode module.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import sys
+import types
+import unittest
+
+from ch04 import opcodes
+from ch04.bytecode import CodeObject, Wordcode, instructions_match
+
+class TestBytecode(unittest.TestCase):
+
+    def test_appended_ops(self):
+        co = CodeObject()
+        co.append('LOAD_CONST', 7)
+        co.append('LOAD_FAST', 'a')
+        co.append('BINARY_ADD')
+        co.append('STORE_GLOBAL', 'X')
+        co.append('LOAD_CONST', 7)
+        ops = co._appended_ops
+        self.assertEqual(5, len(ops))
+        self.assertEqual([op[0] for op in ops], ['LOAD_CONST', 'LOAD_FAST',
+            'BINARY_ADD', 'STORE_GLOBAL', 'LOAD_CONST'])
+        self.assertEqual([op[2] for op in ops], [7, 'a', None, 'X', 7])
+        self.assertEqual(ops[-1], ops[0])
+        self.assertEqual(ops[1:3], [ops[1], ops[2]])
+
+    def test_dispatch_covers_opcodes(self):
+        for opname, opnum in opcodes.opmap.items():
+            strategy = CodeObject._append_dispatch[opnum]
+            self.assertIsNot(CodeObject._append_invalid_opcode, strategy,
+                opname)
+            if opnum < opcodes.HAVE_ARGUMENT:
+                self.assertIs(CodeObject._append_opcode_noarg, strategy,
+                    opname)
+                self.assertIs(CodeObject._lookup_arg_none,
+                    CodeObject._lookup_dispatch[opnum], opname)
+        unused = set(range(256)).difference(opcodes.opmap.values())
+        for opnum in unused:
+            self.assertIs(CodeObject._append_invalid_opcode,
+                CodeObject._append_dispatch[opnum])
+
+    def test_append_raw_arg(self):
+        co = CodeObject()
+        co.append('LOAD_CONST', 1)
+        co.append('LOAD_CONST', 2)
+        co.append('BUILD_TUPLE', 2)
+        self.assertEqual(('BUILD_TUPLE', opcodes.opmap['BUILD_TUPLE'], 2),
+            co._appended_ops[-1])
+        self.assertRaises(ValueError, co.append, 'BUILD_TUPLE', 'x')
+        self.assertRaises(ValueError, co.append, 'BUILD_TUPLE')
+
+    def test_consts_by_type(self):
+        co = CodeObject()
+        for value in (1, True, 1.0, 1, True):
+            co.append('LOAD_CONST', value)
+        self.assertEqual([None, 1, True, 1.0], co.co_consts)
+        self.assertEqual([1, True, 1.0, 1, True],
+            [op[2] for op in co._appended_ops])
+        self.assertEqual([int, bool, float, int, bool],
+            [type(op[2]) for op in co._appended_ops])
+
+    def test_local_slots(self):
+        co = CodeObject()
+        co.co_varnames.extend(['a', 'b'])
+        co.append('LOAD_FAST', 1)
+        co.append('STORE_FAST', 'a')
+        self.assertEqual(['b', 'a'], [op[2] for op in co._appended_ops])
+        self.assertEqual([1, 0], [ins[5] for ins in co.instructions()])
+        self.assertRaises(ValueError, co.append, 'LOAD_FAST', 2)
+
+    def test_set_params(self):
+        co = CodeObject()
+        co.append('LOAD_FAST', 'a')
+        co.append('LOAD_FAST', 'b')
+        co.append('BINARY_ADD')
+        co.append('RETURN_VALUE')
+        co.set_params(['b', 'a'])
+        self.assertEqual(2, co.co_argcount)
+        self.assertEqual(['b', 'a'], co.co_varnames)
+        self.assertEqual(['a', 'b'], [op[2] for op in co._appended_ops][:2])
+        self.assertEqual([1, 0], [ins[5] for ins in co.instructions()][:2])
+        self.assertRaises(ValueError, co.set_params, ['a', 'a'])
+
+    def test_labels(self):
+        co = CodeObject()
+        done = co.new_label('done')
+        co.append('LOAD_FAST', 'a')
+        co.append('POP_JUMP_IF_FALSE', done)
+        top = co.new_label()
+        co.set_label(top)
+        co.append('LOAD_FAST', 'a')
+        co.append('JUMP_FORWARD', done)
+        co.append('JUMP_ABSOLUTE', top)
+        co.set_label(done)
+        co.append('LOAD_CONST', 1)
+        co.append('RETURN_VALUE')
+        self.assertEqual([0, 3, 6, 9, 12, 15, 18], co.logged_offsets())
+        self.assertEqual([15, 'a', 3, 6],
+            [op[2] for op in co._appended_ops][1:5])
+        self.assertEqual({6: ('L1', ), 15: ('done', )},
+            co._labels_by_offset())
+        self.assertRaises(ValueError, co.set_label, done)
+        self.assertRaises(ValueError, co.append, 'JUMP_FORWARD', top)
+
+    def test_unplaced_label(self):
+        co = CodeObject()
+        co.append('JUMP_ABSOLUTE', co.new_label('nowhere'))
+        with self.assertRaises(ValueError):
+            co.compile()
+
+    def test_repeat_instructions(self):
+        co = CodeObject()
+        co.append('LOAD_FAST', 'a')
+        co.append('JUMP_IF_FALSE_OR_POP', 9)
+        co.append('LOAD_FAST', 'b')
+        co.append('POP_TOP')
+        co.repeat_instructions(0, 3)
+        log = co._appended_ops
+        self.assertEqual(7, len(log))
+        self.assertEqual([9, 19], [log[1][2], log[5][2]])
+        self.assertEqual(['a', 'b'], [log[4][2], log[6][2]])
+
+    def test_wide_jumps(self):
+        co = CodeObject()
+        done = co.new_label()
+        co.append('LOAD_FAST', 'a')
+        co.append('POP_JUMP_IF_FALSE', done)
+        co.append('JUMP_FORWARD', done)
+        for i in range(0x6000):
+            co.append('LOAD_FAST', 'a')
+        co.set_label(done)
+        co.append('RETURN_VALUE')
+        self.assertEqual(done.offset, co.logged_offsets()[-1])
+        self.assertEqual({1: done.offset, 2: done.offset}, co.logged_jumps())
+        decoded = [ins for ins in co.instructions()
+            if ins[3] != opcodes.EXTENDED_ARG]
+        self.assertEqual([done.offset, done.offset],
+            [ins[6] for ins in decoded[1:3]])
+
+    def test_stack_depth(self):
+        co = CodeObject()
+        done = co.new_label()
+        co.append('LOAD_CONST', 1)
+        co.append('JUMP_IF_TRUE_OR_POP', done)
+        co.append('LOAD_CONST', 2)
+        co.append('LOAD_CONST', 3)
+        co.append('BINARY_ADD')
+        co.set_label(done)
+        co.append('RETURN_VALUE')
+        if sys.version_info >= (3, 6):
+            self.assertEqual(2, co.stack_depth())
+        elif hasattr(opcodes, 'stack_effect'):
+            # Without `jump`, each path takes the larger stack effect.
+            self.assertEqual(3, co.stack_depth())
+
+    def test_decode(self):
+        co = CodeObject()
+        co.append('LOAD_FAST', 'a')
+        co.append('LOAD_CONST', 7)
+        co.append('BINARY_ADD')
+        co.append('RETURN_VALUE')
+        offsets, opnums, argindexes = co.decode()
+        self.assertEqual(list(offsets), [0, 3, 6, 7])
+        self.assertEqual(list(opnums), [opcodes.opmap['LOAD_FAST'],
+            opcodes.opmap['LOAD_CONST'], opcodes.opmap['BINARY_ADD'],
+            opcodes.opmap['RETURN_VALUE']])
+        self.assertEqual(list(argindexes), [0, 1, 0, 0])
+        self.assertEqual([i[6] for i in co.instructions()], ['a', 7, None,
+            None])
+
+    def test_decode_extended_arg(self):
+        co = CodeObject()
+        co.co_code = bytearray([opcodes.EXTENDED_ARG, 1, 0,
+            opcodes.opmap['LOAD_CONST'], 2, 0])
+        offsets, opnums, argindexes = co.decode()
+        self.assertEqual(list(offsets), [0, 3])
+        self.assertEqual(list(argindexes), [1, 0x10002])
+
+    def test_decode_truncated(self):
+        co = CodeObject()
+        co.co_code = bytearray([opcodes.opmap['LOAD_CONST'], 1])
+        with self.assertRaises(ValueError):
+            co.decode()
+
+    def test_patch_arg(self):
+        co = CodeObject()
+        co.append('LOAD_FAST', 'a')
+        co.append('LOAD_FAST', 'b')
+        first = co.code_bytes()
+        self.assertIs(first, co.code_bytes())
+        co.patch_arg(3, 0)
+        self.assertEqual([i[6] for i in co.instructions()], ['a', 'a'])
+        self.assertIsNot(first, co.code_bytes())
+        with self.assertRaises(ValueError):
+            co.patch_arg(0, 0x10000)
+
+    def test_code_view(self):
+        co = CodeObject()
+        co.append('LOAD_CONST', 7)
+        co.append('RETURN_VALUE')
+        with co.code_view(3) as view:
+            self.assertEqual(view.tobytes(),
+                bytes([opcodes.opmap['RETURN_VALUE']]))
+        co.append('RETURN_VALUE')
+        self.assertEqual(5, len(co.co_code))
+
+    @unittest.skipUnless(Wordcode, "the code of this Python can be read")
+    def test_from_code_wordcode(self):
+        def f(a):
+            return a
+        with self.assertRaises(NotImplementedError):
+            CodeObject.from_code(f, mutable=True)
+        with self.assertRaises(NotImplementedError):
+            CodeObject.from_code(f.__code__)
+
+    @unittest.skipIf(Wordcode, "CodeObject cannot read wordcode")
+    def test_from_code_copy_on_write(self):
+        def f():
+            return 1
+        co = CodeObject.from_code(f, mutable=True)
+        self.assertIs(co.co_code, f.__code__.co_code)
+        self.assertIs(co.co_consts, f.__code__.co_consts)
+        co.append('POP_TOP')
+        self.assertIsNot(co.co_code, f.__code__.co_code)
+        self.assertEqual(len(f.__code__.co_code) + 1, len(co.co_code))
+        self.assertEqual(list(f.__code__.co_consts), co.co_consts)
+
+    @unittest.skipIf(Wordcode, "CodeObject cannot read wordcode")
+    def test_from_code_immutable(self):
+        def f():
+            return 1
+        co = CodeObject.from_code(f)
+        with self.assertRaises(TypeError):
+            co.append('POP_TOP')
+
+    @unittest.skipIf(Wordcode, "CodeObject cannot read wordcode")
+    def test_from_code_jumps(self):
+        def f(a):
+            return a
+        co = CodeObject.from_code(f, mutable=True)
+        label = co.new_label()
+        co.set_label(label)
+        co.append('JUMP_ABSOLUTE', label)
+        self.assertEqual([0, 3, 4], co.logged_offsets())
+        self.assertEqual({2: 4}, co.logged_jumps())
+        self.assertEqual(1, co.stack_depth())
+        co.reassemble(list(co.instructions()))
+        self.assertEqual(['LOAD_FAST', 'RETURN_VALUE', 'JUMP_ABSOLUTE'],
+            [ins[4] for ins in co.instructions()])
+        self.assertEqual(['a', None, 4],
+            [ins[6] for ins in co.instructions()])
+        fn = types.FunctionType(co.compile(), {})
+        self.assertEqual(5, fn(5))
+
+    def test_sync_log(self):
+        op = opcodes.opmap
+        co = CodeObject()
+        co.co_varnames = ['a']
+        co.co_code = bytearray([op['LOAD_FAST'], 0, 0,
+            op['POP_JUMP_IF_FALSE'], 0, 0])
+        done = co.new_label()
+        co.append('JUMP_ABSOLUTE', done)
+        # Repeating nothing decodes the assigned code into the log, while
+        # the jump to `done` is still pending.
+        co.repeat_instructions(0, 0)
+        co.set_label(done)
+        co.append('LOAD_FAST', 'a')
+        co.append('RETURN_VALUE')
+        self.assertEqual(['LOAD_FAST', 'POP_JUMP_IF_FALSE', 'JUMP_ABSOLUTE',
+            'LOAD_FAST', 'RETURN_VALUE'],
+            [entry[0] for entry in co._appended_ops])
+        self.assertEqual({1: 0, 2: 9}, co.logged_jumps())
+        self.assertEqual(1, co.stack_depth())
+
+    def test_reassemble(self):
+        op = opcodes.opmap
+        co = CodeObject()
+        co.co_varnames = ['a']
+        co.co_consts = [None, 1]
+        co.co_code = bytearray([
+            op['LOAD_FAST'], 0, 0,
+            op['POP_JUMP_IF_FALSE'], 10, 0,
+            op['LOAD_CONST'], 1, 0,
+            op['RETURN_VALUE'],
+            op['LOAD_CONST'], 0, 0,
+            op['RETURN_VALUE'],
+        ])
+        edited = list(co.instructions())
+        self.assertEqual(10, edited[1][6])
+        edited[2:2] = [
+            (2, None, (), op['LOAD_CONST'], 'LOAD_CONST', None, 'x'),
+            (2, None, (), op['POP_TOP'], 'POP_TOP', None, None),
+        ]
+        edited[4:] = [(3, ) + ins[1:] for ins in edited[4:]]
+        co.reassemble(edited)
+        got = list(co.instructions())
+        self.assertEqual(14, got[1][5])
+        self.assertEqual('LOAD_CONST', got[-2][4])
+        self.assertEqual(14, got[-2][1])
+        self.assertEqual(['a', 14, 'x', None, 1, None, None, None],
+            [ins[6] for ins in got])
+        self.assertEqual([1, 1, 2, 2, 3, 3, 3, 3], [ins[0] for ins in got])
+
+    def test_instructions_match(self):
+        co = CodeObject()
+        co.append('LOAD_CONST', 7)
+        co.append('STORE_FAST', 'x')
+        co.append('LOAD_FAST', 'x')
+        co.append('RETURN_VALUE')
+        self.assertTrue(instructions_match(co, """
+            0 LOAD_CONST 1 (7)
+            3 STORE_FAST (x)
+            LOAD_FAST 0 ('x')
+        """))
+
+    def test_instructions_match_diff(self):
+        co = CodeObject()
+        co.append('LOAD_CONST', 7)
+        co.append('STORE_FAST', 'x')
+        co.append('LOAD_FAST', 'x')
+        co.append('RETURN_VALUE')
+        with self.assertRaises(ValueError) as cm:
+            instructions_match(co, """
+                LOAD_CONST (8)
+                STORE_FAST (x)
+                LOAD_FAST (y)
+                RETURN_VALUE
+            """)
+        message = str(cm.exception)
+        self.assertIn("-LOAD_CONST (8)", message)
+        self.assertIn("+LOAD_CONST (7)", message)
+        self.assertIn("-LOAD_FAST (y)", message)
+        self.assertIn("+LOAD_FAST (x)", message)
+        self.assertIn(" STORE_FAST (x)", message)
+
+    def test_instructions_match_quoted_number(self):
+        co = CodeObject()
+        co.append('LOAD_CONST', '7')
+        co.append('LOAD_CONST', 7)
+        self.assertTrue(instructions_match(co, """
+            LOAD_CONST ('7')
+            LOAD_CONST (7)
+        """))
+        with self.assertRaises(ValueError):
+            instructions_match(co, """
+                LOAD_CONST (7)
+                LOAD_CONST ('7')
+            """)
+
+    def test_instructions_match_short(self):
+        co = CodeObject()
+        co.append('RETURN_VALUE')
+        with self.assertRaises(ValueError):
+            instructions_match(co, """
+                RETURN_VALUE
+                RETURN_VALUE
+            """)
+
+if __name__ == '__main__':
+    unittest.main()
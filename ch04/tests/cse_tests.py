@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4
+"""
+    ch04.tests.cse_tests
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Specifies the behavior of common subexpression elimination.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import io
+import random
+import unittest
+
+from ch04 import astgen, cse, expr2, tree, vm
+from ch04.bytecode import instructions_match
+from fuzz import expr as fuzzer
+
+def compile(text, optimize=True):
+    expr2.init(inp=io.StringIO(text), err=io.StringIO())
+    return expr2.compile(optimize=optimize)
+
+def run(co, globs=None):
+    try:
+        return vm.to_function(co, globs)()
+    except ZeroDivisionError:
+        return 'ZeroDivisionError'
+
+class TestCSE(unittest.TestCase):
+
+    def test_shared(self):
+        co = compile('b=1;c=2;a=(b+c)*(b+c);za+(b+c)')
+        self.assertTrue(instructions_match(co, """
+            LOAD_CONST (1)
+            STORE_FAST (b)
+            LOAD_CONST (2)
+            STORE_FAST (c)
+            LOAD_FAST (b)
+            LOAD_FAST (c)
+            BINARY_ADD
+            DUP_TOP
+            STORE_FAST (_t0)
+            LOAD_FAST (_t0)
+            BINARY_MULTIPLY
+            STORE_FAST (a)
+            LOAD_FAST (a)
+            LOAD_FAST (_t0)
+            BINARY_ADD
+            RETURN_VALUE
+        """))
+        self.assertIn('_t0', co.co_varnames)
+        self.assertEqual(12, run(co))
+
+    def test_reassigned(self):
+        co = compile('b=1;a=(b+b)*(b+b)-(b+b);b=5;za+(b+b)*(b+b)+(b+b)')
+        self.assertEqual(112, run(co))
+        self.assertEqual(2, sum(1 for op in co._appended_ops
+            if op[0] == 'DUP_TOP'))
+
+    def test_calls_not_shared(self):
+        statements = [('return', ('binary', '+',
+            ('binary', '*', ('load', 'X', 'global'), ('load', 'X', 'global')),
+            ('binary', '*', ('call', ('load', 'f', 'global'), (), ()),
+                ('binary', '*', ('load', 'X', 'global'),
+                    ('load', 'X', 'global')))))]
+        self.assertEqual(statements, cse.eliminate(statements))
+        calls = [('binary', '-', ('call', ('load', 'f', 'global'), (), ()),
+            ('const', 1))] * 3
+        statements = [('return', ('binary', '+', calls[0],
+            ('binary', '+', calls[1], calls[2])))]
+        self.assertEqual(statements, cse.eliminate(statements))
+
+    def test_not_worth_it(self):
+        co = compile('b=1;c=2;a=b+c;zb+c')
+        self.assertFalse(any(op[0] == 'DUP_TOP' for op in co._appended_ops))
+
+    def test_nested_unused_temp(self):
+        co = compile('b=1;c=2;a=(b+c)*3+(b+c)*3;z(b+c)*3')
+        self.assertEqual(1, sum(1 for op in co._appended_ops
+            if op[0] == 'DUP_TOP'))
+        self.assertEqual(9, run(co))
+
+    def test_hoist_tees(self):
+        co = compile('b=1;c=2;a=(b+c)*(b+c);za+(b+c)')
+        statements = tree.hoist_tees(tree.lower(co))
+        self.assertEqual(('store', '_t0', 'fast', ('binary', '+',
+            ('load', 'b', 'fast'), ('load', 'c', 'fast'))), statements[2])
+        self.assertFalse(any(node[0] == 'tee' for stmt in statements
+            for node in tree.walk(stmt)))
+        self.assertEqual(12, astgen.to_function(co)())
+
+    def test_matches_unoptimized(self):
+        rng = random.Random(39)
+        for i in range(200):
+            expr = fuzzer.to_text(fuzzer.gen_expression(rng, 3))
+            expr = expr.replace('3', 'a').replace('7', '(a+B)')
+            text = 'a=2;B=3;c=%s;B=c+(a+B);z%s+c*(a+B)' % (expr, expr)
+            self.assertEqual(run(compile(text, optimize=False)),
+                run(compile(text)), text)
+
+if __name__ == '__main__':
+    unittest.main()
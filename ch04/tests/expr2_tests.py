@@ -14,7 +14,8 @@ import sys
 import unittest
 
 from ch04 import expr2 as compiler
-from ch04.bytecode import instructions_match
+from ch04 import vm
+from ch04.bytecode import Wordcode, instructions_match
 
 Flag = 0
 def f():
@@ -40,6 +41,15 @@ class TestCompiler(unittest.TestCase):
         co = compiler.compile()
         return co
 
+    def run_code(self, co):
+        """
+        Run `co` with this module's globals: as a CodeObject call where
+        Python can run its bytecode, and in the VM where it cannot.
+        """
+        if Wordcode:
+            return vm.to_function(co, globals())()
+        return co()
+
     def test_assignment(self):
         asm = """
             LOAD_CONST (7)
@@ -63,7 +73,7 @@ class TestCompiler(unittest.TestCase):
         global Flag
         Flag = 0
         self.assertEqual(0, Flag)
-        co()
+        self.run_code(co)
         self.assertEqual(1, Flag)
 
     def test_fncall_1arg(self):
@@ -71,16 +81,94 @@ class TestCompiler(unittest.TestCase):
         global Flag
         Flag = 0
         self.assertEqual(0, Flag)
-        co()
-        self.assertEqual(123, Flag)
+        self.run_code(co)
+        self.assertEqual(3, Flag)
 
     def test_fncall_2args(self):
-        co = self.compileExpr("zg(5,7)")
+        co = self.compileExpr("zh(5,7)")
         global Flag
         Flag = 0
         self.assertEqual(0, Flag)
-        co()
+        self.run_code(co)
         self.assertEqual(5+7, Flag)
 
+    def callExpr(self, text, fn):
+        compiler.init(inp=StringIO(text))
+        return compiler.compile_function({'k': fn}, backend='vm')()
+
+    def test_call_args(self):
+        fn = lambda *args, **kwargs: (args, kwargs)
+        self.assertEqual(((), {}), self.callExpr("zk()", fn))
+        self.assertEqual(((3, 4), {}), self.callExpr("a=2;zk(a+1,a*2)", fn))
+        self.assertEqual(((3, ), {'b': 1, 'c': 2}),
+            self.callExpr("a=3;zk(a,b=1,c=a-1)", fn))
+        self.assertEqual(((5, ), {}), self.callExpr("zk(5)", fn))
+
+    def test_call_nested(self):
+        fn = lambda x, y=0: x * 10 + y
+        self.assertEqual(123, self.callExpr("a=1;zk(k(a,y=2),y=3)", fn))
+
+    def test_call_many_args(self):
+        args = ','.join(str(i % 10) for i in range(300))
+        result = self.callExpr("zk(%s,x=1)" % args,
+            lambda *args, **kwargs: (len(args), kwargs))
+        self.assertEqual((300, {'x': 1}), result)
+
+    def test_params(self):
+        compiler.init(inp=StringIO("x=b*2;za-x"))
+        co = compiler.compile(params=['a', 'b'])
+        self.assertEqual(2, co.co_argcount)
+        self.assertEqual(['a', 'b', 'x'], co.co_varnames)
+        self.assertEqual(5, compiler.Backends['vm'](co, {})(9, 2))
+
+    def test_infer_params(self):
+        compiler.init(inp=StringIO("x=b*2;c=c+x;zc-x*a"))
+        co = compiler.compile(params=['c'], infer_params=True)
+        self.assertEqual(['c', 'a', 'b', 'x'], co.co_varnames)
+        self.assertEqual(3, co.co_argcount)
+        for backend in ('vm', 'ast', 'source'):
+            fn = compiler.Backends[backend](co, {})
+            self.assertEqual(3 + 4 - 4 * 5, fn(3, 5, 2), backend)
+        self.assertEqual(['a', 'b', 'c'], compiler.free_locals(co))
+
+    def test_bad_params(self):
+        compiler.init(inp=StringIO("z1"))
+        self.assertRaises(ValueError, compiler.compile, params=['A'])
+
+    def test_constants(self):
+        compiler.init(inp=StringIO("x=a*K;zx+K*M(a)"))
+        co = compiler.compile(infer_params=True, constants=['K', 'M', 'N'])
+        self.assertEqual(['K', 'M'], co.constant_globals)
+        self.assertEqual(['a', '_g_K', '_g_M', 'x'], co.co_varnames)
+        self.assertEqual((1, 2), (co.co_argcount, co.co_kwonlyargcount))
+        self.assertNotIn('LOAD_GLOBAL', [op[0] for op in co._appended_ops])
+        for backend in ('vm', 'ast', 'source'):
+            globs = {'K': 3, 'M': abs}
+            fn = compiler.Backends[backend](co, globs)
+            self.assertEqual(18, fn(3), backend)
+            globs['K'] = 10
+            self.assertEqual(18, fn(3), backend)
+            fn.rebind_constants()
+            self.assertEqual(60, fn(3), backend)
+            self.assertEqual(8, fn(2, _g_K=2), backend)
+            with self.assertRaises(TypeError):
+                fn(2, 2)
+
+    def test_assign_constant(self):
+        err = StringIO()
+        compiler.init(inp=StringIO("K=1;zK"), err=err)
+        self.assertRaises(SystemExit, compiler.compile, constants=['K'])
+        self.assertIn("Cannot assign to constant 'K'", err.getvalue())
+
+    def test_call_bad_args(self):
+        err = StringIO()
+        compiler.init(inp=StringIO("zk(x=1,2)"), err=err)
+        self.assertRaises(SystemExit, compiler.compile)
+        self.assertIn("Positional argument after keyword argument in "
+            "call to 'k'", err.getvalue())
+        compiler.init(inp=StringIO("zk(x=1,x=2)"), err=err)
+        self.assertRaises(SystemExit, compiler.compile)
+        self.assertIn("repeated", err.getvalue())
+
 if __name__ == '__main__':
     unittest.main()
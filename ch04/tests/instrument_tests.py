@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4
+"""
+    ch04.tests.instrument_tests
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Specifies the behavior of the ch04 instrumentation hooks.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import io
+import os
+import tempfile
+import unittest
+
+from ch04 import expr2
+from ch04.instrument import Metrics, TimedInput
+
+class TestInstrument(unittest.TestCase):
+
+    def compile(self, text, metrics=None):
+        expr2.init(inp=io.StringIO(text), err=io.StringIO(),
+            metrics=metrics)
+        return expr2.compile()
+
+    def test_disabled(self):
+        co = self.compile('a=1;za+1')
+        self.assertIsNone(co.metrics)
+        self.assertNotIsInstance(expr2._Input, TimedInput)
+
+    def test_counters(self):
+        metrics = Metrics()
+        co = self.compile('a=1;b=1;za+b+1', metrics)
+        self.assertEqual(len('a=1;b=1;za+b+1'),
+            metrics.counters[('chars_read', ())])
+        self.assertEqual(len(co._appended_ops),
+            metrics.counters[('instructions_emitted', ())])
+        consts = (('table', 'consts'), )
+        self.assertEqual(3, metrics.counters[('table_lookups', consts)])
+        self.assertEqual(2, metrics.counters[('table_hits', consts)])
+        self.assertEqual(len(co.co_consts),
+            metrics.gauges[('table_size', consts)])
+        for phase in ('init', 'parse', 'read'):
+            self.assertIn(phase, metrics.seconds)
+
+    def test_accumulates(self):
+        metrics = Metrics()
+        self.compile('za', metrics)
+        self.compile('zb', metrics)
+        self.assertEqual(2, metrics.counters[('compiles', ())])
+        self.assertEqual(4, metrics.counters[('chars_read', ())])
+        self.compile('zc')
+        self.assertEqual(2, metrics.counters[('compiles', ())])
+
+    def test_prometheus(self):
+        metrics = Metrics()
+        self.compile('a=1;za', metrics)
+        text = metrics.to_prometheus()
+        self.assertIn('# TYPE lbac_phase_seconds_total counter\n', text)
+        self.assertIn('lbac_phase_seconds_total{phase="parse"} ', text)
+        self.assertIn('lbac_chars_read_total 6\n', text)
+        self.assertIn('# TYPE lbac_table_size gauge\n', text)
+        self.assertIn('lbac_table_size{table="varnames"} 1\n', text)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'lbac.prom')
+            metrics.write_prometheus(path)
+            with open(path) as f:
+                self.assertEqual(text, f.read())
+            self.assertEqual(['lbac.prom'], os.listdir(tmp))
+
+if __name__ == '__main__':
+    unittest.main()
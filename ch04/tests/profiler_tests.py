@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4
+"""
+    ch04.tests.profiler_tests
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Specifies the behavior of source spans and the ch04 profiler.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import io
+import itertools
+import shutil
+import tempfile
+import unittest
+
+from ch04 import astgen, expr2, pysource, vm
+from ch04.bytecode import CodeObject
+from ch04.profiler import Profile
+
+class TestSpans(unittest.TestCase):
+
+    def test_source_spans(self):
+        expr2.init(inp=io.StringIO('a=1;b=2;za+b'), err=io.StringIO(),
+            spans=True)
+        co = expr2.compile()
+        self.assertEqual('a=1;b=2;za+b', co.source)
+        self.assertEqual({1: (0, 3), 2: (4, 7), 3: (8, 12)}, co.source_spans)
+        linenos = [ins[0] for ins in co.instructions()]
+        self.assertEqual([1, 1, 2, 2, 3, 3, 3, 3], linenos)
+
+    def test_no_spans(self):
+        expr2.init(inp=io.StringIO('a=1;za'), err=io.StringIO())
+        co = expr2.compile()
+        self.assertIsNone(co.source)
+        self.assertEqual({}, co.source_spans)
+        self.assertEqual(b'', bytes(co.co_lnotab))
+
+class TestProfile(unittest.TestCase):
+
+    def test_profile(self):
+        def f():
+            a = 1
+            b = 2
+            return a + b
+        ticks = itertools.count()
+        profile = Profile(clock=lambda: float(next(ticks)))
+        co = CodeObject()
+        first = f.__code__.co_firstlineno
+        co.source = 'a=1;b=2;za+b'
+        co.source_spans = {first + 1: (0, 3), first + 3: (8, 12)}
+        profile.watch(f, co)
+        self.assertEqual(3, profile.runcall(f))
+        stats = profile.stats()
+        self.assertEqual([first + 1, first + 2, first + 3],
+            sorted(row[3] for row in stats))
+        self.assertTrue(all(row[0] > 0 and row[1] == 1 for row in stats))
+        out = io.StringIO()
+        profile.report(out=out)
+        report = out.getvalue()
+        self.assertIn('a=1', report)
+        self.assertIn('za+b', report)
+        self.assertIn('f line %d' % (first + 2), report)
+
+    def test_compiled(self):
+        expr2.init(inp=io.StringIO('a=1;B=a+2;zK(a)+B'), err=io.StringIO(),
+            spans=True)
+        co = expr2.compile()
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        backends = [vm.to_function, astgen.to_function,
+            lambda co, globs: pysource.to_function(co, globs,
+                cache_dir=cache_dir)]
+        for backend in backends:
+            ticks = itertools.count()
+            profile = Profile(clock=lambda: float(next(ticks)))
+            fn = backend(co, {'K': lambda x: x * 10})
+            profile.watch(fn, co)
+            self.assertEqual(13, profile.runcall(fn))
+            out = io.StringIO()
+            profile.report(out=out)
+            self.assertEqual(['a=1', 'B=a+2', 'zK(a)+B'],
+                sorted((profile.label(row[2], row[3]) for row in
+                    profile.stats()), key=co.source.index), out.getvalue())
+            self.assertTrue(all(row[0] > 0 and row[1] == 1
+                for row in profile.stats()))
+            self.assertNotIn(' line ', out.getvalue())
+
+    def test_unwatched(self):
+        def g():
+            return 1
+        profile = Profile()
+        profile.runcall(g)
+        self.assertEqual([], profile.stats())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4
+"""
+    ch04.tests.purity_tests
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Specifies the behavior of optimisations for pure function calls.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import unittest
+
+from ch04 import cse, purity
+
+def call(name, *args):
+    return ('call', ('load', name, 'global'), args, ())
+
+A = ('load', 'a', 'fast')
+
+class TestPurity(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def square(self, x):
+        self.calls.append(x)
+        return x * x
+
+    def test_fold(self):
+        statements = [
+            ('store', 'a', 'fast', call('f')),
+            ('return', ('binary', '+', A, call('g'))),
+        ]
+        pure = {'f': lambda: 5, 'g': lambda: [5]}
+        bindings = {}
+        self.assertEqual([
+            ('store', 'a', 'fast', ('const', 5)),
+            ('return', ('binary', '+', A, call('_pure_g'))),
+            ], purity.rewrite(statements, pure, bindings))
+        self.assertEqual(['_pure_g'], list(bindings))
+
+    def test_fold_arguments(self):
+        statements = [('return', call('sq', ('const', 3)))]
+        self.assertEqual([('return', ('const', 9))],
+            purity.rewrite(statements, {'sq': self.square}, {}))
+        self.assertEqual([3], self.calls)
+
+    def test_fold_raises(self):
+        statements = [('return', call('inv', ('const', 0)))]
+        bindings = {}
+        result = purity.rewrite(statements, {'inv': lambda x: 1 // x},
+            bindings)
+        self.assertEqual([('return', call('_pure_inv', ('const', 0)))],
+            result)
+        self.assertEqual(['_pure_inv'], list(bindings))
+
+    def test_memoize(self):
+        statements = [('return', ('binary', '+', call('sq', A),
+            call('f', A)))]
+        bindings = {}
+        result = purity.rewrite(statements, {'sq': self.square}, bindings)
+        self.assertEqual([('return', ('binary', '+', call('_pure_sq', A),
+            call('f', A)))], result)
+        memo = bindings['_pure_sq']
+        self.assertEqual(self.square, memo.__wrapped__)
+        self.assertEqual(16, memo(4))
+        self.assertEqual(16, memo(4))
+        self.assertEqual([4], self.calls)
+
+    def test_memo_per_program(self):
+        square = self.square
+        statements = [('return', ('binary', '+', call('sq', A),
+            call('sq', ('const', 3))))]
+        first = {}
+        purity.rewrite(statements, {'sq': square}, first)
+        memo = first['_pure_sq']
+        purity.rewrite(statements, {'sq': square}, first)
+        self.assertIs(memo, first['_pure_sq'])
+        second = {}
+        purity.rewrite(statements, {'sq': square}, second)
+        self.assertIsNot(first['_pure_sq'], second['_pure_sq'])
+        first['_pure_sq'](4)
+        second['_pure_sq'](4)
+        self.assertEqual([3, 3, 3, 4, 4], self.calls)
+
+    def test_memo_unhashable(self):
+        class Square(list):
+            def __call__(self, x):
+                return x * x
+        bindings = {}
+        purity.rewrite([('return', call('sq', A))], {'sq': Square()},
+            bindings)
+        self.assertEqual(16, bindings['_pure_sq'](4))
+
+    def test_hoist(self):
+        statements = [
+            ('store', 'b', 'fast', ('binary', '*', call('_pure_sq', A),
+                call('_pure_sq', A))),
+            ('return', ('binary', '+', ('load', 'b', 'fast'),
+                call('_pure_sq', A))),
+        ]
+        result = cse.eliminate(statements, frozenset(['_pure_sq']))
+        self.assertEqual([
+            ('store', 'b', 'fast', ('binary', '*',
+                ('tee', '_t0', call('_pure_sq', A)),
+                ('load', '_t0', 'fast'))),
+            ('return', ('binary', '+', ('load', 'b', 'fast'),
+                ('load', '_t0', 'fast'))),
+            ], result)
+        self.assertEqual(statements, cse.eliminate(statements))
+
+if __name__ == '__main__':
+    unittest.main()
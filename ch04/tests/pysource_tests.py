@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4
+"""
+    ch04.tests.pysource_tests
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Specifies the behavior of the Python source backend.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import dis
+import hashlib
+import io
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+from ch04 import expr2, pysource
+
+class TestPySource(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.loaded = dict(pysource._Loaded)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        pysource._Loaded.clear()
+        pysource._Loaded.update(self.loaded)
+
+    def compile(self, text):
+        expr2.init(inp=io.StringIO(text), err=io.StringIO())
+        return expr2.compile()
+
+    def test_source(self):
+        co = self.compile('x=7;Y=-x*2;z(x-1)*(Y-(x-1))/-2')
+        self.assertEqual(
+            "def program():\n"
+            "    global Y; x = 7\n"
+            "    Y = -x * 2\n"
+            "    return (x - 1) * (Y - (x - 1)) // -2\n",
+            pysource.to_source(co))
+        self.assertIn("def calc():", pysource.to_source(co, 'calc'))
+
+    def test_lines(self):
+        expr2.init(inp=io.StringIO('a=1;B=2;za+B'), err=io.StringIO(),
+            spans=True)
+        co = expr2.compile()
+        for firstlineno in (1, 5):
+            co.co_firstlineno = firstlineno
+            fn = pysource.to_function(co, cache_dir=self.cache_dir)
+            self.assertEqual(3, fn())
+            self.assertEqual(firstlineno - 1, fn.__code__.co_firstlineno)
+            # From Python 3.11 the def line starts the code too.
+            linenos = set(lineno for offset, lineno
+                in dis.findlinestarts(fn.__code__))
+            linenos.discard(fn.__code__.co_firstlineno)
+            self.assertEqual(set(range(firstlineno, firstlineno + 3)),
+                linenos)
+        lines = pysource.to_source(co).splitlines()
+        self.assertEqual(['', '', '', 'def program():'], lines[:4])
+        self.assertEqual(['global B; a = 1', 'B = 2', 'return a + B'],
+            [line.strip() for line in lines[4:]])
+
+    def test_function(self):
+        co = self.compile('x=7;Y=-x*2;z(x-1)*(Y-(x-1))/-2')
+        globs = {}
+        fn = pysource.to_function(co, globs, cache_dir=self.cache_dir)
+        self.assertEqual(60, fn())
+        self.assertEqual(-14, globs['Y'])
+        self.assertEqual('program', fn.__name__)
+
+    def test_unbound_local(self):
+        co = self.compile('zx')
+        fn = pysource.to_function(co, cache_dir=self.cache_dir)
+        with self.assertRaises(UnboundLocalError):
+            fn()
+
+    def test_cache(self):
+        co = self.compile('a=1;za+1')
+        pysource.to_function(co, cache_dir=self.cache_dir)
+        files = [name for name in os.listdir(self.cache_dir)
+            if name.endswith('.py')]
+        self.assertEqual(1, len(files))
+        module = pysource.load(pysource.to_source(co), self.cache_dir)
+        self.assertIs(module, pysource.load(pysource.to_source(co),
+            self.cache_dir))
+        pysource._Loaded.clear()
+        fn = pysource.to_function(co, cache_dir=self.cache_dir)
+        self.assertEqual(2, fn())
+        self.assertEqual(files, [name for name in os.listdir(self.cache_dir)
+            if name.endswith('.py')])
+
+    def test_planted_module(self):
+        co = self.compile('zA+1')
+        source = pysource.to_source(co)
+        name = 'lbac_' + hashlib.sha1(source.encode('utf8')).hexdigest()
+        path = os.path.join(self.cache_dir, name + '.py')
+        with open(path, 'w') as f:
+            f.write('def program():\n    return 666\n')
+        fn = pysource.to_function(co, {'A': 1}, cache_dir=self.cache_dir)
+        self.assertEqual(2, fn())
+        with open(path) as f:
+            self.assertEqual(source, f.read())
+
+    @unittest.skipUnless(hasattr(os, 'getuid'), "No user ids")
+    def test_private_cache_dir(self):
+        saved = pysource.Cache_dir
+        pysource.Cache_dir = os.path.join(self.cache_dir, 'default')
+        try:
+            pysource.load('x = 1\n')
+            mode = os.stat(pysource.Cache_dir).st_mode
+            self.assertEqual(0o700, mode & 0o777)
+            os.chmod(pysource.Cache_dir, 0o777)
+            with self.assertRaises(PermissionError):
+                pysource.load('x = 2\n')
+        finally:
+            pysource.Cache_dir = saved
+
+    def test_non_finite(self):
+        for value in (float('inf'), float('-inf')):
+            text = pysource.to_expr(('const', value))
+            self.assertEqual(value, eval(text, {}))
+        text = pysource.to_expr(('const', float('nan')))
+        self.assertEqual("float('nan')", text)
+        self.assertTrue(math.isnan(eval(text, {})))
+        node = ('unary', '-', ('const', float('-inf')))
+        self.assertEqual(float('inf'), eval(pysource.to_expr(node), {}))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4
+"""
+    ch04.tests.vm_tests
+    ~~~~~~~~~~~~~~~~~~~
+
+    Specifies the behavior of the ch04 stack VM.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import io
+import random
+import unittest
+
+from ch04 import astgen, expr2, vm
+from ch04.bytecode import CallSequence, CodeObject
+from fuzz import expr as fuzzer
+
+class TestVM(unittest.TestCase):
+
+    def compile(self, text):
+        expr2.init(inp=io.StringIO(text), err=io.StringIO())
+        return expr2.compile()
+
+    def test_run(self):
+        co = self.compile('x=7;Y=-x*2;z(x-1)*(Y-(x-1))/-2')
+        globs = {}
+        self.assertEqual(60, vm.Program(co).run(globs))
+        self.assertEqual(-14, globs['Y'])
+
+    def test_matches_native(self):
+        rng = random.Random(37)
+        for i in range(200):
+            text = 'a=2;B=3;z' + fuzzer.to_text(fuzzer.gen_expression(rng, 3))
+            co = self.compile(text)
+            try:
+                want = astgen.to_function(co)()
+            except ZeroDivisionError:
+                with self.assertRaises(ZeroDivisionError):
+                    vm.Program(co).run()
+            else:
+                self.assertEqual(want, vm.Program(co).run(), text)
+
+    def test_unbound(self):
+        with self.assertRaises(UnboundLocalError):
+            vm.to_function(self.compile('zx'))()
+        with self.assertRaises(NameError):
+            vm.to_function(self.compile('zX'))()
+        self.assertEqual(4, vm.to_function(self.compile('zX'), {'X': 4})())
+
+    def test_call(self):
+        co = CodeObject()
+        co.append('LOAD_GLOBAL', 'max')
+        call = CallSequence(co)
+        call.positional()
+        co.append('LOAD_CONST', 1)
+        call.positional()
+        co.append('LOAD_CONST', 2)
+        call.keyword('key')
+        co.append('LOAD_GLOBAL', 'F')
+        call.finish()
+        co.append('RETURN_VALUE')
+        self.assertEqual(1, vm.Program(co).run({'F': lambda x: -x}))
+
+    def test_jumps(self):
+        # s=0; while n: s=s+n; n=n-1; return s
+        co = CodeObject()
+        co.set_params(['n'])
+        top = co.new_label()
+        test = co.new_label()
+        co.append('LOAD_CONST', 0)
+        co.append('STORE_FAST', 's')
+        co.append('JUMP_FORWARD', test)
+        co.set_label(top)
+        co.append('LOAD_FAST', 's')
+        co.append('LOAD_FAST', 'n')
+        co.append('BINARY_ADD')
+        co.append('STORE_FAST', 's')
+        co.append('LOAD_FAST', 'n')
+        co.append('LOAD_CONST', 1)
+        co.append('BINARY_SUBTRACT')
+        co.append('STORE_FAST', 'n')
+        co.set_label(test)
+        co.append('LOAD_FAST', 'n')
+        co.append('LOAD_CONST', 0)
+        co.append('COMPARE_OP', '>')
+        co.append('POP_JUMP_IF_TRUE', top)
+        co.append('LOAD_FAST', 's')
+        co.append('RETURN_VALUE')
+        program = vm.Program(co)
+        self.assertTrue(program.jumps)
+        self.assertEqual([55, 0], [program.run(args=(10, )),
+            program.run(args=(0, ))])
+
+    def test_jump_table(self):
+        # Return 10 + x for x in 0..2, else 0: the compares after the
+        # table are only run for values that are not ints.
+        co = CodeObject()
+        co.set_params(['x'])
+        cases = [co.new_label() for i in range(3)]
+        default = co.new_label()
+        co.append_jump_table('x', 0, cases, default)
+        co.append('LOAD_FAST', 'x')
+        co.append('LOAD_CONST', 1)
+        co.append('COMPARE_OP', '==')
+        co.append('POP_JUMP_IF_TRUE', cases[1])
+        co.append('JUMP_ABSOLUTE', default)
+        for i, label in enumerate(cases):
+            co.set_label(label)
+            co.append('LOAD_CONST', 10 + i)
+            co.append('RETURN_VALUE')
+        co.set_label(default)
+        co.append('LOAD_CONST', 0)
+        co.append('RETURN_VALUE')
+        run = vm.to_function(co)
+        self.assertEqual([10, 11, 12, 0, 0, 11, 0],
+            [run(0), run(1), run(2), run(3), run(-1), run(1.0), run(2.0)])
+
+    def test_unsupported(self):
+        co = CodeObject()
+        co.append('UNARY_INVERT')
+        with self.assertRaises(ValueError):
+            vm.Program(co)
+        co = CodeObject()
+        co.append('LOAD_CONST', 1)
+        co.append('LOAD_CONST', (1, ))
+        co.append('COMPARE_OP', 'in')
+        co.append('RETURN_VALUE')
+        with self.assertRaises(ValueError) as cm:
+            vm.Program(co)
+        self.assertIn("'in'", str(cm.exception))
+
+    def test_keyword_arguments(self):
+        expr2.init(inp=io.StringIO('zx-y*2'), err=io.StringIO())
+        co = expr2.compile(params=['x', 'y'])
+        run = vm.to_function(co)
+        self.assertEqual([-3, -3, -3], [run(1, 2), run(1, y=2),
+            run(y=2, x=1)])
+        run.__defaults__ = (5, )
+        self.assertEqual([-9, -5], [run(1), run(y=3, x=1)])
+        run.__defaults__ = None
+        for args, kwargs in [((), {}), ((1, 2, 3), {}), ((1, ), {'x': 1}),
+                ((1, ), {'z': 2})]:
+            with self.assertRaises(TypeError):
+                run(*args, **kwargs)
+
+if __name__ == '__main__':
+    unittest.main()
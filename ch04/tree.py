@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    ch04.tree
+    ~~~~~~~~~
+
+    Rebuilds statement trees from the instructions logged in a
+    CodeObject, by running the instructions over a stack of trees
+    instead of values, and emits trees as instructions again. Backends
+    that do not emit bytecode themselves, and optimisations, work on
+    these trees.
+
+    Trees are tuples whose first item names the kind of node:
+
+        ('const', value)
+        ('load', name, scope)           scope is 'fast' or 'global'
+        ('binary', op, left, right)     op is '+', '-', '*' or '//'
+        ('unary', op, operand)          op is '-' or '+'
+        ('call', func, args, keywords)  keywords are (name, tree) pairs
+        ('tee', name, value)            value, also stored in local name
+        ('store', name, scope, value)
+        ('return', value)
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+from .bytecode import CallSequence, Packed_calls
+
+Binary_ops = {
+    'BINARY_ADD': '+',
+    'BINARY_SUBTRACT': '-',
+    'BINARY_MULTIPLY': '*',
+    'BINARY_FLOOR_DIVIDE': '//',
+}
+""" Binary operator of each binary opcode.  """
+
+Unary_ops = {
+    'UNARY_NEGATIVE': '-',
+    'UNARY_POSITIVE': '+',
+}
+""" Unary operator of each unary opcode.  """
+
+def lower(co):
+    """
+    Return the list of statement trees for the instructions appended to
+    CodeObject `co`. Raise ValueError if an instruction has no tree
+    form, or the stack does not balance.
+    """
+    stack = []
+    statements = []
+    for opname, opnum, arg in co._appended_ops:
+        if opname == 'LOAD_CONST':
+            stack.append(('const', arg))
+        elif opname == 'LOAD_FAST':
+            stack.append(('load', arg, 'fast'))
+        elif opname in ('LOAD_GLOBAL', 'LOAD_NAME'):
+            stack.append(('load', arg, 'global'))
+        elif opname in Binary_ops:
+            right = stack.pop()
+            stack.append(('binary', Binary_ops[opname], stack.pop(), right))
+        elif opname in Unary_ops:
+            stack.append(('unary', Unary_ops[opname], stack.pop()))
+        elif opname == 'CALL_FUNCTION' and Packed_calls:
+            keywords = []
+            for i in range((arg >> 8) & 0xFF):
+                value = stack.pop()
+                keywords.append((stack.pop()[1], value))
+            keywords.reverse()
+            args = _pop(stack, arg & 0xFF)
+            stack.append(('call', stack.pop(), args, tuple(keywords)))
+        elif opname == 'CALL_FUNCTION':
+            args = _pop(stack, arg)
+            stack.append(('call', stack.pop(), args, ()))
+        elif opname == 'CALL_FUNCTION_KW':
+            names = stack.pop()[1]
+            values = _pop(stack, len(names))
+            args = _pop(stack, arg - len(names))
+            stack.append(('call', stack.pop(), args,
+                tuple(zip(names, values))))
+        elif opname == 'BUILD_TUPLE':
+            stack.append(('tuple', _pop(stack, arg)))
+        elif opname == 'BUILD_CONST_KEY_MAP':
+            names = stack.pop()[1]
+            stack.append(('map', tuple(zip(names, _pop(stack, arg)))))
+        elif opname == 'CALL_FUNCTION_EX':
+            keywords = stack.pop()[1] if arg & 1 else ()
+            args = stack.pop()[1]
+            stack.append(('call', stack.pop(), args, keywords))
+        elif opname == 'DUP_TOP':
+            stack.append(('dup', ))
+        elif opname == 'STORE_FAST':
+            value = stack.pop()
+            if value == ('dup', ):
+                stack[-1] = ('tee', arg, stack[-1])
+            else:
+                statements.append(('store', arg, 'fast', value))
+        elif opname in ('STORE_GLOBAL', 'STORE_NAME'):
+            statements.append(('store', arg, 'global', stack.pop()))
+        elif opname == 'RETURN_VALUE':
+            statements.append(('return', stack.pop()))
+        else:
+            raise ValueError("No tree form for instruction %s" % opname)
+    if stack:
+        raise ValueError("%d values left on the stack" % len(stack))
+    return statements
+
+def _pop(stack, count):
+    """
+    Pop `count` trees from `stack`. Return them as a tuple, in the order
+    they were pushed.
+    """
+    if not count:
+        return ()
+    items = tuple(stack[-count:])
+    del stack[-count:]
+    return items
+
+def walk(tree):
+    """
+    Generate `tree` and all the trees inside it, parents first.
+    """
+    yield tree
+    kind = tree[0]
+    if kind == 'binary':
+        for node in walk(tree[2]):
+            yield node
+        for node in walk(tree[3]):
+            yield node
+    elif kind == 'call':
+        for node in walk(tree[1]):
+            yield node
+        for arg in tree[2]:
+            for node in walk(arg):
+                yield node
+        for name, value in tree[3]:
+            for node in walk(value):
+                yield node
+    elif kind == 'store':
+        for node in walk(tree[3]):
+            yield node
+    elif kind in ('return', 'unary'):
+        for node in walk(tree[-1]):
+            yield node
+    elif kind == 'tee':
+        for node in walk(tree[2]):
+            yield node
+
+def unbound_locals(statements, params=()):
+    """
+    Return a sorted list of the local names that `statements` read but
+    never assign, and that are not among the parameters `params`.
+    """
+    stored = set(node[1] for stmt in statements for node in walk(stmt)
+        if node[0] in ('store', 'tee'))
+    loaded = set(node[1] for stmt in statements for node in walk(stmt)
+        if node[0] == 'load' and node[2] == 'fast')
+    return sorted(loaded - stored - set(params))
+
+def global_stores(statements):
+    """
+    Return a sorted list of the global names that `statements` assign.
+    """
+    return sorted(set(node[1] for node in statements
+        if node[0] == 'store' and node[2] == 'global'))
+
+_Binary_opnames = dict((op, opname) for opname, op in Binary_ops.items())
+_Unary_opnames = dict((op, opname) for opname, op in Unary_ops.items())
+
+def emit(co, statements):
+    """
+    Append the instructions for `statements` to CodeObject `co`.
+    """
+    for stmt in statements:
+        if stmt[0] == 'store':
+            emit_expr(co, stmt[3])
+            co.append('STORE_FAST' if stmt[2] == 'fast' else 'STORE_GLOBAL',
+                stmt[1])
+        elif stmt[0] == 'return':
+            emit_expr(co, stmt[1])
+            co.append('RETURN_VALUE')
+        else:
+            raise ValueError("No instructions for statement %r"
+                % (stmt[0], ))
+
+def emit_expr(co, node):
+    """
+    Append the instructions that push the value of `node` to `co`.
+    """
+    kind = node[0]
+    if kind == 'const':
+        co.append('LOAD_CONST', node[1])
+    elif kind == 'load':
+        co.append('LOAD_FAST' if node[2] == 'fast' else 'LOAD_GLOBAL',
+            node[1])
+    elif kind == 'binary':
+        emit_expr(co, node[2])
+        emit_expr(co, node[3])
+        co.append(_Binary_opnames[node[1]])
+    elif kind == 'unary':
+        emit_expr(co, node[2])
+        co.append(_Unary_opnames[node[1]])
+    elif kind == 'call':
+        emit_expr(co, node[1])
+        call = CallSequence(co)
+        for arg in node[2]:
+            call.positional()
+            emit_expr(co, arg)
+        for name, value in node[3]:
+            call.keyword(name)
+            emit_expr(co, value)
+        call.finish()
+    elif kind == 'tee':
+        emit_expr(co, node[2])
+        co.append('DUP_TOP')
+        co.append('STORE_FAST', node[1])
+    else:
+        raise ValueError("No instructions for tree %r" % (kind, ))
+
+def hoist_tees(statements):
+    """
+    Return `statements` with 'tee' nodes moved out into 'store'
+    statements of their own, just before the statement that held them,
+    where that does not change what the program does. That is the case
+    when everything the statement evaluates before the tee is a
+    constant, a name already assigned, or another moved tee.
+
+    Tees that cannot be moved are left in place.
+    """
+    result = []
+    assigned = set()
+    for stmt in statements:
+        hoisted = []
+        value, clean = _hoist(stmt[-1], hoisted, assigned, True)
+        for store in hoisted:
+            assigned.add(store[1])
+        result.extend(hoisted)
+        if stmt[0] == 'store':
+            result.append(stmt[:3] + (value, ))
+            assigned.add(stmt[1])
+        else:
+            result.append((stmt[0], value))
+    return result
+
+def _hoist(node, hoisted, assigned, clean):
+    """
+    Return (`node` with its movable tees moved into `hoisted`, whether
+    evaluation is still clean after it). `clean` says whether it is
+    clean before `node`: nothing evaluated so far may raise an exception
+    or have an effect.
+    """
+    kind = node[0]
+    if kind == 'const':
+        return node, clean
+    elif kind == 'load':
+        return node, clean and (node[1] in assigned or any(
+            store[1] == node[1] for store in hoisted))
+    elif kind == 'tee':
+        value, ignored = _hoist(node[2], hoisted, assigned, clean)
+        if clean:
+            hoisted.append(('store', node[1], 'fast', value))
+            return ('load', node[1], 'fast'), True
+        return ('tee', node[1], value), False
+    elif kind == 'binary':
+        left, clean = _hoist(node[2], hoisted, assigned, clean)
+        right, clean = _hoist(node[3], hoisted, assigned, clean)
+        return ('binary', node[1], left, right), False
+    elif kind == 'unary':
+        operand, clean = _hoist(node[2], hoisted, assigned, clean)
+        return ('unary', node[1], operand), False
+    elif kind == 'call':
+        func, clean = _hoist(node[1], hoisted, assigned, clean)
+        args = []
+        for arg in node[2]:
+            arg, clean = _hoist(arg, hoisted, assigned, clean)
+            args.append(arg)
+        keywords = []
+        for name, value in node[3]:
+            value, clean = _hoist(value, hoisted, assigned, clean)
+            keywords.append((name, value))
+        return ('call', func, tuple(args), tuple(keywords)), False
+    raise ValueError("No expression form for tree %r" % (kind, ))
@@ -0,0 +1,458 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    ch04.vm
+    ~~~~~~~
+
+    A small stack machine that runs the instructions logged in a
+    CodeObject, for hosts that may not execute CPython bytecode. The
+    instructions are decoded once into a `Program`: a list of (handler,
+    argument) pairs, where each handler is the function that carries
+    out the instruction and each argument is already resolved to a
+    constant, a local slot number or a name. Running the program is
+    then a single loop of handler calls, with no opcode dispatch. Jump
+    targets are resolved to positions in the list, and a jump handler
+    sets the frame's `pc`, the position of the next instruction to run.
+    The NOP that marks a jump table (see
+    `CodeObject.append_jump_table`) becomes a handler that indexes the
+    table, skipping the compares that follow it.
+
+    A program's `tracer`, if it has one, is told of each source line
+    that starts to run, as `sys.settrace` reports the lines of Python
+    functions (see `ch04.profiler`).
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import bisect
+import builtins
+import operator
+
+from .bytecode import Packed_calls
+
+class _Unbound:
+    """Marks a local variable that has not been assigned."""
+
+    def __repr__(self):
+        return '<unbound>'
+
+_Unassigned = _Unbound()
+""" The value of every local variable until it is assigned.  """
+
+class Frame:
+    """
+    The state of one run of a program: its value stack, its local
+    variables (by slot number) and its globals.
+    """
+    __slots__ = ('program', 'stack', 'fast', 'globals', 'pc')
+
+    def __init__(self, program, globs):
+        self.program = program
+        self.pc = 0
+        self.stack = []
+        self.fast = [_Unassigned] * len(program.varnames)
+        self.globals = globs
+
+##### Instruction handlers
+#
+# Each handler is called as handler(frame, arg). A handler returns a true
+# value only to stop the program.
+
+def _load_const(frame, value):
+    frame.stack.append(value)
+
+def _load_fast(frame, index):
+    value = frame.fast[index]
+    if value is _Unassigned:
+        raise UnboundLocalError("local variable '%s' referenced before "
+            "assignment" % frame.program.varnames[index])
+    frame.stack.append(value)
+
+def _store_fast(frame, index):
+    frame.fast[index] = frame.stack.pop()
+
+def _delete_fast(frame, index):
+    if frame.fast[index] is _Unassigned:
+        raise UnboundLocalError("local variable '%s' referenced before "
+            "assignment" % frame.program.varnames[index])
+    frame.fast[index] = _Unassigned
+
+def _load_global(frame, name):
+    try:
+        value = frame.globals[name]
+    except KeyError:
+        try:
+            value = getattr(builtins, name)
+        except AttributeError:
+            raise NameError("name '%s' is not defined" % name)
+    frame.stack.append(value)
+
+def _store_global(frame, name):
+    frame.globals[name] = frame.stack.pop()
+
+def _binary_add(frame, arg):
+    stack = frame.stack
+    right = stack.pop()
+    stack[-1] = stack[-1] + right
+
+def _binary_subtract(frame, arg):
+    stack = frame.stack
+    right = stack.pop()
+    stack[-1] = stack[-1] - right
+
+def _binary_multiply(frame, arg):
+    stack = frame.stack
+    right = stack.pop()
+    stack[-1] = stack[-1] * right
+
+def _binary_floor_divide(frame, arg):
+    stack = frame.stack
+    right = stack.pop()
+    stack[-1] = stack[-1] // right
+
+def _unary_negative(frame, arg):
+    stack = frame.stack
+    stack[-1] = -stack[-1]
+
+def _unary_positive(frame, arg):
+    stack = frame.stack
+    stack[-1] = +stack[-1]
+
+def _unary_not(frame, arg):
+    stack = frame.stack
+    stack[-1] = not stack[-1]
+
+def _binary_and(frame, arg):
+    stack = frame.stack
+    right = stack.pop()
+    stack[-1] = stack[-1] & right
+
+def _binary_or(frame, arg):
+    stack = frame.stack
+    right = stack.pop()
+    stack[-1] = stack[-1] | right
+
+def _call_function_packed(frame, arg):
+    stack = frame.stack
+    kwargs = {}
+    for i in range((arg >> 8) & 0xFF):
+        value = stack.pop()
+        kwargs[stack.pop()] = value
+    npos = arg & 0xFF
+    if npos:
+        args = stack[-npos:]
+        del stack[-npos:]
+    else:
+        args = ()
+    stack[-1] = stack[-1](*args, **kwargs)
+
+def _call_function(frame, arg):
+    stack = frame.stack
+    if arg:
+        args = stack[-arg:]
+        del stack[-arg:]
+    else:
+        args = ()
+    stack[-1] = stack[-1](*args)
+
+def _call_function_kw(frame, arg):
+    stack = frame.stack
+    names = stack.pop()
+    kwargs = dict(zip(names, stack[-len(names):]))
+    args = stack[-arg:-len(names)]
+    del stack[-arg:]
+    stack[-1] = stack[-1](*args, **kwargs)
+
+def _call_function_ex(frame, arg):
+    stack = frame.stack
+    kwargs = stack.pop() if arg & 1 else {}
+    args = stack.pop()
+    stack[-1] = stack[-1](*args, **kwargs)
+
+def _build_tuple(frame, arg):
+    stack = frame.stack
+    if arg:
+        items = tuple(stack[-arg:])
+        del stack[-arg:]
+    else:
+        items = ()
+    stack.append(items)
+
+def _build_const_key_map(frame, arg):
+    stack = frame.stack
+    names = stack.pop()
+    items = dict(zip(names, stack[-arg:]))
+    del stack[-arg:]
+    stack.append(items)
+
+def _compare_op(frame, compare):
+    stack = frame.stack
+    right = stack.pop()
+    stack[-1] = compare(stack[-1], right)
+
+def _dup_top(frame, arg):
+    frame.stack.append(frame.stack[-1])
+
+def _pop_top(frame, arg):
+    frame.stack.pop()
+
+def _rot_two(frame, arg):
+    stack = frame.stack
+    stack[-1], stack[-2] = stack[-2], stack[-1]
+
+def _rot_three(frame, arg):
+    stack = frame.stack
+    stack[-1], stack[-2], stack[-3] = stack[-2], stack[-3], stack[-1]
+
+def _jump(frame, target):
+    frame.pc = target
+
+def _pop_jump_if_false(frame, target):
+    if not frame.stack.pop():
+        frame.pc = target
+
+def _pop_jump_if_true(frame, target):
+    if frame.stack.pop():
+        frame.pc = target
+
+def _jump_if_false_or_pop(frame, target):
+    if frame.stack[-1]:
+        frame.stack.pop()
+    else:
+        frame.pc = target
+
+def _jump_if_true_or_pop(frame, target):
+    if frame.stack[-1]:
+        frame.pc = target
+    else:
+        frame.stack.pop()
+
+def _nop(frame, arg):
+    pass
+
+def _jump_table(frame, table):
+    slot, low, targets, default = table
+    value = frame.fast[slot]
+    if type(value) is int:
+        value -= low
+        frame.pc = targets[value] if 0 <= value < len(targets) else default
+    # Other values fall through to the compares after the table.
+
+def _return_value(frame, arg):
+    return True
+
+Handlers = {
+    'LOAD_CONST': _load_const,
+    'LOAD_FAST': _load_fast,
+    'STORE_FAST': _store_fast,
+    'DELETE_FAST': _delete_fast,
+    'LOAD_GLOBAL': _load_global,
+    'STORE_GLOBAL': _store_global,
+    'LOAD_NAME': _load_global,
+    'STORE_NAME': _store_global,
+    'BINARY_ADD': _binary_add,
+    'BINARY_SUBTRACT': _binary_subtract,
+    'BINARY_MULTIPLY': _binary_multiply,
+    'BINARY_FLOOR_DIVIDE': _binary_floor_divide,
+    'UNARY_NEGATIVE': _unary_negative,
+    'UNARY_POSITIVE': _unary_positive,
+    'UNARY_NOT': _unary_not,
+    'BINARY_AND': _binary_and,
+    'BINARY_OR': _binary_or,
+    'CALL_FUNCTION': _call_function_packed if Packed_calls
+        else _call_function,
+    'CALL_FUNCTION_KW': _call_function_kw,
+    'CALL_FUNCTION_EX': _call_function_ex,
+    'BUILD_TUPLE': _build_tuple,
+    'BUILD_CONST_KEY_MAP': _build_const_key_map,
+    'COMPARE_OP': _compare_op,
+    'DUP_TOP': _dup_top,
+    'POP_TOP': _pop_top,
+    'ROT_TWO': _rot_two,
+    'ROT_THREE': _rot_three,
+    'NOP': _nop,
+    'JUMP_ABSOLUTE': _jump,
+    'JUMP_FORWARD': _jump,
+    'POP_JUMP_IF_FALSE': _pop_jump_if_false,
+    'POP_JUMP_IF_TRUE': _pop_jump_if_true,
+    'JUMP_IF_FALSE_OR_POP': _jump_if_false_or_pop,
+    'JUMP_IF_TRUE_OR_POP': _jump_if_true_or_pop,
+    'RETURN_VALUE': _return_value,
+}
+""" Handler for each opcode the VM supports, by name.  """
+
+_Local_opcodes = frozenset(('LOAD_FAST', 'STORE_FAST', 'DELETE_FAST'))
+
+_Jump_opcodes = frozenset(('JUMP_ABSOLUTE', 'JUMP_FORWARD',
+    'POP_JUMP_IF_FALSE', 'POP_JUMP_IF_TRUE', 'JUMP_IF_FALSE_OR_POP',
+    'JUMP_IF_TRUE_OR_POP'))
+
+_Compare_ops = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+class Program:
+    """
+    The instructions of a CodeObject, decoded for the VM.
+    """
+    __slots__ = ('argcount', 'code', 'jumps', 'kwonlycount', 'lines',
+        'name', 'tracer', 'varnames')
+
+    def __init__(self, co):
+        self.name = co.co_name
+        self.argcount = co.co_argcount
+        self.kwonlycount = co.co_kwonlyargcount
+        self.varnames = list(co.co_varnames)
+        slots = dict((name, i) for i, name in enumerate(self.varnames))
+        offsets = co.logged_offsets()
+        starts, linenos = co._line_starts()
+        # Source line of each instruction.
+        self.lines = [linenos[bisect.bisect_right(starts, offset) - 1]
+            for offset in offsets]
+        # Called as tracer(frame, event, lineno) if set; see _run_traced.
+        self.tracer = None
+        jumps = co.logged_jumps(offsets)
+        index_at = dict((offset, i) for i, offset in enumerate(offsets))
+        code = []
+        self.jumps = False
+        for i, (opname, opnum, arg) in enumerate(co._appended_ops):
+            try:
+                handler = Handlers[opname]
+            except KeyError:
+                raise ValueError("The VM does not support instruction %s"
+                    % opname)
+            if opname in _Local_opcodes:
+                arg = slots[arg]
+            elif opname in _Jump_opcodes:
+                arg = index_at[jumps[i]]
+                self.jumps = True
+            elif opname == 'COMPARE_OP':
+                try:
+                    arg = _Compare_ops[arg]
+                except KeyError:
+                    raise ValueError("The VM does not support comparison %r"
+                        % (arg, ))
+            code.append((handler, arg))
+        for i, (local, low, targets, default) in co.jump_tables.items():
+            code[i] = (_jump_table, (slots[local], low,
+                tuple(index_at[label.offset] for label in targets),
+                index_at[default.offset]))
+        self.code = code
+
+    def bind_args(self, args, kwargs, defaults=None, kwdefaults=None):
+        """
+        Return the tuple of parameter values for a call with positional
+        arguments `args` and keyword arguments `kwargs`, as a Python
+        function would bind them. Positional parameters left out take
+        their values from the end of `defaults`, and keyword-only ones
+        from the dict `kwdefaults`. Raise TypeError if the arguments do
+        not fit the parameters.
+        """
+        argcount = self.argcount
+        nparams = argcount + self.kwonlycount
+        if len(args) > argcount:
+            raise TypeError("%s() takes %d positional arguments but %d "
+                "were given" % (self.name, argcount, len(args)))
+        values = list(args) + [_Unassigned] * (nparams - len(args))
+        params = self.varnames[:nparams]
+        for name, value in kwargs.items():
+            try:
+                slot = params.index(name)
+            except ValueError:
+                raise TypeError("%s() got an unexpected keyword argument "
+                    "'%s'" % (self.name, name))
+            if values[slot] is not _Unassigned:
+                raise TypeError("%s() got multiple values for argument "
+                    "'%s'" % (self.name, name))
+            values[slot] = value
+        first_default = argcount - len(defaults or ())
+        for slot, value in enumerate(values):
+            if value is not _Unassigned:
+                continue
+            if slot >= argcount and params[slot] in (kwdefaults or {}):
+                values[slot] = kwdefaults[params[slot]]
+            elif first_default <= slot < argcount:
+                values[slot] = defaults[slot - first_default]
+            else:
+                raise TypeError("%s() missing required argument: '%s'"
+                    % (self.name, params[slot]))
+        return tuple(values)
+
+    def run(self, globs=None, args=()):
+        """
+        Run the program with globals `globs` (by default, a new empty
+        dict), passing it the parameter values `args`, keyword-only
+        parameters last. Return the value it returns.
+        """
+        frame = Frame(self, {} if globs is None else globs)
+        nparams = self.argcount + self.kwonlycount
+        if len(args) != nparams:
+            raise TypeError("%s() takes %d arguments (%d given)"
+                % (self.name, nparams, len(args)))
+        frame.fast[:len(args)] = args
+        if self.tracer is not None:
+            return self._run_traced(frame, self.tracer)
+        if not self.jumps:
+            for handler, arg in self.code:
+                if handler(frame, arg):
+                    return frame.stack.pop()
+        else:
+            code = self.code
+            end = len(code)
+            while frame.pc < end:
+                handler, arg = code[frame.pc]
+                frame.pc += 1
+                if handler(frame, arg):
+                    return frame.stack.pop()
+        raise ValueError("Program %s ended without returning" % self.name)
+
+    def _run_traced(self, frame, tracer):
+        """
+        Run the program in `frame`, calling tracer(frame, 'line', lineno)
+        when an instruction of a new line is reached, or a jump goes back,
+        and tracer(frame, 'return', None) when the program stops.
+        """
+        code = self.code
+        lines = self.lines
+        end = len(code)
+        lineno = None
+        last = -1
+        try:
+            while frame.pc < end:
+                pc = frame.pc
+                if lines[pc] != lineno or pc <= last:
+                    lineno = lines[pc]
+                    tracer(frame, 'line', lineno)
+                last = pc
+                handler, arg = code[pc]
+                frame.pc = pc + 1
+                if handler(frame, arg):
+                    return frame.stack.pop()
+        finally:
+            tracer(frame, 'return', None)
+        raise ValueError("Program %s ended without returning" % self.name)
+
+def to_function(co, globs=None):
+    """
+    Decode CodeObject `co` for the VM. Return a function that runs it
+    with globals `globs`, taking the parameters of `co` as arguments,
+    by position or by name. Parameters left out take their values from
+    the function's `__defaults__` and `__kwdefaults__`, as those of
+    Python functions do. The function's `program` is the Program it runs.
+    """
+    program = Program(co)
+    nparams = program.argcount + program.kwonlycount
+    globs = co.bind_globals({} if globs is None else globs)
+    def run(*args, **kwargs):
+        if kwargs or len(args) != nparams:
+            args = program.bind_args(args, kwargs, run.__defaults__,
+                run.__kwdefaults__)
+        return program.run(globs, args)
+    run.__name__ = co.co_name
+    run.program = program
+    return co.bind_constants(run, globs)
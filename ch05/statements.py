@@ -0,0 +1,667 @@
+#!/usr/bin/env python
+# vim: set et sts=4 sw=4 ts=4 tw=76
+"""
+    ch05.statements
+    ~~~~~~~~~~~~~~~
+
+    Statement compiler with bytecode generation for chapter 5 of `Let's
+    Build a Compiler (in Python)!`
+
+    The expressions are those of `ch04.expr2`. The statements are:
+
+        x=<expr>                    assignment
+        i<expr>{<block>}            if
+        i<expr>{<block>}l{<block>}  if ... else ('l' may also be followed
+                                    by another 'i', for else-if)
+        w<expr>{<block>}            while
+        d{<block>}w<expr>           do ... while
+        fk=<expr>,<expr>{<block>}   for k from the first value to the
+                                    second, inclusive
+        s<expr>{<n>{<block>}...l{<block>}}
+                                    switch: run the block of the case
+                                    whose integer <n> equals the value,
+                                    or else the 'l' block, which may be
+                                    left out
+        b                           break
+        c                           continue
+        z<expr>                     return
+
+    Simple statements, and do ... while, end with ';', which may be left
+    out before a '}' or the end of the program. A ';' on its own is an
+    empty statement. A condition is true if it is not zero. The keywords
+    are single letters, so 'b', 'c', 'd', 'f', 'i', 'l', 's', 'w' and
+    'z' cannot be assigned to. A program that does not end with a return
+    returns None. Switch cases do not fall through, and 'b' and 'c' in
+    them belong to the enclosing loop.
+
+    Loops test their condition at the bottom, so that each iteration
+    costs one conditional jump back to the top. A 'for' loop is entered
+    with a jump to its test. A 'while' loop has its condition compiled
+    twice instead: once before the loop, to skip it, and again at the
+    bottom.
+
+    A switch finds its case by the density of the case values. A few
+    cases are compared one by one. More are found by a binary search:
+    compares that halve the remaining cases each time. When the values
+    are dense, a jump table on them comes first as well, which the stack
+    VM indexes directly; CPython bytecode has no indirect jump, so the
+    bytecode backend runs the search.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import sys
+import io
+
+from ch04 import bytecode
+
+##### Error handling
+
+_Error = None
+""" Error-reporting output stream.  """
+
+def abort(msg):
+    """
+    Report an error and raise a SystemExit exception.
+    """
+    error(msg)
+    sys.exit(1)
+
+def error(msg):
+    """
+    Report an error. Wrap the message in newlines to separate it from
+    other output.
+    """
+    _Error.write("\n" + msg + "\n")
+
+def expected(what):
+    """
+    Report on an input value not present. Abort.
+    """
+    abort("'%s' expected." % what)
+
+##### Input handling
+
+_Input = None
+""" Input stream.  """
+
+Peek = None
+"""
+Peek stores the input look-ahead character. This is the next character
+in the input stream, and will be returned by get_char().
+"""
+
+def get_char():
+    """
+    Advance the input to the next character. Return the character consumed,
+    or None. Note that this function changes `Peek`, and returns the *old*
+    value of `Peek`.
+    """
+    global Peek
+    result = Peek
+    Peek = _Input.read(1) if _Input.readable() else None
+    if Peek == '':
+        # Handle ttys and StringIO objects: still readable but empty right now.
+        Peek = None
+    return result
+
+def get_identifier():
+    """
+    Expect that the next input will be an identifier. (Currently: 1 letter.)
+    Read and return the identifier. Abort if not found.
+    """
+    id = get_char()
+    if id is None or not id.isalpha():
+        expected('Identifier')
+    return id
+
+def get_number():
+    """
+    Expect that the next input will be a number. Read and return
+    the (single-digit) number. Abort if not found..
+    """
+    dig = get_char()
+    if dig is None or not dig.isdigit():
+        expected('Number')
+    return dig
+
+def get_integer():
+    """
+    Expect that the next input will be an integer: digits, perhaps after
+    a '-'. Read and return its value. Abort if not found.
+    """
+    sign = 1
+    if Peek == '-':
+        match('-')
+        sign = -1
+    if Peek is None or not Peek.isdigit():
+        expected('Integer')
+    digits = ''
+    while Peek is not None and Peek.isdigit():
+        digits += get_char()
+    return sign * int(digits)
+
+def match(ch):
+    """
+    Require that the next input read be the character given as a parameter.
+    Abort if not found.
+    """
+    if get_char() != ch:
+        expected(ch)
+
+##### Output functions
+
+_Code = None
+""" CodeObject for compiled results. """
+
+def emit(op, arg=None):
+    _Code.append(op, arg)
+
+##### Processing
+
+Reserved = frozenset('bcdfilswz')
+""" Keyword letters, which cannot be assigned to.  """
+
+Limit_prefix = '_f'
+""" Prefix of the hidden locals that hold the limits of 'for' loops.  """
+
+Switch_prefix = '_s'
+""" Prefix of the hidden locals that hold the values of switches.  """
+
+Linear_cases = 4
+""" Most cases a switch, or part of its search, compares one by one.  """
+
+Table_density = 0.5
+"""
+Least fraction of the values from the lowest case to the highest that
+must be cases for a switch to have a jump table.
+"""
+
+Switch_strategies = ('table', 'search', 'linear')
+
+_Loops = []
+""" (break label, continue label) of each loop being compiled, inner last.  """
+
+_Switch = None
+""" Strategy forced on switches by `compile`, or None to choose.  """
+
+def init(inp=None, out=None, err=None):
+    """
+    Prepare to compile from `inp`.
+    """
+    global _Code, _Input, _Error, _Loops, _Switch
+    _Error = err if err is not None else sys.stderr
+    _Input = inp if inp is not None else _Input
+    # 'prime the pump' to read first character, etc.
+    get_char()
+    _Code = bytecode.CodeObject()
+    _Loops = []
+    _Switch = None
+
+def compile(params=None, infer_params=False, switch=None):
+    """
+    Compile the program. Return a CodeObject. `params` may be a list of
+    local names that become the parameters of the compiled function, in
+    that order. If `infer_params` is true, the locals the program reads
+    before assigning them become parameters too, in alphabetical order
+    after those in `params`. `switch` may name one of
+    `Switch_strategies` to use for every switch, instead of choosing by
+    the case values.
+    """
+    global _Switch
+    if switch is not None and switch not in Switch_strategies:
+        raise ValueError("Unknown switch strategy %r" % (switch, ))
+    _Switch = switch
+    if params is not None:
+        for name in params:
+            if not name.isalpha() or is_global(name) or name in Reserved:
+                raise ValueError("Parameter %r is not a local name"
+                    % (name, ))
+        _Code.set_params(params)
+    returned = block()
+    if Peek is not None:
+        expected('Statement')
+    if not returned:
+        emit('LOAD_CONST', None)
+        emit('RETURN_VALUE')
+    if infer_params:
+        given = list(_Code.co_varnames[:_Code.co_argcount])
+        _Code.set_params(given + [name for name in free_locals(_Code)
+            if name not in given])
+    return _Code
+
+Backends = {
+    'bytecode': lambda co, globs: co.to_function(globs=globs),
+    'vm': lambda co, globs: _vm().to_function(co, globs),
+}
+"""
+Functions that turn a compiled CodeObject into a Python function, keyed
+by name. The ch04 ast and source backends work from statement trees,
+which have no form for jumps, so they are not offered here.
+"""
+
+def _vm():
+    from ch04 import vm
+    return vm
+
+def compile_function(globs=None, backend='vm', **options):
+    """
+    Compile the program, passing `options` to `compile`, and return it
+    as a function with globals `globs`, built by the backend named
+    `backend`.
+    """
+    return Backends[backend](compile(**options), globs)
+
+def free_locals(co):
+    """
+    Return a sorted list of the local names that the program in
+    CodeObject `co` reads before it assigns them: those it reads at an
+    offset before any assignment to them. Hidden locals are left out.
+    """
+    assigned = set()
+    free = set()
+    for opname, opnum, arg in co._appended_ops:
+        if opname == 'STORE_FAST':
+            assigned.add(arg)
+        elif opname == 'LOAD_FAST' and arg not in assigned \
+                and not arg.startswith('_'):
+            free.add(arg)
+    return sorted(free)
+
+##### Statements
+
+def block():
+    """
+    Compile statements up to a '}' or the end of the input. Return true
+    if the last statement was a return.
+    """
+    returned = False
+    while Peek is not None and Peek != '}':
+        returned = statement()
+    return returned
+
+def braced_block():
+    match('{')
+    block()
+    match('}')
+
+def statement():
+    """
+    Compile one statement. Return true if it was a return.
+    """
+    returned = False
+    if Peek == ';':
+        # An empty statement.
+        match(';')
+        return False
+    elif Peek == 'i':
+        stmt_if()
+        return False
+    elif Peek == 'w':
+        stmt_while()
+        return False
+    elif Peek == 'f':
+        stmt_for()
+        return False
+    elif Peek == 's':
+        stmt_switch()
+        return False
+    elif Peek == 'l':
+        abort("'l' without 'i'")
+    elif Peek == 'd':
+        stmt_do()
+    elif Peek == 'b':
+        stmt_break()
+    elif Peek == 'c':
+        stmt_continue()
+    elif Peek == 'z':
+        stmt_return()
+        returned = True
+    else:
+        stmt_assignment()
+    end_simple()
+    return returned
+
+def end_simple():
+    """
+    Match the ';' that ends a simple statement, unless it may be left
+    out.
+    """
+    if Peek is not None and Peek != '}':
+        match(';')
+
+def hidden_local(prefix):
+    """
+    Return a new hidden local name: `prefix` and a number not yet used
+    with it.
+    """
+    return '%s%d' % (prefix, sum(1 for name in _Code.co_varnames
+        if name.startswith(prefix)))
+
+def loop_body(break_label, continue_label):
+    _Loops.append((break_label, continue_label))
+    braced_block()
+    _Loops.pop()
+
+def stmt_assignment():
+    lvalue = get_identifier()
+    if lvalue in Reserved:
+        abort("Cannot assign to keyword '%s'" % lvalue)
+    match('=')
+    expression()
+    emit_store_var(lvalue)
+
+def stmt_break():
+    match('b')
+    if not _Loops:
+        abort("'b' outside a loop")
+    emit('JUMP_ABSOLUTE', _Loops[-1][0])
+
+def stmt_continue():
+    match('c')
+    if not _Loops:
+        abort("'c' outside a loop")
+    emit('JUMP_ABSOLUTE', _Loops[-1][1])
+
+def stmt_do():
+    match('d')
+    top = _Code.new_label()
+    test = _Code.new_label()
+    done = _Code.new_label()
+    _Code.set_label(top)
+    loop_body(done, test)
+    match('w')
+    _Code.set_label(test)
+    expression()
+    emit('POP_JUMP_IF_TRUE', top)
+    _Code.set_label(done)
+
+def stmt_for():
+    match('f')
+    counter = get_identifier()
+    if counter in Reserved:
+        abort("Cannot assign to keyword '%s'" % counter)
+    match('=')
+    expression()
+    emit_store_var(counter)
+    match(',')
+    limit = hidden_local(Limit_prefix)
+    expression()
+    emit('STORE_FAST', limit)
+    top = _Code.new_label()
+    step = _Code.new_label()
+    test = _Code.new_label()
+    done = _Code.new_label()
+    emit('JUMP_FORWARD', test)
+    _Code.set_label(top)
+    loop_body(done, step)
+    _Code.set_label(step)
+    emit_load_var(counter)
+    emit('LOAD_CONST', 1)
+    emit('BINARY_ADD')
+    emit_store_var(counter)
+    _Code.set_label(test)
+    emit_load_var(counter)
+    emit('LOAD_FAST', limit)
+    emit('COMPARE_OP', '<=')
+    emit('POP_JUMP_IF_TRUE', top)
+    _Code.set_label(done)
+
+def stmt_if():
+    match('i')
+    other = _Code.new_label()
+    expression()
+    emit('POP_JUMP_IF_FALSE', other)
+    braced_block()
+    if Peek != 'l':
+        _Code.set_label(other)
+        return
+    match('l')
+    done = _Code.new_label()
+    emit('JUMP_FORWARD', done)
+    _Code.set_label(other)
+    if Peek == 'i':
+        stmt_if()
+    else:
+        braced_block()
+    _Code.set_label(done)
+
+def stmt_return():
+    match('z')
+    expression()
+    emit('RETURN_VALUE')
+
+def stmt_switch():
+    match('s')
+    expression()
+    local = hidden_local(Switch_prefix)
+    emit('STORE_FAST', local)
+    # The case values are not known until the bodies have been read, so
+    # the dispatch goes after the bodies, and is reached by a jump.
+    match('{')
+    dispatch = _Code.new_label()
+    done = _Code.new_label()
+    default = done
+    cases = {}
+    emit('JUMP_ABSOLUTE', dispatch)
+    while Peek is not None and Peek != '}':
+        if Peek == 'l':
+            match('l')
+            if default is not done:
+                abort("Duplicate default case")
+            default = label = _Code.new_label()
+        else:
+            value = get_integer()
+            if value in cases:
+                abort("Duplicate case %d" % value)
+            cases[value] = label = _Code.new_label()
+        _Code.set_label(label)
+        match('{')
+        returned = block()
+        match('}')
+        if not returned:
+            emit('JUMP_ABSOLUTE', done)
+    match('}')
+    _Code.set_label(dispatch)
+    emit_dispatch(local, sorted(cases.items()), default)
+    _Code.set_label(done)
+
+def emit_dispatch(local, cases, default):
+    """
+    Emit code that jumps to the label of the case in `cases`, a sorted
+    list of (value, Label) pairs, whose value local `local` holds, or to
+    Label `default`.
+    """
+    strategy = _Switch
+    if strategy is None:
+        strategy = 'linear'
+        if len(cases) > Linear_cases:
+            span = cases[-1][0] - cases[0][0] + 1
+            strategy = 'table' if len(cases) >= Table_density * span \
+                else 'search'
+    if strategy == 'table' and cases:
+        low = cases[0][0]
+        labels = dict(cases)
+        _Code.append_jump_table(local, low, [labels.get(value, default)
+            for value in range(low, cases[-1][0] + 1)], default)
+    emit_search(local, cases, default,
+        len(cases) if strategy == 'linear' else Linear_cases)
+
+def emit_search(local, cases, default, linear):
+    """
+    Emit a binary search of `cases` for the value of local `local`,
+    comparing at most `linear` cases one by one.
+    """
+    if len(cases) <= linear:
+        for value, label in cases:
+            emit('LOAD_FAST', local)
+            emit('LOAD_CONST', value)
+            emit('COMPARE_OP', '==')
+            emit('POP_JUMP_IF_TRUE', label)
+        emit('JUMP_ABSOLUTE', default)
+        return
+    middle = len(cases) // 2
+    lower = _Code.new_label()
+    emit('LOAD_FAST', local)
+    emit('LOAD_CONST', cases[middle][0])
+    emit('COMPARE_OP', '<')
+    emit('POP_JUMP_IF_TRUE', lower)
+    emit_search(local, cases[middle:], default, linear)
+    _Code.set_label(lower)
+    emit_search(local, cases[:middle], default, linear)
+
+def stmt_while():
+    match('w')
+    top = _Code.new_label()
+    test = _Code.new_label()
+    done = _Code.new_label()
+    # The condition comes before the body in the source, but is wanted
+    # after it. Compile it once, as a guard, and append it again at the
+    # bottom.
+    start = len(_Code._appended_ops)
+    expression()
+    stop = len(_Code._appended_ops)
+    emit('POP_JUMP_IF_FALSE', done)
+    _Code.set_label(top)
+    loop_body(done, test)
+    _Code.set_label(test)
+    _Code.repeat_instructions(start, stop)
+    emit('POP_JUMP_IF_TRUE', top)
+    _Code.set_label(done)
+
+##### Expressions
+
+def emit_load_var(varname):
+    emit('LOAD_GLOBAL' if is_global(varname) else 'LOAD_FAST', varname)
+
+def emit_store_var(varname):
+    emit('STORE_GLOBAL' if is_global(varname) else 'STORE_FAST', varname)
+
+def expr_add():
+    match('+')
+    expr_mulop()
+    emit('BINARY_ADD')
+
+def expr_addop(varname=None):
+    expr_mulop(varname)
+    while Peek is not None and Peek in "+-":
+        if Peek == "+":
+            expr_add()
+        else:
+            expr_subtract()
+
+def expr_argument(call, funcname):
+    """
+    Compile one argument of a call: `name=expression` for a keyword
+    argument, or an expression.
+    """
+    varname = None
+    if Peek is not None and Peek.isalpha():
+        varname = get_identifier()
+        if Peek == '=':
+            match('=')
+            try:
+                call.keyword(varname)
+            except ValueError as e:
+                abort("%s in call to '%s'" % (e, funcname))
+            expression()
+            return
+    try:
+        call.positional()
+    except ValueError as e:
+        abort("%s in call to '%s'" % (e, funcname))
+    expression(varname)
+
+def expr_atom(varname=None):
+    if varname is not None:
+        expr_read_var(varname)
+    elif Peek == '(':
+        match('(')
+        expression()
+        match(')')
+    elif Peek is not None and Peek.isalpha():
+        expr_read_var()
+    else:
+        num = int(get_number())
+        emit('LOAD_CONST', num)
+
+def expr_call(funcname):
+    match('(')
+    emit('LOAD_GLOBAL', funcname)
+    call = bytecode.CallSequence(_Code)
+    if Peek != ')':
+        expr_argument(call, funcname)
+        while Peek == ',':
+            match(',')
+            expr_argument(call, funcname)
+    match(')')
+    try:
+        call.finish()
+    except ValueError as e:
+        abort("%s in call to '%s'" % (e, funcname))
+
+def expr_divide():
+    match('/')
+    expr_unary()
+    emit('BINARY_FLOOR_DIVIDE')
+
+def expr_mulop(varname=None):
+    expr_unary(varname)
+    while Peek is not None and Peek in "*/":
+        if Peek == "*":
+            expr_multiply()
+        else:
+            expr_divide()
+
+def expr_multiply():
+    match('*')
+    expr_unary()
+    emit('BINARY_MULTIPLY')
+
+def expr_read_var(varname=None):
+    if varname is None:
+        varname = get_identifier()
+    if Peek == '(':
+        expr_call(varname)
+    else:
+        emit_load_var(varname)
+
+def expr_subtract():
+    match('-')
+    expr_mulop()
+    emit('BINARY_SUBTRACT')
+
+def expr_unary(varname=None):
+    if varname is not None:
+        expr_atom(varname)
+    elif Peek == "+":
+        match('+')
+        expr_atom()
+    elif Peek == "-":
+        match('-')
+        expr_atom()
+        emit('UNARY_NEGATIVE')
+    else:
+        expr_atom()
+
+def expression(varname=None):
+    """
+    Compile an expression. If its first identifier has already been read,
+    it is passed as `varname`.
+    """
+    expr_addop(varname)
+
+def is_global(name):
+    return name[0].isupper()
+
+def main():
+    print("Enter your code on a single line. Enter '.' by itself to quit.")
+    while True:
+        line = input()
+        if line == ".":
+            break
+        init(inp=io.StringIO(line))
+        compile()
+
+if __name__ == '__main__':
+    main()
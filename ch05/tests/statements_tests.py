@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4
+"""
+    ch05.tests.statements_tests
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Specifies the behavior of the ch05/statements compiler.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+from io import StringIO
+import unittest
+
+from ch05 import statements as compiler
+from ch04.bytecode import instructions_match
+
+class TestCompiler(unittest.TestCase):
+
+    def compile(self, text, **options):
+        self.err = StringIO()
+        compiler.init(inp=StringIO(text), err=self.err)
+        return compiler.compile(**options)
+
+    def function(self, text, globs=None, **options):
+        self.err = StringIO()
+        compiler.init(inp=StringIO(text), err=self.err)
+        return compiler.compile_function(globs, **options)
+
+    def assertAborts(self, text, message):
+        with self.assertRaises(SystemExit):
+            self.compile(text)
+        self.assertIn(message, self.err.getvalue())
+
+    def test_assignment(self):
+        asm = """
+            LOAD_CONST (1)
+            STORE_FAST (x)
+            LOAD_CONST
+            RETURN_VALUE
+        """
+        co = self.compile('x=1')
+        instructions_match(co, asm)
+        self.assertIsNone(co._appended_ops[2][2])
+        self.assertIsNone(self.function('x=1')())
+
+    def test_if(self):
+        fn = self.function('x=1;in-3{x=2};zx', params=['n'])
+        self.assertEqual([2, 1], [fn(1), fn(3)])
+
+    def test_if_else(self):
+        fn = self.function('ix{z1}liy{z2}l{z3}', params=['x', 'y'])
+        self.assertEqual([1, 2, 3], [fn(1, 0), fn(0, 1), fn(0, 0)])
+
+    def test_while(self):
+        asm = """
+            LOAD_CONST (0)
+            STORE_FAST (t)
+            LOAD_FAST (n)
+            POP_JUMP_IF_FALSE
+            LOAD_FAST (t)
+            LOAD_FAST (n)
+            BINARY_ADD
+            STORE_FAST (t)
+            LOAD_FAST (n)
+            LOAD_CONST (1)
+            BINARY_SUBTRACT
+            STORE_FAST (n)
+            LOAD_FAST (n)
+            POP_JUMP_IF_TRUE (12)
+            LOAD_FAST (t)
+            RETURN_VALUE
+        """
+        text = 't=0;wn{t=t+n;n=n-1};zt'
+        instructions_match(self.compile(text, params=['n']), asm)
+        fn = self.function(text, params=['n'])
+        self.assertEqual([55, 0], [fn(10), fn(0)])
+
+    def test_do_while(self):
+        fn = self.function('t=0;d{t=t+n;n=n-1}wn;zt', params=['n'])
+        self.assertEqual([55, 1], [fn(10), fn(1)])
+
+    def test_for(self):
+        asm = """
+            LOAD_CONST (0)
+            STORE_FAST (t)
+            LOAD_CONST (1)
+            STORE_FAST (k)
+            LOAD_FAST (n)
+            STORE_FAST (_f0)
+            JUMP_FORWARD
+            LOAD_FAST (t)
+            LOAD_FAST (k)
+            BINARY_ADD
+            STORE_FAST (t)
+            LOAD_FAST (k)
+            LOAD_CONST (1)
+            BINARY_ADD
+            STORE_FAST (k)
+            LOAD_FAST (k)
+            LOAD_FAST (_f0)
+            COMPARE_OP (<=)
+            POP_JUMP_IF_TRUE (21)
+        """
+        text = 't=0;fk=1,n{t=t+k};zt'
+        instructions_match(self.compile(text, params=['n']), asm)
+        fn = self.function(text, params=['n'])
+        self.assertEqual([55, 0], [fn(10), fn(0)])
+
+    def test_nested_for(self):
+        fn = self.function('t=0;fj=1,n{fk=j,n{t=t+1}};zt', params=['n'])
+        self.assertEqual(10, fn(4))
+
+    def test_break_continue(self):
+        text = 't=0;fk=1,n{ik-5{}l{c};t=t+k;ik-8{}l{b}};zt'
+        fn = self.function(text, params=['n'])
+        self.assertEqual([31, 6], [fn(10), fn(3)])
+        text = 't=0;wn{n=n-1;in-2{}l{c};t=t+n;in-6{}l{b}};zt'
+        fn = self.function(text, params=['n'])
+        self.assertEqual([30, 1], [fn(10), fn(3)])
+
+    def test_switch(self):
+        text = 'r=0;sn{1{r=5}2{r=6}-3{zn}10{r=7}12{r=8}l{r=9}};zr'
+        for switch in (None, ) + compiler.Switch_strategies:
+            fn = self.function(text, params=['n'], switch=switch)
+            self.assertEqual([5, 6, -3, 7, 8, 9, 9],
+                [fn(1), fn(2), fn(-3), fn(10), fn(12), fn(0), fn(11)],
+                switch)
+        fn = self.function('r=0;sn{1{r=5}};zr', params=['n'])
+        self.assertEqual([5, 0], [fn(1), fn(2)])
+
+    def test_switch_strategy(self):
+        def tables(values):
+            text = 'sn{%s}' % ''.join('%d{}' % value for value in values)
+            return len(self.compile(text, params=['n']).jump_tables)
+        self.assertEqual(0, tables(range(compiler.Linear_cases)))
+        self.assertEqual(1, tables(range(0, 20, 2)))
+        self.assertEqual(0, tables(range(0, 30, 3)))
+        self.assertRaises(ValueError, self.compile, 'x=1', switch='hash')
+
+    def test_switch_in_loop(self):
+        text = 't=0;fk=1,n{sk{2{c}5{b}l{t=t+k}}};zt'
+        fn = self.function(text, params=['n'])
+        self.assertEqual([4, 8], [fn(3), fn(9)])
+
+    def test_large_jumps(self):
+        body = ';'.join('t=t+1' for i in range(8000))
+        fn = self.function('t=0;in{%s};zt' % body, params=['n'])
+        self.assertEqual([8000, 0], [fn(1), fn(0)])
+
+    def test_globals(self):
+        globs = {'N': 4}
+        self.function('S=0;wN{S=S+N;N=N-1}', globs)()
+        self.assertEqual(10, globs['S'])
+
+    def test_infer_params(self):
+        co = self.compile('t=0;fk=1,n{t=t+k*m};zt', infer_params=True)
+        self.assertEqual(['m', 'n'], co.co_varnames[:co.co_argcount])
+
+    def test_stack_depth(self):
+        co = self.compile('t=0;fk=1,n{t=t+k*(k+1)};zt', params=['n'])
+        self.assertEqual(4, co.stack_depth())
+
+    def test_errors(self):
+        self.assertAborts('b', "'b' outside a loop")
+        self.assertAborts('wn{c};c', "'c' outside a loop")
+        self.assertAborts('l{x=1}', "'l' without 'i'")
+        self.assertAborts('fb=1,2{}', "Cannot assign to keyword 'b'")
+        self.assertAborts('wn{x=1', "'}' expected")
+        self.assertAborts('x=1}', "'Statement' expected")
+        self.assertAborts('sn{1{}1{}}', "Duplicate case 1")
+        self.assertAborts('sn{l{}l{}}', "Duplicate default case")
+        self.assertAborts('sn{x{}}', "'Integer' expected")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,892 @@
+#!/usr/bin/env python
+# vim: set et sts=4 sw=4 ts=4 tw=76
+"""
+    ch06.logical
+    ~~~~~~~~~~~~
+
+    Logical expression compiler with bytecode generation for chapter 6
+    of `Let's Build a Compiler (in Python)!`
+
+    The statements are those of `ch05.statements`. Expressions gain
+    relations, logical operators and boolean constants. From the
+    loosest binding to the tightest:
+
+        a|b                         or
+        a&b                         and
+        !a                          not
+        a=b  a#b  a<b  a<=b  a>b  a>=b
+                                    relations: equal, not equal, less,
+                                    and so on. They chain, as in Python:
+                                    a<b<c is a<b&b<c, with b found once
+        a+b  a-b  a*b  a/b  -a      arithmetic, as in `ch04.expr2`
+        T  F                        true and false
+
+    Logical operators short-circuit: the right side is only found if
+    the left does not decide the result. Their values, and those of
+    relations, are True or False; a value that is not a boolean is true
+    if it is not zero. T and F cannot be assigned to, so they are not
+    globals. A keyword argument is written `name=value`, so a relation
+    passed as the argument of a call must be in parentheses.
+
+    A condition (in 'i', 'w' and do ... while) is compiled as jumps,
+    not values: in
+
+        ia<b&c<d{...}
+
+    each relation is followed by a jump past the block when it is
+    false, and no boolean is built for '&'. In a value, such as
+    `x=a<b&c<d`, the same jumps lead to code that loads True or False.
+    Chained relations are always found as values.
+
+    `compile(short_circuit=False)` compiles the logical operators as
+    values instead, for comparison: both sides are found, made
+    booleans, and combined with BINARY_AND or BINARY_OR, and a condition
+    tests the boolean that results.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import sys
+import io
+
+from ch04 import bytecode
+
+##### Error handling
+
+_Error = None
+""" Error-reporting output stream.  """
+
+def abort(msg):
+    """
+    Report an error and raise a SystemExit exception.
+    """
+    error(msg)
+    sys.exit(1)
+
+def error(msg):
+    """
+    Report an error. Wrap the message in newlines to separate it from
+    other output.
+    """
+    _Error.write("\n" + msg + "\n")
+
+def expected(what):
+    """
+    Report on an input value not present. Abort.
+    """
+    abort("'%s' expected." % what)
+
+##### Input handling
+
+_Input = None
+""" Input stream.  """
+
+Peek = None
+"""
+Peek stores the input look-ahead character. This is the next character
+in the input stream, and will be returned by get_char().
+"""
+
+def get_char():
+    """
+    Advance the input to the next character. Return the character consumed,
+    or None. Note that this function changes `Peek`, and returns the *old*
+    value of `Peek`.
+    """
+    global Peek
+    result = Peek
+    Peek = _Input.read(1) if _Input.readable() else None
+    if Peek == '':
+        # Handle ttys and StringIO objects: still readable but empty right now.
+        Peek = None
+    return result
+
+def get_identifier():
+    """
+    Expect that the next input will be an identifier. (Currently: 1 letter.)
+    Read and return the identifier. Abort if not found.
+    """
+    id = get_char()
+    if id is None or not id.isalpha():
+        expected('Identifier')
+    return id
+
+def get_number():
+    """
+    Expect that the next input will be a number. Read and return
+    the (single-digit) number. Abort if not found..
+    """
+    dig = get_char()
+    if dig is None or not dig.isdigit():
+        expected('Number')
+    return dig
+
+def get_integer():
+    """
+    Expect that the next input will be an integer: digits, perhaps after
+    a '-'. Read and return its value. Abort if not found.
+    """
+    sign = 1
+    if Peek == '-':
+        match('-')
+        sign = -1
+    if Peek is None or not Peek.isdigit():
+        expected('Integer')
+    digits = ''
+    while Peek is not None and Peek.isdigit():
+        digits += get_char()
+    return sign * int(digits)
+
+def match(ch):
+    """
+    Require that the next input read be the character given as a parameter.
+    Abort if not found.
+    """
+    if get_char() != ch:
+        expected(ch)
+
+##### Output functions
+
+_Code = None
+""" CodeObject for compiled results. """
+
+def emit(op, arg=None):
+    _Code.append(op, arg)
+
+##### Processing
+
+Booleans = {'T': True, 'F': False}
+""" Boolean constants, by name.  """
+
+Reserved = frozenset('bcdfilswz').union(Booleans)
+""" Keyword letters and constants, which cannot be assigned to.  """
+
+Operator_chars = '+-*/=#<>'
+""" Characters that may follow an operand, continuing an expression.  """
+
+Relations = {
+    '=': '==',
+    '#': '!=',
+    '<': '<',
+    '<=': '<=',
+    '>': '>',
+    '>=': '>=',
+}
+""" COMPARE_OP argument of each relation, by operator.  """
+
+Limit_prefix = '_f'
+""" Prefix of the hidden locals that hold the limits of 'for' loops.  """
+
+Switch_prefix = '_s'
+""" Prefix of the hidden locals that hold the values of switches.  """
+
+Linear_cases = 4
+""" Most cases a switch, or part of its search, compares one by one.  """
+
+Table_density = 0.5
+"""
+Least fraction of the values from the lowest case to the highest that
+must be cases for a switch to have a jump table.
+"""
+
+Switch_strategies = ('table', 'search', 'linear')
+
+_Loops = []
+""" (break label, continue label) of each loop being compiled, inner last.  """
+
+_Switch = None
+""" Strategy forced on switches by `compile`, or None to choose.  """
+
+_Short_circuit = True
+""" False to compile logical operators as values (see `compile`).  """
+
+def init(inp=None, out=None, err=None):
+    """
+    Prepare to compile from `inp`.
+    """
+    global _Code, _Input, _Error, _Loops, _Switch, _Short_circuit
+    _Error = err if err is not None else sys.stderr
+    _Input = inp if inp is not None else _Input
+    # 'prime the pump' to read first character, etc.
+    get_char()
+    _Code = bytecode.CodeObject()
+    _Loops = []
+    _Switch = None
+    _Short_circuit = True
+
+def compile(params=None, infer_params=False, switch=None,
+        short_circuit=True):
+    """
+    Compile the program. Return a CodeObject. `params` may be a list of
+    local names that become the parameters of the compiled function, in
+    that order. If `infer_params` is true, the locals the program reads
+    before assigning them become parameters too, in alphabetical order
+    after those in `params`. `switch` may name one of
+    `Switch_strategies` to use for every switch, instead of choosing by
+    the case values. If `short_circuit` is false, logical operators are
+    compiled as values that always find both sides.
+    """
+    global _Switch, _Short_circuit
+    if switch is not None and switch not in Switch_strategies:
+        raise ValueError("Unknown switch strategy %r" % (switch, ))
+    _Switch = switch
+    _Short_circuit = short_circuit
+    if params is not None:
+        for name in params:
+            if not name.isalpha() or is_global(name) or name in Reserved:
+                raise ValueError("Parameter %r is not a local name"
+                    % (name, ))
+        _Code.set_params(params)
+    returned = block()
+    if Peek is not None:
+        expected('Statement')
+    if not returned:
+        emit('LOAD_CONST', None)
+        emit('RETURN_VALUE')
+    if infer_params:
+        given = list(_Code.co_varnames[:_Code.co_argcount])
+        _Code.set_params(given + [name for name in free_locals(_Code)
+            if name not in given])
+    return _Code
+
+Backends = {
+    'bytecode': lambda co, globs: co.to_function(globs=globs),
+    'vm': lambda co, globs: _vm().to_function(co, globs),
+}
+"""
+Functions that turn a compiled CodeObject into a Python function, keyed
+by name. The ch04 ast and source backends work from statement trees,
+which have no form for jumps, so they are not offered here.
+"""
+
+def _vm():
+    from ch04 import vm
+    return vm
+
+def compile_function(globs=None, backend='vm', **options):
+    """
+    Compile the program, passing `options` to `compile`, and return it
+    as a function with globals `globs`, built by the backend named
+    `backend`.
+    """
+    return Backends[backend](compile(**options), globs)
+
+def free_locals(co):
+    """
+    Return a sorted list of the local names that the program in
+    CodeObject `co` reads before it assigns them: those it reads at an
+    offset before any assignment to them. Hidden locals are left out.
+    """
+    assigned = set()
+    free = set()
+    for opname, opnum, arg in co._appended_ops:
+        if opname == 'STORE_FAST':
+            assigned.add(arg)
+        elif opname == 'LOAD_FAST' and arg not in assigned \
+                and not arg.startswith('_'):
+            free.add(arg)
+    return sorted(free)
+
+##### Statements
+
+def block():
+    """
+    Compile statements up to a '}' or the end of the input. Return true
+    if the last statement was a return.
+    """
+    returned = False
+    while Peek is not None and Peek != '}':
+        returned = statement()
+    return returned
+
+def braced_block():
+    match('{')
+    block()
+    match('}')
+
+def statement():
+    """
+    Compile one statement. Return true if it was a return.
+    """
+    returned = False
+    if Peek == ';':
+        # An empty statement.
+        match(';')
+        return False
+    elif Peek == 'i':
+        stmt_if()
+        return False
+    elif Peek == 'w':
+        stmt_while()
+        return False
+    elif Peek == 'f':
+        stmt_for()
+        return False
+    elif Peek == 's':
+        stmt_switch()
+        return False
+    elif Peek == 'l':
+        abort("'l' without 'i'")
+    elif Peek == 'd':
+        stmt_do()
+    elif Peek == 'b':
+        stmt_break()
+    elif Peek == 'c':
+        stmt_continue()
+    elif Peek == 'z':
+        stmt_return()
+        returned = True
+    else:
+        stmt_assignment()
+    end_simple()
+    return returned
+
+def end_simple():
+    """
+    Match the ';' that ends a simple statement, unless it may be left
+    out.
+    """
+    if Peek is not None and Peek != '}':
+        match(';')
+
+def hidden_local(prefix):
+    """
+    Return a new hidden local name: `prefix` and a number not yet used
+    with it.
+    """
+    return '%s%d' % (prefix, sum(1 for name in _Code.co_varnames
+        if name.startswith(prefix)))
+
+def loop_body(break_label, continue_label):
+    _Loops.append((break_label, continue_label))
+    braced_block()
+    _Loops.pop()
+
+def stmt_assignment():
+    lvalue = get_identifier()
+    if lvalue in Reserved:
+        abort("Cannot assign to keyword '%s'" % lvalue)
+    match('=')
+    expression()
+    emit_store_var(lvalue)
+
+def stmt_break():
+    match('b')
+    if not _Loops:
+        abort("'b' outside a loop")
+    emit('JUMP_ABSOLUTE', _Loops[-1][0])
+
+def stmt_continue():
+    match('c')
+    if not _Loops:
+        abort("'c' outside a loop")
+    emit('JUMP_ABSOLUTE', _Loops[-1][1])
+
+def stmt_do():
+    match('d')
+    top = _Code.new_label()
+    test = _Code.new_label()
+    done = _Code.new_label()
+    _Code.set_label(top)
+    loop_body(done, test)
+    match('w')
+    _Code.set_label(test)
+    emit_condition(condition(), True, top)
+    _Code.set_label(done)
+
+def stmt_for():
+    match('f')
+    counter = get_identifier()
+    if counter in Reserved:
+        abort("Cannot assign to keyword '%s'" % counter)
+    match('=')
+    expression()
+    emit_store_var(counter)
+    match(',')
+    limit = hidden_local(Limit_prefix)
+    expression()
+    emit('STORE_FAST', limit)
+    top = _Code.new_label()
+    step = _Code.new_label()
+    test = _Code.new_label()
+    done = _Code.new_label()
+    emit('JUMP_FORWARD', test)
+    _Code.set_label(top)
+    loop_body(done, step)
+    _Code.set_label(step)
+    emit_load_var(counter)
+    emit('LOAD_CONST', 1)
+    emit('BINARY_ADD')
+    emit_store_var(counter)
+    _Code.set_label(test)
+    emit_load_var(counter)
+    emit('LOAD_FAST', limit)
+    emit('COMPARE_OP', '<=')
+    emit('POP_JUMP_IF_TRUE', top)
+    _Code.set_label(done)
+
+def stmt_if():
+    match('i')
+    other = _Code.new_label()
+    emit_condition(condition(), False, other)
+    braced_block()
+    if Peek != 'l':
+        _Code.set_label(other)
+        return
+    match('l')
+    done = _Code.new_label()
+    emit('JUMP_FORWARD', done)
+    _Code.set_label(other)
+    if Peek == 'i':
+        stmt_if()
+    else:
+        braced_block()
+    _Code.set_label(done)
+
+def stmt_return():
+    match('z')
+    expression()
+    emit('RETURN_VALUE')
+
+def stmt_switch():
+    match('s')
+    expression()
+    local = hidden_local(Switch_prefix)
+    emit('STORE_FAST', local)
+    # The case values are not known until the bodies have been read, so
+    # the dispatch goes after the bodies, and is reached by a jump.
+    match('{')
+    dispatch = _Code.new_label()
+    done = _Code.new_label()
+    default = done
+    cases = {}
+    emit('JUMP_ABSOLUTE', dispatch)
+    while Peek is not None and Peek != '}':
+        if Peek == 'l':
+            match('l')
+            if default is not done:
+                abort("Duplicate default case")
+            default = label = _Code.new_label()
+        else:
+            value = get_integer()
+            if value in cases:
+                abort("Duplicate case %d" % value)
+            cases[value] = label = _Code.new_label()
+        _Code.set_label(label)
+        match('{')
+        returned = block()
+        match('}')
+        if not returned:
+            emit('JUMP_ABSOLUTE', done)
+    match('}')
+    _Code.set_label(dispatch)
+    emit_dispatch(local, sorted(cases.items()), default)
+    _Code.set_label(done)
+
+def emit_dispatch(local, cases, default):
+    """
+    Emit code that jumps to the label of the case in `cases`, a sorted
+    list of (value, Label) pairs, whose value local `local` holds, or to
+    Label `default`.
+    """
+    strategy = _Switch
+    if strategy is None:
+        strategy = 'linear'
+        if len(cases) > Linear_cases:
+            span = cases[-1][0] - cases[0][0] + 1
+            strategy = 'table' if len(cases) >= Table_density * span \
+                else 'search'
+    if strategy == 'table' and cases:
+        low = cases[0][0]
+        labels = dict(cases)
+        _Code.append_jump_table(local, low, [labels.get(value, default)
+            for value in range(low, cases[-1][0] + 1)], default)
+    emit_search(local, cases, default,
+        len(cases) if strategy == 'linear' else Linear_cases)
+
+def emit_search(local, cases, default, linear):
+    """
+    Emit a binary search of `cases` for the value of local `local`,
+    comparing at most `linear` cases one by one.
+    """
+    if len(cases) <= linear:
+        for value, label in cases:
+            emit('LOAD_FAST', local)
+            emit('LOAD_CONST', value)
+            emit('COMPARE_OP', '==')
+            emit('POP_JUMP_IF_TRUE', label)
+        emit('JUMP_ABSOLUTE', default)
+        return
+    middle = len(cases) // 2
+    lower = _Code.new_label()
+    emit('LOAD_FAST', local)
+    emit('LOAD_CONST', cases[middle][0])
+    emit('COMPARE_OP', '<')
+    emit('POP_JUMP_IF_TRUE', lower)
+    emit_search(local, cases[middle:], default, linear)
+    _Code.set_label(lower)
+    emit_search(local, cases[:middle], default, linear)
+
+def stmt_while():
+    match('w')
+    top = _Code.new_label()
+    test = _Code.new_label()
+    done = _Code.new_label()
+    # The condition comes before the body in the source, but is wanted
+    # after it. Compile it once, as a guard, and append it again at the
+    # bottom. Its jumps out go to the end of the guard, which is the top
+    # of the body, or to the end of the loop, so they stay right in the
+    # copy; only the last test differs.
+    start = len(_Code._appended_ops)
+    cond = condition()
+    stop = len(_Code._appended_ops)
+    emit_condition(cond, False, done)
+    _Code.set_label(top)
+    loop_body(done, test)
+    _Code.set_label(test)
+    _Code.repeat_instructions(start, stop)
+    emit_test(cond, True, top)
+    _Code.set_label(done)
+
+##### Conditions
+
+class Condition:
+    """
+    A logical expression compiled as far as its last test. Jumps already
+    made go to the labels `true` and `false` (either may be None, if
+    there are none) when the expression is known to be true or false.
+    The last test is of the constant `const`, if it is not None, or
+    else of the value left on the stack, which is a boolean if `boolean`
+    is true, and whose truth is the expression's unless `negate` is
+    true.
+    """
+    __slots__ = ('true', 'false', 'const', 'negate', 'boolean')
+
+    def __init__(self, const=None, boolean=False):
+        self.true = None
+        self.false = None
+        self.const = const
+        self.negate = False
+        self.boolean = boolean
+
+def cond_and(varname=None):
+    cond = cond_not(varname)
+    while Peek == '&':
+        match('&')
+        if not _Short_circuit:
+            emit_value(cond, True)
+            emit_value(cond_not(), True)
+            emit('BINARY_AND')
+            cond = Condition(boolean=True)
+            continue
+        false = cond.false or _Code.new_label()
+        emit_test(cond, False, false)
+        if cond.true is not None:
+            _Code.set_label(cond.true)
+        cond = cond_not()
+        if cond.false is not None:
+            _Code.join_label(cond.false, false)
+        cond.false = false
+    return cond
+
+def cond_not(varname=None):
+    if varname is not None or Peek != '!':
+        return relation(varname)
+    match('!')
+    cond = cond_not()
+    if not _Short_circuit:
+        emit_value(cond)
+        emit('UNARY_NOT')
+        return Condition(boolean=True)
+    if cond.const is not None:
+        cond.const = not cond.const
+    elif cond.negate and not cond.boolean:
+        # The value is wanted as a boolean, not as itself.
+        emit('UNARY_NOT')
+        cond.boolean = True
+    else:
+        cond.negate = not cond.negate
+    cond.true, cond.false = cond.false, cond.true
+    return cond
+
+def cond_or(varname=None):
+    cond = cond_and(varname)
+    while Peek == '|':
+        match('|')
+        if not _Short_circuit:
+            emit_value(cond, True)
+            emit_value(cond_and(), True)
+            emit('BINARY_OR')
+            cond = Condition(boolean=True)
+            continue
+        true = cond.true or _Code.new_label()
+        emit_test(cond, True, true)
+        if cond.false is not None:
+            _Code.set_label(cond.false)
+        cond = cond_and()
+        if cond.true is not None:
+            _Code.join_label(cond.true, true)
+        cond.true = true
+    return cond
+
+def condition(varname=None):
+    """
+    Compile a logical expression up to its last test. Return its
+    Condition, for `emit_condition` or `emit_value` to finish. If its
+    first identifier has already been read, it is passed as `varname`.
+    """
+    return cond_or(varname)
+
+def emit_condition(cond, when, target):
+    """
+    Finish Condition `cond` with a jump to Label `target` when its truth
+    is `when`. Otherwise, control falls through.
+    """
+    emit_test(cond, when, target)
+    to, past = (cond.true, cond.false) if when else (cond.false, cond.true)
+    if to is not None:
+        _Code.join_label(to, target)
+    if past is not None:
+        _Code.set_label(past)
+
+def emit_test(cond, when, target):
+    """
+    Make the last test of Condition `cond`: jump to Label `target` if
+    its truth is `when`.
+    """
+    if cond.const is None:
+        emit('POP_JUMP_IF_TRUE' if when != cond.negate
+            else 'POP_JUMP_IF_FALSE', target)
+    elif cond.const == when:
+        emit('JUMP_ABSOLUTE', target)
+
+def emit_value(cond, boolean=False):
+    """
+    Finish Condition `cond` by loading its value. If `boolean` is true,
+    a value that is not a boolean is made one.
+    """
+    if cond.true is None and cond.false is None:
+        if cond.const is not None:
+            emit('LOAD_CONST', cond.const)
+        elif cond.negate:
+            emit('UNARY_NOT')
+        elif boolean and not cond.boolean:
+            emit('UNARY_NOT')
+            emit('UNARY_NOT')
+        return
+    false = _Code.new_label()
+    done = _Code.new_label()
+    emit_condition(cond, False, false)
+    emit('LOAD_CONST', True)
+    emit('JUMP_FORWARD', done)
+    _Code.set_label(false)
+    emit('LOAD_CONST', False)
+    _Code.set_label(done)
+
+def get_relation():
+    """
+    Read a relational operator, if one is next. Return its COMPARE_OP
+    argument, or None.
+    """
+    if Peek is None or Peek not in '=#<>':
+        return None
+    op = get_char()
+    if op in '<>' and Peek == '=':
+        op += get_char()
+    return Relations[op]
+
+def relation(varname=None):
+    """
+    Compile a relation, or an arithmetic expression. Return its
+    Condition. `varname` may give the first identifier, if it has been
+    read, or be `_Loaded` if the first operand is already on the stack.
+    """
+    if varname is None and Peek == '(':
+        # A logical expression in parentheses stays a condition, unless
+        # it is an operand.
+        match('(')
+        cond = condition()
+        match(')')
+        if Peek is None or Peek not in Operator_chars:
+            return cond
+        emit_value(cond)
+        varname = _Loaded
+    elif varname is None and Peek is not None and Peek in Booleans:
+        varname = get_identifier()
+        if Peek is None or Peek not in Operator_chars:
+            return Condition(const=Booleans[varname])
+    expr_addop(varname)
+    op = get_relation()
+    if op is None:
+        return Condition()
+    expr_addop()
+    following = get_relation()
+    if following is None:
+        emit('COMPARE_OP', op)
+        return Condition(boolean=True)
+    # A chain: a<b<c is a<b&b<c, finding b once. Each middle operand is
+    # kept under the result of its first compare, and dropped if that
+    # ends the chain.
+    cleanup = _Code.new_label()
+    done = _Code.new_label()
+    while following is not None:
+        emit('DUP_TOP')
+        emit('ROT_THREE')
+        emit('COMPARE_OP', op)
+        emit('JUMP_IF_FALSE_OR_POP', cleanup)
+        op = following
+        expr_addop()
+        following = get_relation()
+    emit('COMPARE_OP', op)
+    emit('JUMP_FORWARD', done)
+    _Code.set_label(cleanup)
+    emit('ROT_TWO')
+    emit('POP_TOP')
+    _Code.set_label(done)
+    return Condition(boolean=True)
+
+##### Expressions
+
+_Loaded = object()
+""" Passed as `varname` when the first operand is already loaded.  """
+
+def emit_load_var(varname):
+    if varname in Booleans:
+        emit('LOAD_CONST', Booleans[varname])
+    else:
+        emit('LOAD_GLOBAL' if is_global(varname) else 'LOAD_FAST',
+            varname)
+
+def emit_store_var(varname):
+    emit('STORE_GLOBAL' if is_global(varname) else 'STORE_FAST', varname)
+
+def expr_add():
+    match('+')
+    expr_mulop()
+    emit('BINARY_ADD')
+
+def expr_addop(varname=None):
+    expr_mulop(varname)
+    while Peek is not None and Peek in "+-":
+        if Peek == "+":
+            expr_add()
+        else:
+            expr_subtract()
+
+def expr_argument(call, funcname):
+    """
+    Compile one argument of a call: `name=expression` for a keyword
+    argument, or an expression.
+    """
+    varname = None
+    if Peek is not None and Peek.isalpha():
+        varname = get_identifier()
+        if Peek == '=':
+            match('=')
+            try:
+                call.keyword(varname)
+            except ValueError as e:
+                abort("%s in call to '%s'" % (e, funcname))
+            expression()
+            return
+    try:
+        call.positional()
+    except ValueError as e:
+        abort("%s in call to '%s'" % (e, funcname))
+    expression(varname)
+
+def expr_atom(varname=None):
+    if varname is _Loaded:
+        pass
+    elif varname is not None:
+        expr_read_var(varname)
+    elif Peek == '(':
+        match('(')
+        expression()
+        match(')')
+    elif Peek is not None and Peek.isalpha():
+        expr_read_var()
+    else:
+        num = int(get_number())
+        emit('LOAD_CONST', num)
+
+def expr_call(funcname):
+    match('(')
+    emit('LOAD_GLOBAL', funcname)
+    call = bytecode.CallSequence(_Code)
+    if Peek != ')':
+        expr_argument(call, funcname)
+        while Peek == ',':
+            match(',')
+            expr_argument(call, funcname)
+    match(')')
+    try:
+        call.finish()
+    except ValueError as e:
+        abort("%s in call to '%s'" % (e, funcname))
+
+def expr_divide():
+    match('/')
+    expr_unary()
+    emit('BINARY_FLOOR_DIVIDE')
+
+def expr_mulop(varname=None):
+    expr_unary(varname)
+    while Peek is not None and Peek in "*/":
+        if Peek == "*":
+            expr_multiply()
+        else:
+            expr_divide()
+
+def expr_multiply():
+    match('*')
+    expr_unary()
+    emit('BINARY_MULTIPLY')
+
+def expr_read_var(varname=None):
+    if varname is None:
+        varname = get_identifier()
+    if Peek == '(':
+        expr_call(varname)
+    else:
+        emit_load_var(varname)
+
+def expr_subtract():
+    match('-')
+    expr_mulop()
+    emit('BINARY_SUBTRACT')
+
+def expr_unary(varname=None):
+    if varname is not None:
+        expr_atom(varname)
+    elif Peek == "+":
+        match('+')
+        expr_atom()
+    elif Peek == "-":
+        match('-')
+        expr_atom()
+        emit('UNARY_NEGATIVE')
+    else:
+        expr_atom()
+
+def expression(varname=None):
+    """
+    Compile an expression, leaving its value on the stack. If its first
+    identifier has already been read, it is passed as `varname`.
+    """
+    emit_value(condition(varname))
+
+def is_global(name):
+    return name[0].isupper() and name not in Booleans
+
+def main():
+    print("Enter your code on a single line. Enter '.' by itself to quit.")
+    while True:
+        line = input()
+        if line == ".":
+            break
+        init(inp=io.StringIO(line))
+        compile()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4
+"""
+    ch06.tests.logical_tests
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Specifies the behavior of the ch06/logical compiler.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+from io import StringIO
+import itertools
+import unittest
+
+from ch06 import logical as compiler
+from ch04.bytecode import instructions_match
+
+Arguments = list(itertools.product(range(-1, 3), repeat=3))
+
+class TestCompiler(unittest.TestCase):
+
+    def compile(self, text, **options):
+        self.err = StringIO()
+        compiler.init(inp=StringIO(text), err=self.err)
+        return compiler.compile(**options)
+
+    def function(self, text, globs=None, **options):
+        self.err = StringIO()
+        compiler.init(inp=StringIO(text), err=self.err)
+        return compiler.compile_function(globs, params=['a', 'e', 'g'],
+            **options)
+
+    def assertMatches(self, text, want):
+        """
+        Check that `text`, with parameters a, e and g, returns what
+        function `want` does, with and without short circuits.
+        """
+        for short_circuit in (True, False):
+            fn = self.function(text, short_circuit=short_circuit)
+            for args in Arguments:
+                got = fn(*args)
+                self.assertEqual(want(*args), got, (text, args))
+                self.assertIs(type(want(*args)), type(got), (text, args))
+
+    def test_relations(self):
+        self.assertMatches('za=e', lambda a, e, g: a == e)
+        self.assertMatches('za#e', lambda a, e, g: a != e)
+        self.assertMatches('za<e', lambda a, e, g: a < e)
+        self.assertMatches('za<=e', lambda a, e, g: a <= e)
+        self.assertMatches('za>e+1', lambda a, e, g: a > e + 1)
+        self.assertMatches('za*2>=e', lambda a, e, g: a * 2 >= e)
+
+    def test_chains(self):
+        self.assertMatches('za<e<g', lambda a, e, g: a < e < g)
+        self.assertMatches('za<=e>g', lambda a, e, g: a <= e > g)
+        self.assertMatches('ia=e#g{z1};z0',
+            lambda a, e, g: 1 if a == e != g else 0)
+
+    def test_logical(self):
+        self.assertMatches('za|e&g', lambda a, e, g: bool(a or e and g))
+        self.assertMatches('z(a|e)&g', lambda a, e, g: bool((a or e) and g))
+        self.assertMatches('z!a', lambda a, e, g: not a)
+        self.assertMatches('z!!a', lambda a, e, g: bool(a))
+        self.assertMatches('z!(a<e)|!g',
+            lambda a, e, g: not a < e or not g)
+        self.assertMatches('za', lambda a, e, g: a)
+        self.assertMatches('z(a|e)+1', lambda a, e, g: bool(a or e) + 1)
+
+    def test_constants(self):
+        self.assertMatches('zT', lambda a, e, g: True)
+        self.assertMatches('zF|a', lambda a, e, g: bool(a))
+        self.assertMatches('zT&!a', lambda a, e, g: not a)
+        self.assertMatches('zT+a', lambda a, e, g: 1 + a)
+        self.assertMatches('iF{z1};z0', lambda a, e, g: 0)
+
+    def test_conditions(self):
+        self.assertMatches('ia<e&e<g{z1}l{z2}',
+            lambda a, e, g: 1 if a < e and e < g else 2)
+        self.assertMatches('i!(a|e)&!g{z1}l{z2}',
+            lambda a, e, g: 1 if not (a or e) and not g else 2)
+        self.assertMatches('t=0;wa<3&(e|g){t=t+1;a=a+1};zt',
+            lambda a, e, g: max(0, 3 - a) if e or g else 0)
+        self.assertMatches('t=0;d{t=t+1;a=a+1}wa<2|!T;zt',
+            lambda a, e, g: max(1, 2 - a))
+
+    def test_short_circuit(self):
+        calls = []
+        def G(x):
+            calls.append(x)
+            return x
+        fn = self.function('zG(a)|G(e)', {'G': G})
+        self.assertEqual(True, fn(1, 2, 0))
+        self.assertEqual([1], calls)
+        fn = self.function('zG(a)|G(e)', {'G': G}, short_circuit=False)
+        self.assertEqual(True, fn(1, 2, 0))
+        self.assertEqual([1, 1, 2], calls)
+
+    def test_fused(self):
+        asm = """
+            LOAD_FAST (a)
+            LOAD_FAST (e)
+            COMPARE_OP (<)
+            POP_JUMP_IF_FALSE (30)
+            LOAD_FAST (e)
+            LOAD_FAST (g)
+            COMPARE_OP (<)
+            POP_JUMP_IF_FALSE (30)
+            LOAD_CONST (1)
+            STORE_FAST (x)
+            LOAD_CONST
+            RETURN_VALUE
+        """
+        co = self.compile('ia<e&e<g{x=1}', params=['a', 'e', 'g'])
+        instructions_match(co, asm)
+
+    def test_while_condition(self):
+        co = self.compile('t=0;wa|e{t=t+1;a=0;e=0};zt',
+            params=['a', 'e'])
+        jumps = [op for op in co._appended_ops if 'JUMP' in op[0]]
+        self.assertEqual(['POP_JUMP_IF_TRUE', 'POP_JUMP_IF_FALSE',
+            'POP_JUMP_IF_TRUE', 'POP_JUMP_IF_TRUE'],
+            [op[0] for op in jumps])
+
+    def test_errors(self):
+        with self.assertRaises(SystemExit):
+            self.compile('T=1')
+        self.assertIn("Cannot assign to keyword 'T'", self.err.getvalue())
+        with self.assertRaises(SystemExit):
+            self.compile('za<(e')
+        self.assertIn("')' expected", self.err.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# vim: set et sts=4 sw=4 ts=4 tw=76
+"""
+    ch07.lexer
+    ~~~~~~~~~~
+
+    Lexical scanner for chapter 7 of `Let's Build a Compiler (in
+    Python)!`
+
+    The scanner reads names, numbers and operators of any length, skipping
+    white space (new lines included) between them. Each call of `scan`
+    reads one token, and sets `Token` to its kind and `Value` to its
+    text:
+
+        Token           Value
+        'x'             a name that is not a keyword
+        '#'             a number
+        keyword code    a keyword: 'if' is 'i', 'while' is 'w', ... (see
+                        `Keywords`), the letters chapters 5 and 6 use
+        the operator    an operator: '<=' and '>=' are one token, any
+                        other character is a token by itself
+        None            the end of the input ('' in `Value`)
+
+    Keywords are found with one of `Keyword_strategies`, chosen by
+    `init`:
+
+        'dict'      a lookup in `Keywords`. A Python dict is a hash table
+                    that keeps the hash of each key, and a str caches its
+                    own hash, so a name is compared with at most the one
+                    keyword whose hash it shares. This is the default.
+        'perfect'   a perfect hash, `Perfect_hash`, generated from the
+                    keywords when the module is loaded: a function of a
+                    name's length and its first and last characters
+                    that gives every keyword a slot of its own, so a name
+                    is compared with at most the one keyword in its slot.
+        'linear'    a comparison with each keyword in turn, as the
+                    tutorial's `Lookup` does.
+
+    The perfect hash is what a compiler written in C would use. In
+    Python, finding the slot takes several bytecodes where the dict
+    lookup takes one, so the dict is faster (see `bench.lexer`).
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import sys
+
+##### Error handling
+
+_Error = None
+""" Error-reporting output stream.  """
+
+def abort(msg):
+    """
+    Report an error and raise a SystemExit exception.
+    """
+    error(msg)
+    sys.exit(1)
+
+def error(msg):
+    """
+    Report an error. Wrap the message in newlines to separate it from
+    other output.
+    """
+    _Error.write("\n" + msg + "\n")
+
+def expected(what):
+    """
+    Report on an input value not present. Abort.
+    """
+    abort("'%s' expected." % what)
+
+##### Input handling
+
+_Input = None
+""" Input stream.  """
+
+Peek = None
+"""
+Peek stores the input look-ahead character. This is the next character
+in the input stream, and will be returned by get_char().
+"""
+
+def get_char():
+    """
+    Advance the input to the next character. Return the character consumed,
+    or None. Note that this function changes `Peek`, and returns the *old*
+    value of `Peek`.
+    """
+    global Peek
+    result = Peek
+    Peek = _Input.read(1) if _Input.readable() else None
+    if Peek == '':
+        # Handle ttys and StringIO objects: still readable but empty right now.
+        Peek = None
+    return result
+
+##### Keywords
+
+Keywords = {
+    'if': 'i',
+    'else': 'l',
+    'while': 'w',
+    'do': 'd',
+    'for': 'f',
+    'break': 'b',
+    'continue': 'c',
+    'switch': 's',
+    'default': 'l',
+    'return': 'z',
+    'true': 'T',
+    'false': 'F',
+}
+""" Token code of each keyword, by keyword.  """
+
+class PerfectHash:
+    """
+    A perfect hash of a set of words: `slot(word)` is
+
+        (len(word) + multiplier * ord(word[0]) + ord(word[-1])) % size
+
+    which is different for each of the words. `slots` holds each
+    (word, code) pair at its slot, and None in the slots no word has.
+    """
+    __slots__ = ('size', 'multiplier', 'slots')
+
+    def __init__(self, size, multiplier, slots):
+        self.size = size
+        self.multiplier = multiplier
+        self.slots = slots
+
+    def slot(self, word):
+        return ((len(word) + self.multiplier * ord(word[0]) + ord(word[-1]))
+            % self.size)
+
+    def lookup(self, word):
+        """
+        Return the code of `word`, or None if it is not one of the words.
+        """
+        entry = self.slots[(len(word) + self.multiplier * ord(word[0])
+            + ord(word[-1])) % self.size]
+        if entry is not None and entry[0] == word:
+            return entry[1]
+        return None
+
+def perfect_hash(codes, max_size=None):
+    """
+    Generate a PerfectHash of the words in dict `codes`, whose values are
+    the codes to look up. Use the smallest size, and for it the smallest
+    multiplier, that gives no two words the same slot. Raise ValueError if
+    no size up to `max_size` (by default, 8 slots for each word) will do.
+    """
+    words = sorted(codes)
+    if max_size is None:
+        max_size = 8 * len(words)
+    for size in range(max(len(words), 1), max_size + 1):
+        for multiplier in range(1, size):
+            table = PerfectHash(size, multiplier, [None] * size)
+            for word in words:
+                index = table.slot(word)
+                if table.slots[index] is not None:
+                    break
+                table.slots[index] = (word, codes[word])
+            else:
+                return table
+    raise ValueError("No perfect hash of %d words in %d slots"
+        % (len(words), max_size))
+
+Perfect_hash = perfect_hash(Keywords)
+""" PerfectHash of `Keywords`.  """
+
+Keyword_list = tuple(sorted(Keywords.items()))
+""" (keyword, code) pairs, for the 'linear' strategy.  """
+
+def linear_lookup(name):
+    """
+    Return the code of keyword `name` by comparing it with each keyword,
+    or None if it is not a keyword.
+    """
+    for word, code in Keyword_list:
+        if word == name:
+            return code
+    return None
+
+Keyword_lookups = {
+    'dict': Keywords.get,
+    'perfect': Perfect_hash.lookup,
+    'linear': linear_lookup,
+}
+""" Function returning the code of a keyword or None, by strategy.  """
+
+Keyword_strategies = ('dict', 'perfect', 'linear')
+
+##### Scanning
+
+Token = None
+""" Kind of the last token scanned (see the module documentation).  """
+
+Value = ''
+""" Text of the last token scanned.  """
+
+Operators = ('<=', '>=')
+""" Operators of more than one character.  """
+
+_Lookup = Keywords.get
+""" Keyword lookup of the strategy chosen by `init`.  """
+
+def init(inp=None, err=None, keywords='dict'):
+    """
+    Prepare to scan `inp`, finding keywords with strategy `keywords`, one
+    of `Keyword_strategies`.
+    """
+    global _Error, _Input, _Lookup, Token, Value
+    if keywords not in Keyword_lookups:
+        raise ValueError("Unknown keyword strategy %r" % (keywords, ))
+    _Lookup = Keyword_lookups[keywords]
+    _Error = err if err is not None else sys.stderr
+    _Input = inp if inp is not None else _Input
+    Token = None
+    Value = ''
+    # 'prime the pump' to read first character, etc.
+    get_char()
+
+def skip_white():
+    """
+    Skip over white space, new lines included.
+    """
+    while Peek is not None and Peek.isspace():
+        get_char()
+
+def get_name():
+    """
+    Read a name: a letter, then letters, digits and underscores. Set
+    `Token` to the code of the keyword it is, or to 'x'.
+    """
+    global Token, Value
+    if Peek is None or not Peek.isalpha():
+        expected('Name')
+    name = ''
+    while Peek is not None and (Peek.isalnum() or Peek == '_'):
+        name += get_char()
+    Value = name
+    code = _Lookup(name)
+    Token = 'x' if code is None else code
+
+def get_num():
+    """
+    Read a number: one or more digits. Set `Token` to '#'.
+    """
+    global Token, Value
+    if Peek is None or not Peek.isdigit():
+        expected('Integer')
+    digits = ''
+    while Peek is not None and Peek.isdigit():
+        digits += get_char()
+    Value = digits
+    Token = '#'
+
+def get_op():
+    """
+    Read an operator: one of `Operators`, or else any one character. Set
+    `Token` to it.
+    """
+    global Token, Value
+    op = get_char()
+    if Peek is not None and op + Peek in Operators:
+        op += get_char()
+    Value = op
+    Token = op
+
+def scan():
+    """
+    Read the next token. Return `Token`.
+    """
+    global Token, Value
+    skip_white()
+    if Peek is None:
+        Token = None
+        Value = ''
+    elif Peek.isalpha():
+        get_name()
+    elif Peek.isdigit():
+        get_num()
+    else:
+        get_op()
+    return Token
+
+def tokens():
+    """
+    Scan the rest of the input. Return a list of (Token, Value) pairs.
+    """
+    result = []
+    while scan() is not None:
+        result.append((Token, Value))
+    return result
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4
+"""
+    ch07.tests.lexer_tests
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Specifies the behavior of the ch07/lexer scanner.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+from io import StringIO
+import unittest
+
+from ch07 import lexer
+
+class TestLexer(unittest.TestCase):
+
+    def tokens(self, text, keywords='dict'):
+        self.err = StringIO()
+        lexer.init(inp=StringIO(text), err=self.err, keywords=keywords)
+        return lexer.tokens()
+
+    def test_tokens(self):
+        self.assertEqual([('i', 'if'), ('x', 'count1'), ('<=', '<='),
+            ('#', '10'), ('{', '{'), ('x', 'total'), ('=', '='),
+            ('x', 'total'), ('+', '+'), ('x', 'count1'), ('}', '}'),
+            ('l', 'else'), ('z', 'return'), ('F', 'false')],
+            self.tokens('if count1<=10 { total = total+count1 }\n'
+                '  else return false'))
+        self.assertEqual([('x', 'a_b'), ('>=', '>='), ('>', '>'),
+            ('<', '<'), ('=', '=')], self.tokens('a_b>=> < ='))
+        self.assertEqual([], self.tokens(' \n\t'))
+
+    def test_scan(self):
+        lexer.init(inp=StringIO('while'), err=StringIO())
+        self.assertEqual('w', lexer.scan())
+        self.assertEqual('while', lexer.Value)
+        self.assertIsNone(lexer.scan())
+        self.assertEqual('', lexer.Value)
+
+    def test_keywords(self):
+        names = ['iff', 'i', 'While', 'returns', 'do_', 'els', 'fo', 'e']
+        for keywords in lexer.Keyword_strategies:
+            for word, code in lexer.Keywords.items():
+                self.assertEqual([(code, word)],
+                    self.tokens(word, keywords), keywords)
+            self.assertEqual([('x', name) for name in names],
+                self.tokens(' '.join(names), keywords), keywords)
+        self.assertRaises(ValueError, self.tokens, 'x', keywords='gperf')
+
+    def test_perfect_hash(self):
+        table = lexer.Perfect_hash
+        slots = [table.slot(word) for word in lexer.Keywords]
+        self.assertEqual(len(slots), len(set(slots)))
+        self.assertEqual(len(lexer.Keywords),
+            len([entry for entry in table.slots if entry is not None]))
+        small = lexer.perfect_hash({'ab': 1, 'cd': 2, 'ef': 3})
+        self.assertEqual(3, small.size)
+        self.assertEqual([1, 2, 3, None],
+            [small.lookup(word) for word in ('ab', 'cd', 'ef', 'ad')])
+        self.assertRaises(ValueError, lexer.perfect_hash,
+            {'ab': 1, 'ba': 2}, max_size=2)
+
+if __name__ == '__main__':
+    unittest.main()
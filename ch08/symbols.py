@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# vim: set et sts=4 sw=4 ts=4 tw=76
+"""
+    ch08.symbols
+    ~~~~~~~~~~~~
+
+    Symbol table with nested scopes for chapter 8 of `Let's Build a
+    Compiler (in Python)!`
+
+    Until now a name's scope came from its spelling: `is_global` in the
+    earlier chapters makes any capitalized name a global. A SymbolTable
+    instead records the names each scope declares. Looking a name up
+    finds its binding in the innermost scope that declares it; a name no
+    scope declares is a global.
+
+    The table does not search the scopes from the innermost outward. It
+    keeps one dict from each name to a stack of its bindings, innermost
+    last, so a lookup is one dict access however deep the scopes are.
+    Each scope keeps the list of names it declared, and leaving it pops
+    their bindings off their stacks.
+
+    A local is given a slot when it is declared: its index in the
+    `co_varnames` of the CodeObject the table fills. The compiler emits
+    LOAD_FAST and STORE_FAST with the slot, which the CodeObject takes
+    as it is. Every local that is live at a time has a slot of its own,
+    so a local that hides another of the same name gets a new slot,
+    called 'name.1', 'name.2', ... ('.' is never part of a name in the
+    source). When a scope is left its slots are free, and a later local
+    of the same name takes one of them back. Leaving a scope emits a
+    DELETE_FAST for each of its locals that `emit_store` assigned, so
+    that a reused slot is unbound again: reading the new local before
+    assigning it raises UnboundLocalError, as it should, rather than
+    finding the old local's value.
+
+    `set_params` makes names the parameters of the code: it moves them
+    to the first slots, gives the other locals their new ones, and
+    declares the parameters in the outermost scope.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+from ch04 import bytecode
+
+class Symbol:
+    """
+    The binding of `name` in the scope at `depth` (0 is the outermost).
+    `kind` is 'local' or 'global'. A local has `slot`, its index in
+    `co_varnames`, and `varname`, the entry in that slot. A global has
+    None for both. `assigned` is true once a store to a local has been
+    emitted.
+    """
+    __slots__ = ('name', 'kind', 'depth', 'slot', 'varname', 'assigned')
+
+    def __init__(self, name, kind, depth, slot=None, varname=None):
+        self.name = name
+        self.kind = kind
+        self.depth = depth
+        self.slot = slot
+        self.varname = varname
+        self.assigned = False
+
+    def __repr__(self):
+        return 'Symbol(%r, %r, %d, %r)' % (self.name, self.kind,
+            self.depth, self.slot)
+
+class SymbolTable:
+    """
+    Names declared in nested scopes. The table starts with one scope
+    open, at depth 0. `code` is the CodeObject whose `co_varnames` holds
+    the slots of the locals (by default, a new one).
+    """
+
+    def __init__(self, code=None):
+        self.code = code if code is not None else bytecode.CodeObject()
+        # Stack of the Symbols of each name, innermost last.
+        self._bindings = {}
+        # Symbols declared in each open scope, innermost last.
+        self._scopes = [[]]
+        # Slots of each name whose scopes have been left.
+        self._free = {}
+        # Number of slots each name has.
+        self._slot_counts = {}
+        # Symbol of each parameter, by name.
+        self._params = {}
+        for varname in self.code.co_varnames:
+            self._slot_counts[varname] = 1
+
+    @property
+    def depth(self):
+        """ Depth of the innermost open scope.  """
+        return len(self._scopes) - 1
+
+    def enter(self):
+        """
+        Open a new scope inside the current one.
+        """
+        self._scopes.append([])
+
+    def leave(self):
+        """
+        Close the innermost scope, ending the bindings it declared, and
+        append a DELETE_FAST for each of its locals that was assigned.
+        Raise ValueError if it is the outermost.
+        """
+        if len(self._scopes) == 1:
+            raise ValueError("Cannot leave the outermost scope")
+        bindings = self._bindings
+        for symbol in self._scopes.pop():
+            stack = bindings[symbol.name]
+            stack.pop()
+            if not stack:
+                del bindings[symbol.name]
+            if symbol.slot is not None:
+                if symbol.assigned:
+                    self.code.append('DELETE_FAST', symbol.slot)
+                self._free.setdefault(symbol.name, []).append(symbol.slot)
+
+    def _check_new(self, name):
+        stack = self._bindings.get(name)
+        if stack and stack[-1].depth == self.depth:
+            raise ValueError("%r is already declared in this scope"
+                % (name, ))
+
+    def _bind(self, symbol):
+        self._bindings.setdefault(symbol.name, []).append(symbol)
+        self._scopes[-1].append(symbol)
+        return symbol
+
+    def declare(self, name):
+        """
+        Declare `name` a local of the innermost scope, and give it a slot.
+        Return its Symbol. Raise ValueError if the scope already declares
+        the name, unless it is a parameter declared again in the
+        outermost scope: that returns the parameter's Symbol.
+        """
+        param = self._params.get(name)
+        if param is not None and self.depth == 0:
+            return param
+        self._check_new(name)
+        free = self._free.get(name)
+        varnames = self.code.co_varnames
+        if free:
+            slot = free.pop()
+        else:
+            count = self._slot_counts.get(name, 0)
+            varname = name if count == 0 else '%s.%d' % (name, count)
+            self._slot_counts[name] = count + 1
+            slot = len(varnames)
+            varnames.append(varname)
+        return self._bind(Symbol(name, 'local', self.depth, slot,
+            varnames[slot]))
+
+    def declare_global(self, name):
+        """
+        Declare that `name`, in the innermost scope, is the global of that
+        name, hiding any local of an outer scope. Return its Symbol. Raise
+        ValueError if the scope already declares the name.
+        """
+        self._check_new(name)
+        return self._bind(Symbol(name, 'global', self.depth))
+
+    def set_params(self, names):
+        """
+        Make the locals `names` the parameters of the CodeObject, as
+        `CodeObject.set_params` does, and move the slot of every live or
+        free local to the new place of its entry in `co_varnames`. Each
+        parameter is declared in the outermost scope, unless it is
+        already, and its slot is never reused.
+        """
+        names = list(names)
+        old = list(self.code.co_varnames)
+        self.code.set_params(names)
+        slots = dict((varname, slot)
+            for slot, varname in enumerate(self.code.co_varnames))
+        for stack in self._bindings.values():
+            for symbol in stack:
+                if symbol.slot is not None:
+                    symbol.slot = slots[symbol.varname]
+        for free in self._free.values():
+            free[:] = [slots[old[slot]] for slot in free
+                if old[slot] not in names]
+        self._params = {}
+        for name in names:
+            self._slot_counts.setdefault(name, 1)
+            stack = self._bindings.setdefault(name, [])
+            if not stack or stack[0].depth != 0:
+                symbol = Symbol(name, 'local', 0, slots[name], name)
+                symbol.assigned = True
+                stack.insert(0, symbol)
+                self._scopes[0].append(symbol)
+            self._params[name] = stack[0]
+
+    def lookup(self, name):
+        """
+        Return the Symbol that `name` is bound to, or None if no open
+        scope declares it.
+        """
+        stack = self._bindings.get(name)
+        return stack[-1] if stack else None
+
+    def is_global(self, name):
+        """
+        Return True if `name` is a global where it is looked up.
+        """
+        stack = self._bindings.get(name)
+        return not stack or stack[-1].kind == 'global'
+
+    def emit_load(self, name):
+        """
+        Append the instruction that loads the value of `name` to the
+        CodeObject.
+        """
+        symbol = self.lookup(name)
+        if symbol is None or symbol.slot is None:
+            self.code.append('LOAD_GLOBAL', name)
+        else:
+            self.code.append('LOAD_FAST', symbol.slot)
+
+    def emit_store(self, name):
+        """
+        Append the instruction that stores a value in `name` to the
+        CodeObject.
+        """
+        symbol = self.lookup(name)
+        if symbol is None or symbol.slot is None:
+            self.code.append('STORE_GLOBAL', name)
+        else:
+            self.code.append('STORE_FAST', symbol.slot)
+            symbol.assigned = True
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4
+"""
+    ch08.tests.symbols_tests
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Specifies the behavior of the ch08/symbols symbol table.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import unittest
+
+from ch04 import vm
+from ch04.bytecode import CodeObject
+from ch08.symbols import SymbolTable
+
+class TestSymbolTable(unittest.TestCase):
+
+    def test_nested_scopes(self):
+        table = SymbolTable()
+        x = table.declare('x')
+        self.assertEqual((0, 0, 'x'), (x.depth, x.slot, x.varname))
+        table.enter()
+        inner = table.declare('x')
+        y = table.declare('y')
+        self.assertEqual(1, table.depth)
+        self.assertIs(inner, table.lookup('x'))
+        self.assertEqual((1, 'x.1'), (inner.slot, inner.varname))
+        self.assertIs(y, table.lookup('y'))
+        table.leave()
+        self.assertIs(x, table.lookup('x'))
+        self.assertIsNone(table.lookup('y'))
+        self.assertEqual(['x', 'x.1', 'y'], table.code.co_varnames)
+
+    def test_slot_reuse(self):
+        table = SymbolTable()
+        table.declare('x')
+        for i in range(3):
+            table.enter()
+            inner = table.declare('x')
+            table.enter()
+            table.declare('t')
+            table.leave()
+            table.leave()
+        self.assertEqual((1, 'x.1'), (inner.slot, inner.varname))
+        self.assertEqual(['x', 'x.1', 't'], table.code.co_varnames)
+
+    def test_globals(self):
+        table = SymbolTable()
+        table.declare('n')
+        self.assertTrue(table.is_global('total'))
+        self.assertFalse(table.is_global('n'))
+        table.enter()
+        symbol = table.declare_global('n')
+        self.assertEqual(('global', None), (symbol.kind, symbol.slot))
+        self.assertTrue(table.is_global('n'))
+        table.leave()
+        self.assertFalse(table.is_global('n'))
+
+    def test_errors(self):
+        table = SymbolTable()
+        table.declare('x')
+        self.assertRaises(ValueError, table.declare, 'x')
+        self.assertRaises(ValueError, table.declare_global, 'x')
+        self.assertRaises(ValueError, table.leave)
+        table.enter()
+        table.declare('x')
+
+    def test_emit(self):
+        # n { n = 10 { global n; n = 5 } T = n } return n + T
+        table = SymbolTable(CodeObject())
+        table.declare('n')
+        table.set_params(['n'])
+        table.enter()
+        table.declare('n')
+        table.code.append('LOAD_CONST', 10)
+        table.emit_store('n')
+        table.enter()
+        table.declare_global('n')
+        table.code.append('LOAD_CONST', 5)
+        table.emit_store('n')
+        table.leave()
+        table.emit_load('n')
+        table.emit_store('T')
+        table.leave()
+        table.emit_load('n')
+        table.emit_load('T')
+        table.code.append('BINARY_ADD')
+        table.code.append('RETURN_VALUE')
+        self.assertEqual(['n', 'n.1'], table.code.co_varnames)
+        self.assertEqual(['n.1', 'n', 'n.1', 'T', 'n.1', 'n', 'T'],
+            [op[2] for op in table.code._appended_ops
+                if op[0] not in ('LOAD_CONST', 'BINARY_ADD',
+                    'RETURN_VALUE')])
+        globs = {}
+        self.assertEqual(13, vm.to_function(table.code, globs)(3))
+        self.assertEqual({'n': 5, 'T': 10}, globs)
+
+    def test_set_params_after_declare(self):
+        # x; n { t } set_params(n) { t = n * 2 } x = n return x + n
+        table = SymbolTable(CodeObject())
+        x = table.declare('x')
+        n = table.declare('n')
+        table.enter()
+        table.declare('t')
+        table.leave()
+        table.set_params(['n'])
+        self.assertEqual(['n', 'x', 't'], table.code.co_varnames)
+        self.assertEqual((0, 1), (n.slot, x.slot))
+        table.enter()
+        t = table.declare('t')
+        self.assertEqual((2, 't'), (t.slot, t.varname))
+        table.emit_load('n')
+        table.code.append('LOAD_CONST', 2)
+        table.code.append('BINARY_MULTIPLY')
+        table.emit_store('t')
+        table.leave()
+        table.emit_load('n')
+        table.emit_store('x')
+        table.emit_load('x')
+        table.emit_load('n')
+        table.code.append('BINARY_ADD')
+        table.code.append('RETURN_VALUE')
+        self.assertEqual(14, vm.to_function(table.code, {})(7))
+        self.assertEqual(['n', 'x', 't'], table.code.co_varnames)
+
+    def test_set_params_before_declare(self):
+        # set_params(a) { a = 1 } { a } return a
+        table = SymbolTable(CodeObject())
+        table.set_params(['a'])
+        a = table.declare('a')
+        self.assertEqual((0, 0, 'a'), (a.depth, a.slot, a.varname))
+        self.assertIs(a, table.lookup('a'))
+        table.enter()
+        inner = table.declare('a')
+        self.assertEqual((1, 'a.1'), (inner.slot, inner.varname))
+        table.code.append('LOAD_CONST', 1)
+        table.emit_store('a')
+        table.leave()
+        table.enter()
+        self.assertEqual(1, table.declare('a').slot)
+        table.leave()
+        table.emit_load('a')
+        table.code.append('RETURN_VALUE')
+        self.assertEqual(['a', 'a.1'], table.code.co_varnames)
+        self.assertEqual(7, vm.to_function(table.code, {})(7))
+
+    def test_reused_slot_unbound(self):
+        # { t = 5 } { return t }
+        table = SymbolTable(CodeObject())
+        table.enter()
+        table.declare('t')
+        table.code.append('LOAD_CONST', 5)
+        table.emit_store('t')
+        table.leave()
+        table.enter()
+        self.assertEqual(0, table.declare('t').slot)
+        table.emit_load('t')
+        table.code.append('RETURN_VALUE')
+        self.assertEqual('DELETE_FAST', table.code._appended_ops[2][0])
+        with self.assertRaises(UnboundLocalError):
+            vm.to_function(table.code, {})()
+
+if __name__ == '__main__':
+    unittest.main()
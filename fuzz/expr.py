@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4 tw=76
+"""
+    fuzz.expr
+    ~~~~~~~~~
+
+    Differential fuzzing of the expression language. Random programs are
+    run through every registered variant -- the chapter 2 interpreter,
+    which evaluates while it parses, and the chapter 4 compiler, which
+    emits bytecode that `Compiler_backend` runs -- and any program on
+    which the variants disagree is shrunk to a small example and saved
+    in a corpus directory.
+
+    Run it with `python -m fuzz.expr --help`.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import argparse
+import hashlib
+import io
+import multiprocessing
+import os
+import random
+import sys
+
+from ch02 import expr2 as interpreter
+from ch04 import expr2 as compiler
+
+Corpus_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    'corpus')
+"""
+Default directory for saved programs: the mismatches found, and seed
+programs (negative floor division, division by zero, signs) that the
+variants must keep agreeing on.
+"""
+
+Compiler_backend = 'vm'
+"""
+Backend of `ch04.expr2` that runs the compiled programs. The VM runs the
+instructions the compiler emits on any Python, where CPython can only
+run them before 3.6 (see `ch04.bytecode.Wordcode`).
+"""
+
+##### Program generation
+#
+# A program is kept as a tree that mirrors the grammar, so that it can be
+# both printed and shrunk:
+#
+#   expression  (op, term) pairs; the first op is None
+#   term        (op, factor) pairs; the first op is None
+#   factor      (sign, atom); sign is '', '+' or '-'
+#   atom        a digit string, or a nested expression in parentheses
+
+def gen_expression(rng, depth):
+    """
+    Generate a random expression tree, nesting parentheses no more than
+    `depth` deep.
+    """
+    count = rng.randint(1, 3)
+    return tuple((None if i == 0 else rng.choice('+-'), gen_term(rng, depth))
+        for i in range(count))
+
+def gen_term(rng, depth):
+    count = rng.randint(1, 3)
+    return tuple((None if i == 0 else rng.choice('*/'),
+        gen_factor(rng, depth)) for i in range(count))
+
+def gen_factor(rng, depth):
+    sign = rng.choice(('', '', '', '+', '-'))
+    if depth > 0 and rng.random() < 0.3:
+        atom = gen_expression(rng, depth - 1)
+    else:
+        atom = str(rng.randint(0, 9))
+    return (sign, atom)
+
+def to_text(expr):
+    """
+    Return the source text of an expression tree.
+    """
+    parts = []
+    for op, term in expr:
+        if op is not None:
+            parts.append(op)
+        for mulop, (sign, atom) in term:
+            if mulop is not None:
+                parts.append(mulop)
+            parts.append(sign)
+            parts.append(atom if isinstance(atom, str)
+                else '(' + to_text(atom) + ')')
+    return ''.join(parts)
+
+##### Shrinking
+
+def _without(pairs, i):
+    """Return `pairs` with entry `i` removed, keeping the first op None."""
+    rest = pairs[:i] + pairs[i + 1:]
+    return ((None, rest[0][1]), ) + rest[1:]
+
+def shrink_expression(expr):
+    """
+    Generate expression trees that are one step smaller than `expr`.
+    """
+    if len(expr) > 1:
+        for i in range(len(expr)):
+            yield _without(expr, i)
+    elif len(expr[0][1]) == 1:
+        sign, atom = expr[0][1][0][1]
+        if not sign and not isinstance(atom, str):
+            # Drop parentheses around the whole expression.
+            yield atom
+    for i, (op, term) in enumerate(expr):
+        for smaller in shrink_term(term):
+            yield expr[:i] + ((op, smaller), ) + expr[i + 1:]
+
+def shrink_term(term):
+    if len(term) > 1:
+        for i in range(len(term)):
+            yield _without(term, i)
+    for i, (op, factor) in enumerate(term):
+        for smaller in shrink_factor(factor):
+            yield term[:i] + ((op, smaller), ) + term[i + 1:]
+
+def shrink_factor(factor):
+    sign, atom = factor
+    if sign:
+        yield ('', atom)
+    if isinstance(atom, str):
+        for digit in range(int(atom)):
+            yield (sign, str(digit))
+    else:
+        # Replace the parentheses by a single factor from inside them.
+        for op, term in atom:
+            for mulop, (inner_sign, inner_atom) in term:
+                yield (sign or inner_sign, inner_atom)
+        for smaller in shrink_expression(atom):
+            yield (sign, smaller)
+
+def shrink(expr, fails):
+    """
+    Greedily reduce `expr` while `fails(expr)` stays true. Return the
+    smallest failing tree found.
+    """
+    progress = True
+    while progress:
+        progress = False
+        for smaller in shrink_expression(expr):
+            if fails(smaller):
+                expr = smaller
+                progress = True
+                break
+    return expr
+
+##### Variants
+#
+# Each variant takes the source text of an expression and returns an
+# outcome: ('value', result), ('raise', exception name), or ('abort',
+# error message).
+
+def run_interpreter(text):
+    out = io.StringIO()
+    err = io.StringIO()
+    try:
+        interpreter.init(inp=io.StringIO(text), out=out, err=err)
+        interpreter.compile()
+    except SystemExit:
+        return ('abort', err.getvalue().strip())
+    except Exception as e:
+        return ('raise', type(e).__name__)
+    result = out.getvalue().split("\n")[-2]
+    return ('value', int(result.split(':')[1]))
+
+def run_compiler(text):
+    err = io.StringIO()
+    try:
+        compiler.init(inp=io.StringIO('z' + text), err=err)
+        fn = compiler.compile_function({}, backend=Compiler_backend)
+        return ('value', fn())
+    except SystemExit:
+        return ('abort', err.getvalue().strip())
+    except Exception as e:
+        return ('raise', type(e).__name__)
+
+Variants = [
+    ('ch02.expr2', run_interpreter),
+    ('ch04.expr2', run_compiler),
+]
+""" (name, runner) pairs compared against each other.  """
+
+def outcomes(text):
+    """
+    Run `text` through every variant. Return a list of (name, outcome).
+    """
+    return [(name, runner(text)) for name, runner in Variants]
+
+def disagrees(text):
+    """
+    Return True if the variants do not all produce the same outcome.
+    """
+    results = set(outcome for name, outcome in outcomes(text))
+    return len(results) > 1
+
+##### Driving
+
+def fuzz_batch(args):
+    """
+    Generate and check `count` programs from random `seed`. Return a list
+    of shrunk source texts on which the variants disagree.
+    """
+    seed, count, depth = args
+    rng = random.Random(seed)
+    found = []
+    for i in range(count):
+        expr = gen_expression(rng, depth)
+        if disagrees(to_text(expr)):
+            expr = shrink(expr, lambda e: disagrees(to_text(e)))
+            found.append(to_text(expr))
+    return found
+
+def save(corpus, text):
+    """
+    Save a failing program in the corpus directory, named by its hash.
+    Return the path of the file.
+    """
+    if not os.path.isdir(corpus):
+        os.makedirs(corpus)
+    name = hashlib.sha1(text.encode('utf8')).hexdigest()[:16] + '.txt'
+    path = os.path.join(corpus, name)
+    with open(path, 'w') as f:
+        f.write(text + "\n")
+    return path
+
+def load(corpus):
+    """
+    Return the list of programs saved in the corpus directory.
+    """
+    if not os.path.isdir(corpus):
+        return []
+    programs = []
+    for name in sorted(os.listdir(corpus)):
+        if name.endswith('.txt'):
+            with open(os.path.join(corpus, name)) as f:
+                programs.append(f.read().strip())
+    return programs
+
+def replay(corpus):
+    """
+    Run every saved program again. Return those that still disagree.
+    """
+    return [text for text in load(corpus) if disagrees(text)]
+
+def fuzz(count, jobs=None, seed=None, depth=3, batch=1000):
+    """
+    Check `count` random programs, spread across `jobs` processes (by
+    default, one per CPU). Return a sorted list of distinct shrunk
+    programs on which the variants disagree.
+    """
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    batches = [(seed + i, min(batch, count - i * batch), depth)
+        for i in range((count + batch - 1) // batch)]
+    if jobs == 1:
+        results = map(fuzz_batch, batches)
+        return sorted(set(text for found in results for text in found))
+    pool = multiprocessing.Pool(jobs)
+    try:
+        results = pool.imap_unordered(fuzz_batch, batches)
+        return sorted(set(text for found in results for text in found))
+    finally:
+        pool.close()
+        pool.join()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m fuzz.expr',
+        description="Compare the expression interpreter and compiler on "
+            "random programs.")
+    parser.add_argument('-n', '--count', type=int, default=10000,
+        help="number of programs to generate")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help="worker processes (default: one per CPU)")
+    parser.add_argument('-s', '--seed', type=int, default=None,
+        help="random seed, for repeatable runs")
+    parser.add_argument('-d', '--depth', type=int, default=3,
+        help="maximum nesting of parentheses")
+    parser.add_argument('--corpus', default=Corpus_dir,
+        help="directory of saved mismatches")
+    parser.add_argument('--replay', action='store_true',
+        help="only re-run the programs saved in the corpus")
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        failing = replay(args.corpus)
+    else:
+        failing = fuzz(args.count, jobs=args.jobs, seed=args.seed,
+            depth=args.depth)
+        for text in failing:
+            save(args.corpus, text)
+    for text in failing:
+        print(text)
+        for name, outcome in outcomes(text):
+            print("    %-12s %r" % (name, outcome))
+    return 1 if failing else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# vim: set et fileencoding=utf8 sts=4 sw=4 ts=4
+"""
+    fuzz.tests.expr_tests
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Specifies the behavior of the expression fuzzer.
+
+    :copyright: 2013 by Austin Hastings, see AUTHORS for more details.
+    :license: GPL v3+, see LICENSE for more details.
+"""
+import random
+import unittest
+
+from fuzz import expr as fuzzer
+
+def python_eval(text):
+    try:
+        return ('value', eval(text.replace('/', '//')))
+    except ZeroDivisionError as e:
+        return ('raise', type(e).__name__)
+
+def buggy_eval(text):
+    # Gets subtraction wrong.
+    return python_eval(text.replace('-', '+'))
+
+class TestFuzzer(unittest.TestCase):
+
+    def setUp(self):
+        self.variants = fuzzer.Variants
+
+    def tearDown(self):
+        fuzzer.Variants = self.variants
+
+    def test_generated_programs_parse(self):
+        rng = random.Random(1)
+        for i in range(200):
+            text = fuzzer.to_text(fuzzer.gen_expression(rng, 3))
+            outcome = fuzzer.run_interpreter(text)
+            self.assertNotEqual('abort', outcome[0], text)
+            self.assertEqual(python_eval(text), outcome, text)
+
+    def test_agreement(self):
+        fuzzer.Variants = [('python', python_eval), ('again', python_eval)]
+        self.assertEqual([], fuzzer.fuzz(300, jobs=1, seed=7, batch=100))
+
+    def test_shrink(self):
+        fuzzer.Variants = [('python', python_eval), ('buggy', buggy_eval)]
+        fails = lambda e: fuzzer.disagrees(fuzzer.to_text(e))
+        rng = random.Random(3)
+        shrunk = 0
+        for i in range(100):
+            expr = fuzzer.gen_expression(rng, 3)
+            if not fails(expr):
+                continue
+            smallest = fuzzer.shrink(expr, fails)
+            self.assertTrue(fails(smallest))
+            self.assertLessEqual(len(fuzzer.to_text(smallest)),
+                len(fuzzer.to_text(expr)))
+            for smaller in fuzzer.shrink_expression(smallest):
+                self.assertFalse(fails(smaller))
+            shrunk += 1
+        self.assertTrue(shrunk)
+
+    def test_fuzz_finds_mismatch(self):
+        fuzzer.Variants = [('python', python_eval), ('buggy', buggy_eval)]
+        found = fuzzer.fuzz(300, jobs=1, seed=7, batch=100)
+        self.assertTrue(found)
+        self.assertIn('-1', found)
+
+    def test_variants_agree(self):
+        rng = random.Random(31)
+        texts = [fuzzer.to_text(fuzzer.gen_expression(rng, 3))
+            for i in range(100)]
+        for text in texts:
+            want = python_eval(text)
+            self.assertEqual([(name, want) for name, runner in self.variants],
+                fuzzer.outcomes(text), text)
+
+    def test_corpus(self):
+        self.assertTrue(fuzzer.load(fuzzer.Corpus_dir))
+        self.assertEqual([], fuzzer.replay(fuzzer.Corpus_dir))
+
+if __name__ == '__main__':
+    unittest.main()